@@ -1 +1 @@
-from atomflow.iterator import read
\ No newline at end of file
+from atomflow.iterator import Pipeline, read, read_many
\ No newline at end of file
@@ -58,4 +58,8 @@ ChainAspect = Aspect("chain")  # Chain the atom is part of or associated with
 EntityAspect = Aspect("entity")  # Entity, i.e. distinct chemical species, the atom is a part of
 PolymerAspect = Aspect("polymer")  # Polymer type the atom is part of
 
+# Structure
+ModelAspect = Aspect("model")  # Model, e.g. NMR ensemble member or trajectory frame, the atom belongs to
+StructureAspect = Aspect("structure")  # ID of the structure the atom is stored under, e.g. in an archive
+
 
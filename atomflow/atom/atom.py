@@ -37,6 +37,8 @@ class Atom:
     )
     """
 
+    __slots__ = ("_components",)
+
     def __init__(self, *components: Component | Iterable[Component]):
         self._components: dict[Aspect: list[Component]] = {}
         for c in components:
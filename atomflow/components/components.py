@@ -249,6 +249,18 @@ class InsertionComponent(Component):
         return self._insertion
 
 
+@cache_instances
+@aspects(ModelAspect)
+class ModelComponent(Component):
+
+    def __init__(self, model):
+        self._model = int(model)
+
+    @property
+    def model(self) -> int:
+        return self._model
+
+
 @cache_instances
 @aspects(NameAspect)
 class NameComponent(Component):
@@ -354,6 +366,17 @@ class SectionComponent(Component):
     def section(self) -> str:
         return self._section
 
+@cache_instances
+@aspects(StructureAspect)
+class StructureComponent(Component):
+
+    def __init__(self, structure):
+        self._structure = str(structure)
+
+    @property
+    def structure(self) -> str:
+        return self._structure
+
 @cache_instances
 @aspects(TemperatureFactorAspect)
 class TemperatureFactorComponent(Component):
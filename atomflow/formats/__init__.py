@@ -1,4 +1,10 @@
-from atomflow.formats.format import Format
-from atomflow.formats.pdb import PDBFormat
-from atomflow.formats.fasta import FastaFormat
-from atomflow.formats.cif import CIFFormat
\ No newline at end of file
+from atomflow.formats.format import (Format, FileBatches, FileIndex, FormatWriter, ASPECT_DEFAULTS, BATCH_SIZE,
+                                     WRITE_BUFFER, COMPRESSIONS, PARALLEL_CHUNK, line_ranges, open_file,
+                                     recipe_aspects, select, split_suffix)
+from atomflow.formats.pdb import PDBFormat, PDBIndex
+from atomflow.formats.fasta import FastaFormat, FastaIndex
+from atomflow.formats.cif import CIFFormat, CIFIndex
+from atomflow.formats.afb import AFBFormat
+from atomflow.formats.archive import ArchiveFormat, ArchiveIndex
+from atomflow.formats.bcif import BinaryCIFFormat
+from atomflow.formats.cache import ParseCache
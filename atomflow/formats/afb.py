@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+from array import array
+from collections.abc import Iterable
+import json
+import mmap
+import os
+import struct
+import sys
+from typing import BinaryIO
+
+from atomflow import components
+from atomflow.atom import Atom
+from atomflow.components import Component
+from atomflow.formats import Format, open_file, split_suffix
+from atomflow.table import AtomTable, NumericColumn, StringColumn
+
+MAGIC = b"AFB\x01"
+ALIGNMENT = 8  # Column data starts on multiples of this many bytes
+_PREFIX = struct.Struct("<4sQ")  # Magic bytes and length of the header
+
+
+def _data_start(header_size: int) -> int:
+
+    """Offset of the first column's data, given the length of the header."""
+
+    end = _PREFIX.size + header_size
+    return end + -end % ALIGNMENT
+
+
+class AFBFormat(Format):
+
+    """
+    Binary cache of an AtomTable, which stores each of its columns as a typed array, so that atoms
+    can be loaded again without parsing any text.
+
+    A file starts with the magic bytes b"AFB\\x01" and the length of a JSON header, as a little-endian
+    unsigned 64-bit integer. The header describes each column: its component, the type code, offset
+    and length of its data, and for string columns, the distinct values and components that its
+    codes refer to. Column data follows the header, each array aligned to 8 bytes, with offsets
+    counted from the end of the header. Loading copies each array out of a memory map of the file
+    in one go.
+    """
+
+    recipe = {"and": []}
+
+    extensions = (".afb",)
+
+    @classmethod
+    def read_file(cls, path: str | os.PathLike) -> AtomTable:
+
+        if split_suffix(path)[1]:
+            with open_file(path, "rb") as file:
+                return cls._load(file.read())
+        with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return cls._load(mm)
+
+    @classmethod
+    def to_file(cls, atoms: Iterable[Atom], path: str | os.PathLike) -> None:
+
+        table = atoms if isinstance(atoms, AtomTable) else AtomTable.from_atoms(atoms)
+        with open_file(path, "wb") as file:
+            cls._write(file, table)
+
+    @classmethod
+    def _write(cls, file: BinaryIO, table: AtomTable) -> None:
+
+        """Writes a table to an open file, starting from its current position."""
+
+        header, blobs = cls._dump(table)
+        base = file.tell() + _data_start(len(header))
+        file.write(_PREFIX.pack(MAGIC, len(header)) + header)
+        for offset, blob in blobs:
+            file.write(bytes(base + offset - file.tell()))
+            file.write(blob)
+
+    @classmethod
+    def _dump(cls, table: AtomTable) -> tuple[bytes, list[tuple[int, array | bytearray]]]:
+
+        """Describes the columns of a table in a header, and lays out their data, with offsets counted
+        from the end of the header."""
+
+        columns = {}
+        blobs = []
+        offset = 0
+
+        def place(spec: dict, key: str, blob: array | bytearray) -> None:
+            nonlocal offset
+            offset += -offset % ALIGNMENT
+            nbytes = len(blob) * getattr(blob, "itemsize", 1)
+            spec[key] = [offset, nbytes]
+            blobs.append((offset, blob))
+            offset += nbytes
+
+        for name, column in table.columns.items():
+            spec = columns[name] = {"component": column.component.__name__}
+            if isinstance(column, StringColumn):
+                codes, values, cmps = cls._used_values(column)
+                spec["values"] = values
+                spec["components"] = [cls._describe(cmp) for cmp in cmps]
+                spec["typecode"] = codes.typecode
+                place(spec, "data", codes)
+            else:
+                spec["kind"] = column.kind.__name__
+                spec["typecode"] = column.data.typecode
+                place(spec, "data", column.data)
+                if column.mask is not None:
+                    place(spec, "mask", column.mask)
+
+        header = {"length": len(table), "byteorder": sys.byteorder, "columns": columns}
+        return json.dumps(header).encode(), blobs
+
+    @staticmethod
+    def _used_values(column: StringColumn) -> tuple[array, list, list]:
+
+        """
+        Codes, values and components of a string column, without any values no row uses, which
+        columns taken from a larger table can hold many of.
+
+        >>> from atomflow.components import ChainComponent
+        >>> col = StringColumn(ChainComponent)
+        >>> col.extend(["A", "B", "C"])
+        >>> codes, values, _ = AFBFormat._used_values(col.take([2]))
+        >>> assert list(codes) == [1] and values == [None, "C"]
+        """
+
+        used = sorted(set(column.codes) | {0})
+        if len(used) == len(column.values):
+            return column.codes, column.values, column.components
+        recode = [0] * len(column.values)
+        for new, old in enumerate(used):
+            recode[old] = new
+        codes = array(column.codes.typecode, map(recode.__getitem__, column.codes))
+        return codes, [column.values[i] for i in used], [column.components[i] for i in used]
+
+    @staticmethod
+    def _describe(cmp: Component | None) -> list | None:
+
+        """Class name of a component, with the value it's built from, i.e. that of its first aspect."""
+
+        if cmp is None:
+            return None
+        return [type(cmp).__name__, getattr(cmp, cmp.aspects[0].name)]
+
+    @staticmethod
+    def _component_type(name: str) -> type[Component]:
+        cmp_type = getattr(components, name, None)
+        if not (isinstance(cmp_type, type) and issubclass(cmp_type, Component)):
+            raise ValueError(f"Unknown component '{name}' in .afb file")
+        return cmp_type
+
+    @classmethod
+    def _load(cls, data: bytes | mmap.mmap) -> AtomTable:
+
+        magic, header_size = _PREFIX.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not an .afb file, or written by an unsupported version")
+        header = json.loads(bytes(data[_PREFIX.size:_PREFIX.size + header_size]))
+        base = _data_start(header_size)
+        swap = header["byteorder"] != sys.byteorder
+
+        def read_bytes(span: list[int]) -> bytes:
+            start, nbytes = span
+            return data[base + start:base + start + nbytes]
+
+        def read_array(typecode: str, span: list[int]) -> array:
+            values = array(typecode)
+            values.frombytes(read_bytes(span))
+            if swap:
+                values.byteswap()
+            return values
+
+        columns = {}
+        for name, spec in header["columns"].items():
+            cmp_type = cls._component_type(spec["component"])
+            values = read_array(spec["typecode"], spec["data"])
+            if "values" in spec:
+                cmps = [None if c is None else cls._component_type(c[0])(c[1]) for c in spec["components"]]
+                columns[name] = StringColumn(cmp_type, values, spec["values"], cmps)
+            else:
+                mask = bytearray(read_bytes(spec["mask"])) if "mask" in spec else None
+                kind = {"int": int, "float": float}[spec["kind"]]
+                columns[name] = NumericColumn(cmp_type, kind, values, mask)
+        return AtomTable(columns, header["length"])
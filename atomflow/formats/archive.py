@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+from array import array
+from collections.abc import Collection, Iterable, Iterator, Sequence
+from itertools import groupby
+import io
+import mmap
+import os
+import struct
+from typing import BinaryIO
+
+from atomflow.aspects import StructureAspect
+from atomflow.atom import Atom
+from atomflow.components import StructureComponent
+from atomflow.formats import Format, FileBatches, FileIndex, FormatWriter, BATCH_SIZE, split_suffix
+from atomflow.formats.afb import AFBFormat
+from atomflow.table import AtomTable, StringColumn
+
+ENTRY_MAGIC = b"AFE\x01"
+# Magic bytes, then the lengths of the entry's ID and of its data, in front of every entry
+_ENTRY_HEADER = struct.Struct("<4sIQ")
+
+
+class ArchiveFormat(Format):
+
+    """
+    Archive of many structures in one file, each stored in .afb form under an ID. Entries are laid
+    end to end, each behind a short header giving the length of its ID and data, so new entries can
+    be appended without touching the rest of the file. An ArchiveIndex of where each entry lies lets
+    any one of them be read with a slice of a memory map of the file.
+
+    Atoms read from an archive carry the ID of their entry as their structure aspect, and atoms
+    written to one are stored under theirs. Where an ID appears more than once, the last entry with
+    it is the one that's read.
+    """
+
+    recipe = {"and": [StructureAspect]}
+
+    extensions = (".afa",)
+
+    @classmethod
+    def read_file(cls, path: str | os.PathLike) -> AtomTable:
+
+        return AtomTable.concat(cls.read_iter(path))
+
+    @classmethod
+    def read_iter(cls, path: str | os.PathLike, batch_size: int = BATCH_SIZE,
+                  where: Sequence[tuple[str, Collection, bool]] = (),
+                  aspects: Collection[str] | None = None) -> Iterator[AtomTable]:
+
+        """Read the entries of an archive one at a time, in the order they were added."""
+
+        index = ArchiveIndex.for_file(cls._check_path(path), cache=True)
+        file = open(path, "rb")
+        return FileBatches(file, cls._read_entries(file, index, list(index.entries)))
+
+    @classmethod
+    def read_records(cls, path: str | os.PathLike, records: Iterable[str]) -> Iterator[AtomTable]:
+
+        """Read only the entries with the given IDs, one table each."""
+
+        index = ArchiveIndex.for_file(cls._check_path(path), cache=True)
+        records = list(records)
+        if missing := [r for r in records if r not in index.entries]:
+            raise ValueError(f"No entries with IDs {', '.join(map(repr, missing))} in {path}")
+        file = open(path, "rb")
+        return FileBatches(file, cls._read_entries(file, index, records))
+
+    @classmethod
+    def _read_entries(cls, file: BinaryIO, index: ArchiveIndex, ids: Sequence[str]) -> Iterator[AtomTable]:
+        with file:
+            if not ids:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for entry_id in ids:
+                    start, end = index.entries[entry_id]
+                    yield cls._tag(AFBFormat._load(mm[start:end]), entry_id)
+
+    @staticmethod
+    def _tag(table: AtomTable, entry_id: str) -> AtomTable:
+
+        """Add the ID of an entry to its atoms, as a column holding the one value."""
+
+        column = StringColumn(StructureComponent, array("I", [1]) * len(table),
+                              [None, entry_id], [None, StructureComponent(entry_id)])
+        return AtomTable({**table.columns, StructureAspect.name: column}, len(table))
+
+    @staticmethod
+    def _check_path(path: str | os.PathLike) -> str | os.PathLike:
+        if split_suffix(path)[1]:
+            raise ValueError(f"Archive {path} cannot be compressed")
+        return path
+
+    @classmethod
+    def to_file(cls, atoms: Iterable[Atom], path: str | os.PathLike) -> None:
+
+        with cls.writer(path) as writer:
+            writer.write(atoms)
+
+    @classmethod
+    def writer(cls, path: str | os.PathLike, append: bool = False) -> ArchiveWriter:
+
+        return ArchiveWriter(cls._check_path(path), append)
+
+
+class ArchiveIndex(FileIndex):
+
+    """
+    Byte range of the data of each entry in an archive, keyed by ID, found by stepping from the header
+    of each entry to the next, without reading the entries themselves.
+    """
+
+    def __init__(self, entries: dict[str, tuple[int, int]], size: int = 0, mtime_ns: int = 0):
+        super().__init__(size, mtime_ns)
+        self.entries = entries
+
+    @classmethod
+    def build(cls, path: str | os.PathLike) -> ArchiveIndex:
+
+        entries = {}
+        size, mtime_ns = cls._stamp(path)
+        if not size:
+            return cls(entries, size, mtime_ns)
+
+        with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offset = 0
+            while offset < size:
+                if offset + _ENTRY_HEADER.size > size:
+                    raise ValueError(f"Archive {path} ends part way through an entry")
+                magic, id_size, data_size = _ENTRY_HEADER.unpack_from(mm, offset)
+                if magic != ENTRY_MAGIC:
+                    raise ValueError(f"No archive entry found at byte {offset} of {path}")
+                start = offset + _ENTRY_HEADER.size + id_size
+                end = start + data_size
+                if end > size:
+                    raise ValueError(f"Archive {path} ends part way through an entry")
+                entry_id = mm[offset + _ENTRY_HEADER.size:start].decode()
+                # Replacing an entry moves it to the end, where the newest one is
+                entries.pop(entry_id, None)
+                entries[entry_id] = (start, end)
+                offset = end
+
+        return cls(entries, size, mtime_ns)
+
+    def _dump(self) -> dict:
+        ids = list(self.entries)
+        starts, ends = zip(*self.entries.values()) if ids else ((), ())
+        return {"ids": ids, "starts": list(starts), "ends": list(ends)}
+
+    @classmethod
+    def _restore(cls, data: dict, size: int, mtime_ns: int) -> ArchiveIndex:
+        return cls(dict(zip(data["ids"], zip(data["starts"], data["ends"]))), size, mtime_ns)
+
+
+class ArchiveWriter(FormatWriter):
+
+    """
+    Writes entries to an archive. Atoms passed to write() are stored under the ID in their structure
+    aspect, a new entry starting whenever it changes, while add() stores atoms under a given ID.
+    If the writer is aborted while appending, the archive is cut back to the entries it had before.
+    """
+
+    def __init__(self, path: str | os.PathLike, append: bool = False):
+        super().__init__(path, append)
+        self._entry_id = None
+        self._pending = []
+        self._initial_size = 0
+
+    def add(self, entry_id: str, atoms: Iterable[Atom]) -> None:
+
+        """Store atoms in the archive under the given ID."""
+
+        if self._closed:
+            raise ValueError("Cannot write to a closed writer")
+        self._flush()
+        self._write_entry(entry_id, atoms)
+
+    def _write_entry(self, entry_id: str, atoms: Iterable[Atom]) -> None:
+        table = atoms if isinstance(atoms, AtomTable) else AtomTable.from_atoms(atoms)
+        columns = {k: v for k, v in table.columns.items() if k != StructureAspect.name}
+
+        buffer = io.BytesIO()
+        AFBFormat._write(buffer, AtomTable(columns, len(table)))
+        encoded = str(entry_id).encode()
+        data = buffer.getbuffer()
+        file = self._open()
+        file.write(_ENTRY_HEADER.pack(ENTRY_MAGIC, len(encoded), len(data)) + encoded)
+        file.write(data)
+
+    def _write_batch(self, atoms: Sequence[Atom]) -> None:
+        for entry_id, run in groupby(atoms, key=lambda atom: atom.structure if atom.implements(StructureAspect) else None):
+            if entry_id is None:
+                raise ValueError("Atoms written to an archive need a structure ID")
+            if entry_id != self._entry_id:
+                self._flush()
+                self._entry_id = entry_id
+            self._pending.extend(run)
+
+    def _flush(self) -> None:
+
+        """Write out the atoms gathered for the current entry."""
+
+        if self._pending:
+            entry_id, atoms = self._entry_id, self._pending
+            self._entry_id, self._pending = None, []
+            self._write_entry(entry_id, atoms)
+
+    def _finish(self) -> None:
+        self._flush()
+
+    def abort(self) -> None:
+        super().abort()
+        if self._append and self._file is not None:
+            os.truncate(self.path, self._initial_size)
+
+    def _open(self) -> BinaryIO:
+        if self._file is None:
+            self._initial_size = os.path.getsize(self.path) if self._append and os.path.exists(self.path) else 0
+            self._file = open(self.path, "ab" if self._append else "wb")
+        return self._file
@@ -0,0 +1,382 @@
+from __future__ import annotations
+
+from array import array
+from collections.abc import Iterable, Sequence
+from itertools import accumulate, chain, repeat
+from operator import truediv
+import os
+import pathlib
+import struct
+import sys
+
+from atomflow.atom import Atom
+from atomflow.formats import Format, open_file, split_suffix
+from atomflow.formats.cif import CIFFormat, MISSING_VALUES
+from atomflow.table import AtomTable
+
+# Type codes of BinaryCIF byte arrays, as stored, and as array type codes
+_BYTE_TYPES = {1: "b", 2: "h", 3: "i", 4: "B", 5: "H", 6: "I", 32: "f", 33: "d"}
+_TYPE_CODES = {code: kind for kind, code in _BYTE_TYPES.items()}
+# Values marked by a column's mask, by mask value
+_MASK_VALUES = {1: ".", 2: "?"}
+
+
+def _unpack(data: bytes) -> object:
+
+    """
+    Decode MessagePack data into Python objects. Maps become dicts, arrays lists, and binary data bytes.
+
+    >>> assert _unpack(_pack({"a": [1, -2, 3.5, None, b"x"]})) == {"a": [1, -2, 3.5, None, b"x"]}
+    """
+
+    view = memoryview(data)
+    pos = 0
+
+    def take(size: int) -> memoryview:
+        nonlocal pos
+        pos += size
+        return view[pos - size:pos]
+
+    def number(fmt: str) -> int | float:
+        return struct.unpack(fmt, take(struct.calcsize(fmt)))[0]
+
+    def read() -> object:
+        byte = take(1)[0]
+        if byte <= 0x7f:
+            return byte
+        if byte >= 0xe0:
+            return byte - 0x100
+        if 0xa0 <= byte <= 0xbf:
+            return str(take(byte & 0x1f), "utf-8")
+        if 0x90 <= byte <= 0x9f:
+            return [read() for _ in range(byte & 0x0f)]
+        if 0x80 <= byte <= 0x8f:
+            return {read(): read() for _ in range(byte & 0x0f)}
+        match byte:
+            case 0xc0:
+                return None
+            case 0xc2:
+                return False
+            case 0xc3:
+                return True
+            case 0xc4 | 0xc5 | 0xc6:
+                return bytes(take(number((">B", ">H", ">I")[byte - 0xc4])))
+            case 0xca | 0xcb:
+                return number(">f" if byte == 0xca else ">d")
+            case 0xcc | 0xcd | 0xce | 0xcf:
+                return number((">B", ">H", ">I", ">Q")[byte - 0xcc])
+            case 0xd0 | 0xd1 | 0xd2 | 0xd3:
+                return number((">b", ">h", ">i", ">q")[byte - 0xd0])
+            case 0xd9 | 0xda | 0xdb:
+                return str(take(number((">B", ">H", ">I")[byte - 0xd9])), "utf-8")
+            case 0xdc | 0xdd:
+                return [read() for _ in range(number(">H" if byte == 0xdc else ">I"))]
+            case 0xde | 0xdf:
+                return {read(): read() for _ in range(number(">H" if byte == 0xde else ">I"))}
+        raise ValueError(f"Unsupported MessagePack type 0x{byte:02x}")
+
+    return read()
+
+
+def _pack(obj: object) -> bytes:
+
+    """Encode Python objects as MessagePack, the reverse of _unpack()."""
+
+    out = bytearray()
+
+    def sized(size: int, fixed: tuple[int, int] | None, codes: tuple[int, int, int]) -> None:
+        # Short strings, arrays and maps have their size in the type byte itself
+        if fixed is not None and size < fixed[1]:
+            out.append(fixed[0] | size)
+        elif size < 0x100 and codes[0]:
+            out.extend(struct.pack(">BB", codes[0], size))
+        elif size < 0x10000:
+            out.extend(struct.pack(">BH", codes[1], size))
+        else:
+            out.extend(struct.pack(">BI", codes[2], size))
+
+    def write(value: object) -> None:
+        if value is None:
+            out.append(0xc0)
+        elif value is True or value is False:
+            out.append(0xc3 if value else 0xc2)
+        elif isinstance(value, int):
+            if -32 <= value <= 0x7f:
+                out.extend(struct.pack(">b" if value < 0 else ">B", value))
+            elif value >= 0:
+                out.extend(struct.pack(">BQ", 0xcf, value) if value >> 32 else struct.pack(">BI", 0xce, value))
+            else:
+                out.extend(struct.pack(">Bq", 0xd3, value) if value < -2 ** 31 else struct.pack(">Bi", 0xd2, value))
+        elif isinstance(value, float):
+            out.extend(struct.pack(">Bd", 0xcb, value))
+        elif isinstance(value, str):
+            encoded = value.encode()
+            sized(len(encoded), (0xa0, 32), (0xd9, 0xda, 0xdb))
+            out.extend(encoded)
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            sized(len(value), None, (0xc4, 0xc5, 0xc6))
+            out.extend(value)
+        elif isinstance(value, (list, tuple)):
+            sized(len(value), (0x90, 16), (0, 0xdc, 0xdd))
+            for item in value:
+                write(item)
+        elif isinstance(value, dict):
+            sized(len(value), (0x80, 16), (0, 0xde, 0xdf))
+            for key, item in value.items():
+                write(key)
+                write(item)
+        else:
+            raise TypeError(f"Cannot encode {type(value).__name__} as MessagePack")
+
+    write(obj)
+    return bytes(out)
+
+
+def _decode(data: bytes | Sequence, encodings: list[dict]) -> Sequence:
+
+    """
+    Reverse the encodings of a BinaryCIF column, from last to first, giving its values.
+
+    >>> data, encodings = _encode_ints([5, 6, 7, 8, 20])
+    >>> assert list(_decode(data, encodings)) == [5, 6, 7, 8, 20]
+    """
+
+    for enc in reversed(encodings):
+        match enc["kind"]:
+            case "ByteArray":
+                values = array(_BYTE_TYPES[enc["type"]])
+                values.frombytes(data)
+                if sys.byteorder == "big":
+                    values.byteswap()
+                data = values
+            case "FixedPoint":
+                data = array("d", map(truediv, data, repeat(float(enc["factor"]))))
+            case "IntervalQuantization":
+                low, step = enc["min"], (enc["max"] - enc["min"]) / (enc["numSteps"] - 1)
+                data = array("d", (low + step * v for v in data))
+            case "RunLength":
+                data = array("i", chain.from_iterable(map(repeat, data[::2], data[1::2])))
+            case "Delta":
+                data = array("i", accumulate(data, initial=enc["origin"]))[1:]
+            case "IntegerPacking":
+                data = _unpack_integers(data, enc["byteCount"], enc["isUnsigned"])
+            case "StringArray":
+                strings, offsets = enc["stringData"], _decode(enc["offsets"], enc["offsetEncoding"])
+                # Index -1, for missing values, picks out the None at the end
+                table = [strings[start:end] for start, end in zip(offsets, offsets[1:])] + [None]
+                data = list(map(table.__getitem__, _decode(data, enc["dataEncoding"])))
+            case kind:
+                raise ValueError(f"Unsupported BinaryCIF encoding '{kind}'")
+    return data
+
+
+def _unpack_integers(data: Sequence[int], byte_count: int, unsigned: bool) -> array:
+
+    """Undo integer packing, where values beyond the range of the packed type are split into a sum
+    of its limits followed by the remainder."""
+
+    lower, upper = _packing_limits(byte_count, unsigned)
+    if upper not in data and (unsigned or lower not in data):
+        return array("i", data)
+    out = array("i")
+    total = 0
+    for value in data:
+        total += value
+        if value != upper and (unsigned or value != lower):
+            out.append(total)
+            total = 0
+    return out
+
+
+def _pack_integers(values: Sequence[int]) -> tuple[bytes, list[dict]]:
+
+    """Pack integers into 8 or 16-bit values, splitting any beyond that range into a run of the
+    type's limit and a remainder, or store them as 32-bit values where that's smaller."""
+
+    unsigned = min(values, default=0) >= 0
+    limits = {byte_count: _packing_limits(byte_count, unsigned) for byte_count in (1, 2)}
+    sizes = {
+        byte_count: byte_count * sum(v // upper + 1 if v >= 0 else v // lower + 1 for v in values)
+        for byte_count, (lower, upper) in limits.items()
+    }
+    byte_count = min(sizes, key=sizes.get)
+    if sizes[byte_count] >= 4 * len(values):
+        code = "I" if unsigned else "i"
+        return _to_bytes(array(code, values)), [{"kind": "ByteArray", "type": _TYPE_CODES[code]}]
+
+    lower, upper = limits[byte_count]
+    packed = []
+    for value in values:
+        count, rest = divmod(value, upper if value >= 0 else lower)
+        packed += [upper if value >= 0 else lower] * count
+        packed.append(rest)
+
+    code = ("B" if unsigned else "b") if byte_count == 1 else ("H" if unsigned else "h")
+    return _to_bytes(array(code, packed)), [
+        {"kind": "IntegerPacking", "byteCount": byte_count, "isUnsigned": unsigned, "srcSize": len(values)},
+        {"kind": "ByteArray", "type": _TYPE_CODES[code]},
+    ]
+
+
+def _packing_limits(byte_count: int, unsigned: bool) -> tuple[int, int]:
+
+    """
+    Lowest and highest values of packed integers, which mark that the value continues.
+
+    >>> _packing_limits(1, False)
+    (-128, 127)
+    """
+
+    upper = (1 << 8 * byte_count - (not unsigned)) - 1
+    return (0 if unsigned else -upper - 1), upper
+
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _encode_ints(values: Sequence[int]) -> tuple[bytes, list[dict]]:
+
+    """Encode integers as the differences between them, run-length encoded and packed, which suits
+    the counting sequences common in _atom_site."""
+
+    origin = values[0] if values else 0
+    deltas = [b - a for a, b in zip(chain([origin], values), values)]
+    runs = []
+    for value in deltas:
+        if runs and runs[-2] == value:
+            runs[-1] += 1
+        else:
+            runs += [value, 1]
+    data, encodings = _pack_integers(runs)
+    return data, [
+        {"kind": "Delta", "origin": origin, "srcType": _TYPE_CODES["i"]},
+        {"kind": "RunLength", "srcType": _TYPE_CODES["i"], "srcSize": len(deltas)},
+        *encodings,
+    ]
+
+
+def _encode_floats(values: Sequence[float], factor: int) -> tuple[bytes, list[dict]]:
+
+    """Encode floats as fixed-point integers with the given number of steps per unit."""
+
+    ints = [round(v * factor) for v in values]
+    origin = ints[0] if ints else 0
+    data, encodings = _pack_integers([b - a for a, b in zip(chain([origin], ints), ints)])
+    return data, [
+        {"kind": "FixedPoint", "factor": factor, "srcType": _TYPE_CODES["d"]},
+        {"kind": "Delta", "origin": origin, "srcType": _TYPE_CODES["i"]},
+        *encodings,
+    ]
+
+
+def _encode_strings(values: Sequence[str | None]) -> tuple[bytes, list[dict]]:
+
+    """Encode strings as indices into the distinct values, which are stored end to end."""
+
+    distinct = {}
+    indices = [-1 if v is None else distinct.setdefault(v, len(distinct)) for v in values]
+    offsets = list(accumulate(map(len, distinct), initial=0))
+    data, data_encodings = _pack_integers(indices)
+    offset_data, offset_encodings = _pack_integers(offsets)
+    return data, [{
+        "kind": "StringArray",
+        "dataEncoding": data_encodings,
+        "stringData": "".join(distinct),
+        "offsetEncoding": offset_encodings,
+        "offsets": offset_data,
+    }]
+
+
+class BinaryCIFFormat(Format):
+
+    """
+    BinaryCIF, the MessagePack-based binary form of mmCIF. The _atom_site table of each data block is
+    decoded a column at a time, into the same atoms as CIFFormat reads from text. Other categories
+    are skipped.
+
+    Written columns are encoded by type: integers as run-length encoded differences, coordinates and
+    other decimals as fixed-point integers with the precision CIFFormat writes them with, and
+    everything else as string arrays.
+    """
+
+    recipe = CIFFormat.recipe
+
+    extensions = (".bcif",)
+
+    # Numbers of steps per unit of fixed-point columns, matching the decimal places written to text
+    _fixed_point = {"Cartn_x": 1000, "Cartn_y": 1000, "Cartn_z": 1000, "occupancy": 100, "B_iso_or_equiv": 100}
+    _integer_fields = frozenset(("id", "label_seq_id"))
+
+    @classmethod
+    def read_file(cls, path: str | os.PathLike) -> AtomTable:
+
+        with open_file(path, "rb") as file:
+            content = _unpack(file.read())
+
+        data = {}
+        for block in content["dataBlocks"]:
+            for category in block["categories"]:
+                if category["name"].lstrip("_") == "atom_site":
+                    data[block["header"]] = {"_atom_site": cls._decode_category(category)}
+        return CIFFormat._atoms_from_dict(data)
+
+    @staticmethod
+    def _decode_category(category: dict) -> dict[str, Sequence]:
+
+        """Decode the columns of a category, with masked values as the CIF symbols they stand for."""
+
+        fields = {}
+        for column in category["columns"]:
+            values = _decode(column["data"]["data"], column["data"]["encoding"])
+            if column.get("mask"):
+                mask = _decode(column["mask"]["data"], column["mask"]["encoding"])
+                values = [_MASK_VALUES.get(m, v) for v, m in zip(values, mask)]
+            elif isinstance(values, list) and None in values:
+                values = ["?" if v is None else v for v in values]
+            fields[column["name"]] = values
+        return fields
+
+    @classmethod
+    def to_file(cls, atoms: Iterable[Atom], path: str | os.PathLike) -> None:
+
+        fields = CIFFormat._atoms_to_dict(atoms)["_atom_site"]
+        columns = [cls._encode_column(name, values) for name, values in fields.items()]
+        row_count = len(next(iter(fields.values()), []))
+
+        path = pathlib.Path(path)
+        header = path.name[:-len("".join(split_suffix(path)))]
+        content = {
+            "version": "0.3.0",
+            "encoder": "atomflow",
+            "dataBlocks": [{
+                "header": header,
+                "categories": [{"name": "_atom_site", "columns": columns, "rowCount": row_count}],
+            }],
+        }
+        with open_file(path, "wb") as file:
+            file.write(_pack(content))
+
+    @classmethod
+    def _encode_column(cls, name: str, values: list[str]) -> dict:
+
+        """Encode a column of values as written to text CIF, with missing values marked in a mask."""
+
+        mask = [2 if v in MISSING_VALUES else 0 for v in values]
+        present = [v for v, m in zip(values, mask) if not m]
+        if name in cls._fixed_point:
+            data = _encode_floats([float(v) if not m else 0.0 for v, m in zip(values, mask)], cls._fixed_point[name])
+        elif name in cls._integer_fields and all(v.lstrip("-").isdigit() for v in present):
+            data = _encode_ints([int(v) if not m else 0 for v, m in zip(values, mask)])
+        else:
+            data = _encode_strings([None if m else v for v, m in zip(values, mask)])
+            mask = [0] * len(values) if any(mask) else mask
+
+        column = {"name": name, "data": {"data": data[0], "encoding": data[1]}, "mask": None}
+        if any(mask):
+            mask_data, mask_encodings = _pack_integers(mask)
+            column["mask"] = {"data": mask_data, "encoding": mask_encodings}
+        return column
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import pathlib
+import tempfile
+import threading
+
+from atomflow.formats.afb import AFBFormat
+from atomflow.formats.format import Format, split_suffix
+from atomflow.table import AtomTable
+
+PARSE_CACHE_BYTES = 2 ** 30  # Default budget of a ParseCache's in-memory tier
+_HASH_CHUNK = 2 ** 20
+
+
+class ParseCache:
+
+    """
+    Cache of parsed files, so that files read over and over are only parsed once. Parsed tables
+    are kept in memory up to a budget of max_bytes of column data, with the least recently used
+    dropped first to make room. Given a folder, tables are also saved there in .afb form, which
+    is loaded instead of parsing the file again once a table has left memory, including from
+    another process.
+
+    Files are recognised by their path, size and modification time, or, with by_content=True, by a
+    hash of their contents, so that copies of a file at different paths share an entry.
+
+    Tables are shared between everyone that reads the same file from a cache, so shouldn't be
+    extended in place.
+    >>> cache = ParseCache(max_bytes=2 ** 20)
+    >>> assert cache.stats()["hits"] == 0 and len(cache) == 0
+    """
+
+    def __init__(self, max_bytes: int = PARSE_CACHE_BYTES, folder: str | os.PathLike | None = None,
+                 by_content: bool = False):
+        self.max_bytes = max_bytes
+        self.folder = None if folder is None else pathlib.Path(folder)
+        self.by_content = by_content
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries: dict[tuple, tuple[tuple, AtomTable]] = {}
+        self._lock = threading.Lock()
+        if self.folder is not None:
+            self.folder.mkdir(parents=True, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def read(self, path: str | os.PathLike) -> AtomTable:
+
+        """Read a file through the cache, in the format given by its suffix."""
+
+        key, stamp = self._key(path)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                if entry[0] == stamp:
+                    self._entries[key] = entry
+                    self.hits += 1
+                    return entry[1]
+                # The file has changed since it was cached
+                self.nbytes -= entry[1].nbytes
+
+        saved = None if self.folder is None else self.folder / f"{self._digest(key, stamp)}.afb"
+        table = self._load(saved)
+        with self._lock:
+            if table is not None:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+        if table is None:
+            fmt = Format.get_format("".join(split_suffix(path)))
+            parsed = fmt.read_file(path)
+            table = parsed if isinstance(parsed, AtomTable) else AtomTable.from_atoms(parsed)
+            if saved is not None:
+                self._save(table, saved)
+
+        self._keep(key, stamp, table)
+        return table
+
+    def _key(self, path: str | os.PathLike) -> tuple[tuple, tuple]:
+
+        """Key of a file's entry, and the stamp that tells whether the entry is still up to date."""
+
+        suffix = "".join(split_suffix(path))
+        if not self.by_content:
+            stat = os.stat(path)
+            return (suffix, os.path.abspath(path)), (stat.st_size, stat.st_mtime_ns)
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            while chunk := file.read(_HASH_CHUNK):
+                digest.update(chunk)
+        return (suffix, digest.hexdigest()), ()
+
+    @staticmethod
+    def _digest(key: tuple, stamp: tuple) -> str:
+        return hashlib.sha256(repr((key, stamp)).encode()).hexdigest()
+
+    @staticmethod
+    def _load(saved: pathlib.Path | None) -> AtomTable | None:
+        if saved is None or not saved.exists():
+            return None
+        try:
+            return AFBFormat.read_file(saved)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, table: AtomTable, saved: pathlib.Path) -> None:
+
+        """Save a table to the on-disk tier, through a temporary file so that it never appears part written."""
+
+        fd, temp = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                AFBFormat._write(file, table)
+            os.replace(temp, saved)
+        except BaseException:
+            os.remove(temp)
+            raise
+
+    def _keep(self, key: tuple, stamp: tuple, table: AtomTable) -> None:
+
+        """Hold a table in memory, dropping the least recently used tables to keep within budget."""
+
+        size = table.nbytes
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if (old := self._entries.pop(key, None)) is not None:
+                self.nbytes -= old[1].nbytes
+            while self._entries and self.nbytes + size > self.max_bytes:
+                _, dropped = self._entries.pop(next(iter(self._entries)))
+                self.nbytes -= dropped.nbytes
+                self.evictions += 1
+            self._entries[key] = (stamp, table)
+            self.nbytes += size
+
+    def clear(self) -> None:
+
+        """Drop all tables held in memory. Tables saved to the folder are kept."""
+
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self) -> dict[str, int]:
+
+        """Counts of reads served from memory and from disk, reads that had to parse the file,
+        and tables evicted from memory, along with current memory use."""
+
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "nbytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+        }
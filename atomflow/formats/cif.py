@@ -1,15 +1,29 @@
+from __future__ import annotations
+
 import pathlib
+import re
 from collections import defaultdict
+from collections.abc import Collection, Iterable, Iterator, Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, compress, count, repeat
+import mmap
 import os
-from typing import Iterable
+from typing import TextIO
 
 from atomflow.components import *
 from atomflow.atom import Atom
-from atomflow.formats import Format
+from atomflow.formats import (Format, FileBatches, FileIndex, FormatWriter, BATCH_SIZE, PARALLEL_CHUNK, WRITE_BUFFER,
+                              line_ranges, open_file, recipe_aspects, split_suffix)
+from atomflow.table import AtomTable
 from atomflow.knowledge import AA_RES_TO_SYM
 
 COLUMN_PADDING = 1
 WRAP_AT = 80
+MISSING_VALUES = frozenset(("", "?", ".", "?."))
+
+# A quoted value only ends at a matching quote followed by whitespace, so it may contain the other
+# kind of quote, or its own kind followed by anything else. Unquoted values run up to whitespace.
+_TOKEN_PATTERN = re.compile(r"""'(.*?)'(?=[ \t]|$)|"(.*?)"(?=[ \t]|$)|([^ \t]+)""")
 
 class CIFFormat(Format):
 
@@ -77,37 +91,112 @@ class CIFFormat(Format):
     }
 
     @classmethod
-    def read_file(cls, path: str | os.PathLike) -> list[Atom]:
-        data = cls._extract_data(path, categories=("_atom_site",))
-        return cls._atoms_from_dict(data)
+    def written_aspects(cls) -> set[str]:
+        return recipe_aspects(cls.recipe) | {aspect.name for aspect in cls._asp_map.values()}
+
+    @classmethod
+    def read_file(cls, path: str | os.PathLike) -> AtomTable:
+        return AtomTable.concat(cls.read_iter(path))
+
+    @classmethod
+    def read_iter(cls, path: str | os.PathLike, batch_size: int = BATCH_SIZE,
+                  where: Sequence[tuple[str, Collection, bool]] = (),
+                  aspects: Collection[str] | None = None) -> Iterator[AtomTable]:
+        file = open_file(path, "r")
+        return FileBatches(file, cls._read_batches(file, batch_size, where, aspects))
+
+    @classmethod
+    def read_parallel(cls, path: str | os.PathLike, workers: int | None = None) -> AtomTable:
+
+        """
+        Read a file in full, with parsing split between a pool of worker processes. The rows of each
+        _atom_site table, found with a CIFIndex, are cut into ranges of whole lines, which workers parse
+        into tables that are joined in order. If a row or text block turns out to run across the end of
+        a range, the file is read again in this process instead, as are compressed files.
+        """
+
+        if split_suffix(path)[1] or workers == 1 or (tasks := cls._row_ranges(path, workers)) is None:
+            return cls.read_file(path)
+        with ProcessPoolExecutor(workers) as pool:
+            tables = list(pool.map(cls._parse_rows, repeat(path), *zip(*tasks)))
+        if None in tables:
+            return cls.read_file(path)
+        return AtomTable.concat(tables)
+
+    @classmethod
+    def _row_ranges(cls, path: str | os.PathLike, workers: int | None) -> list[tuple[list[str], tuple[int, int]]] | None:
+
+        """Fields of the _atom_site table of each block, paired with ranges of lines covering its rows,
+        or None where a block's atoms aren't laid out as a single table."""
+
+        index = CIFIndex.for_file(path)
+        if not index.blocks:
+            return None
+        prefix = b"_atom_site."
+        tasks = []
+        with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for categories in index.blocks.values():
+                if "_atom_site" not in categories:
+                    continue
+                if len(categories["_atom_site"]) != 1:
+                    return None
+                start, end = categories["_atom_site"][0]
+                if not mm[start:end].startswith(b"loop_"):
+                    return None
+                # The table's fields are declared one per line, after 'loop_'
+                fields = []
+                start = mm.find(b"\n", start, end) + 1 or end
+                while mm[start:start + len(prefix)] == prefix:
+                    stop = mm.find(b"\n", start, end) + 1 or end
+                    fields.append(mm[start + len(prefix):stop].split()[0].decode())
+                    start = stop
+                size = max(1, min(PARALLEL_CHUNK, -(-(end - start) // (workers or os.cpu_count() or 1))))
+                tasks += [(fields, span) for span in line_ranges(mm, start, end, size)]
+        return tasks
+
+    @classmethod
+    def _parse_rows(cls, path: str | os.PathLike, fields: list[str], span: tuple[int, int]) -> AtomTable | None:
+
+        """Parse a range of lines holding rows of a table, or give None if a row or text block runs
+        across either end of the range."""
+
+        start, end = span
+        with open(path, "rb") as file:
+            file.seek(start)
+            lines = file.read(end - start).splitlines()
+
+        rows = []
+        buffer = []
+        for line in lines:
+            if line.startswith(b";"):
+                return None
+            buffer += cls._split_line(line.decode().rstrip())
+            if len(buffer) < len(fields):
+                continue
+            if len(buffer) > len(fields):
+                return None
+            rows.append(buffer)
+            buffer = []
+        if buffer:
+            return None
+        return cls._atoms_from_rows(fields, rows)
 
     @classmethod
-    def _atoms_from_dict(cls, data: dict) -> list[Atom]:
-
-        atoms = []
-
-        for dataset in data.values():
-            atom_table = dataset["_atom_site"]
-            for atom_i in range(len(atom_table["id"])):
-                cmps = []
-                values = [col[atom_i] for col in atom_table.values()]
-                for field_name, value in zip(atom_table, values):
-                    # Skip unknown/placeholder values
-                    if value in "?.":
-                        continue
-                    elif field_name in cls._cmp_map:
-                        cmp_type = cls._cmp_map[field_name]
-                        cmps.append(cmp_type(value))
-                atoms.append(Atom(*cmps))
-
-        return atoms
+    def _atoms_from_dict(cls, data: dict) -> AtomTable:
+
+        # Skip unknown/placeholder values
+        tables = [AtomTable.from_columns(dataset["_atom_site"], cls._cmp_map, missing=MISSING_VALUES)
+                  for dataset in data.values()]
+        return AtomTable.concat(tables)
 
     @classmethod
     def to_file(cls, atoms: Iterable[Atom], path: str | os.PathLike) -> None:
-        path = pathlib.Path(path)
-        header = path.name[:-len(path.suffix)]
-        data = {f"data_{header}": cls._atoms_to_dict(atoms)}
-        cls._write_from_dict(data, path)
+        with cls.writer(path) as writer:
+            writer.write(atoms)
+
+    @classmethod
+    def writer(cls, path: str | os.PathLike, append: bool = False) -> FormatWriter:
+        return CIFWriter(path, append)
 
     @staticmethod
     def _split_line(line: str) -> list[str]:
@@ -116,55 +205,117 @@ class CIFFormat(Format):
 
         >>> ln = "foo 'hello world'\tbar"
         >>> assert CIFFormat._split_line(ln) == ["foo", "hello world", "bar"]
+
+        Quote marks only close a value when followed by whitespace, so they can appear inside values.
+        >>> assert CIFFormat._split_line("'N'-methyl' 3'-end") == ["N'-methyl", "3'-end"]
         """
 
-        words = []
-        buffer = ''
+        words = line.split()
+        if "'" not in line and '"' not in line:
+            return words
+
+        # Quoted values without whitespace in them only need their quote marks removed. Others are
+        # left to the tokenizer.
+        for i, word in enumerate(words):
+            if word[0] in "'\"":
+                if len(word) == 1 or word[-1] != word[0]:
+                    return ["".join(groups) for groups in _TOKEN_PATTERN.findall(line)]
+                words[i] = word[1:-1]
+        return words
 
-        dquote = False
-        squote = False
+    @classmethod
+    def _extract_data(cls, path: str | os.PathLike, categories: None | Iterable[str] = None) -> dict:
 
-        for char in line:
-            if char == '"':
-                dquote = not dquote
-                continue
-            elif char == "'":
-                if not dquote:
-                    squote = not squote
-                    continue
-            if char in (" ", "\t"):
-                if not buffer:
-                    continue
-                if not (dquote or squote):
-                    words.append(buffer)
-                    buffer = ''
-                    continue
-            buffer += char
-        if buffer:
-            words.append(buffer)
+        """Reads the information from a cif file into a dict. Optionally only extract categories with given names,
+        in which case only the parts of the file holding those categories are read, found with a CIFIndex."""
 
-        return words
+        if categories:
+            blocks = cls.read_blocks(path)
+            return {header: {cat: block[cat] for cat in block if cat in categories}
+                    for header, block in blocks.items()}
+
+        with open_file(path, "r") as file:
+            return cls._collect(cls._parse(ln.rstrip() for ln in file))
 
     @classmethod
-    def _extract_data(cls, path: str | os.PathLike, categories: None | Iterable[str] = None) -> dict:
+    def read_blocks(cls, path: str | os.PathLike, cache_index: bool = False) -> dict[str, CIFBlock]:
 
-        """Reads the information from a cif file into a dict. Optionally only extract categories with given names."""
+        """
+        Open the data blocks of a cif file, keyed by header. Categories are only read from the file and
+        parsed when first looked up, using an index of where each one lies in the file.
 
-        with open(path, "r") as file:
-            lines = (ln.rstrip() for ln in file.readlines())
+        :param path: location of the cif file.
+        :param cache_index: save the index beside the file, to be reused while the file is unchanged.
+        """
+
+        index = CIFIndex.for_file(path, cache=cache_index)
+        return {header: CIFBlock(path, header, ranges) for header, ranges in index.blocks.items()}
+
+    @classmethod
+    def _collect(cls, events: Iterable[tuple]) -> dict:
+
+        """Compiles a stream of events from _parse() into a dict of data blocks."""
 
         all_data = defaultdict(dict)
         block = None
+
+        for event, *args in events:
+            if event == "block":
+                block = all_data[args[0]]
+            elif event == "item":
+                cat, field, value = args
+                block.setdefault(cat, dict())[field] = value
+            elif event == "field":
+                cat, field = args
+                block.setdefault(cat, dict())[field] = []
+            elif event == "row":
+                cat, values = args
+                for field, value in zip(block[cat], values, strict=True):
+                    block[cat][field].append(value)
+
+        return all_data
+
+    @classmethod
+    def _read_category(cls, path: str | os.PathLike, header: str, category: str,
+                       ranges: Iterable[tuple[int, int]]) -> dict:
+
+        """Reads one category of a data block from the given byte ranges of a cif file."""
+
+        with open_file(path, "rb") as file:
+            chunks = []
+            for start, end in ranges:
+                file.seek(start)
+                chunks.append(file.read(end - start))
+        lines = b"".join(chunks).decode().splitlines()
+        data = cls._collect(cls._parse(chain([header], (ln.rstrip() for ln in lines)), categories=(category,)))
+        return data[header].get(category, {})
+
+    @classmethod
+    def _parse(cls, lines: Iterable[str], categories: None | Iterable[str] = None) -> Iterator[tuple]:
+
+        """
+        Parses lines of a cif file into a stream of events, so that files can be read without holding them in memory:
+            ("block", header) on entering a data block
+            ("item", category, field, value) for single data items
+            ("field", category, field) for each field declared by a table
+            ("row", category, values) for each table row
+        Optionally only produce events for categories with given names.
+        """
+
         in_table = False
         in_text_block = False
         cat = None
         field = None
         buffer = []
         num_cols = 0
+        # Fields declared so far in each category of the current block, for counting table columns
+        declared = defaultdict(lambda: defaultdict(dict))
+        block_fields = None
 
         for line in lines:
             if line.startswith("data_"):
-                block = all_data[line]
+                block_fields = declared[line]
+                yield "block", line
 
             if in_text_block and line[0] in "#_":
                 raise ValueError(f"Unexpected end of text block on line:\n{line}")
@@ -184,11 +335,13 @@ class CIFFormat(Format):
                 if categories and cat not in categories:
                     in_table = False
                 elif in_table:
-                    block.setdefault(cat, dict())[field] = []
-                    num_cols = len(block[cat])
+                    block_fields[cat][field] = None
+                    num_cols = len(block_fields[cat])
+                    yield "field", cat, field
                 # Otherwise, treat as a data item
                 elif num_parts == 2:
-                    block.setdefault(cat, dict())[field] = parts[1]
+                    block_fields[cat][field] = None
+                    yield "item", cat, field, parts[1]
                 elif num_parts > 2:
                     raise ValueError(f"Too many data items on line, expected 2 or fewer:\n{line}")
 
@@ -200,8 +353,8 @@ class CIFFormat(Format):
                 # This line is the beginning or end of a text block.
                 # Tell the difference by checking if lines have been accumulated.
                 if buffer:
-                    item = "".join(buffer)
-                    block.setdefault(cat, dict())[field] = item
+                    block_fields[cat][field] = None
+                    yield "item", cat, field, "".join(buffer)
                     in_text_block = False
                     buffer = []
                 else:
@@ -214,14 +367,79 @@ class CIFFormat(Format):
                     # Table rows can run over multiple lines. If the number of values is less
                     # than the number of fields, roll them over to the next line.
                     continue
-                for field, value in zip(block[cat], buffer, strict=True):
-                    block[cat][field].append(value)
+                yield "row", cat, buffer
                 buffer = []
 
             elif in_text_block:
                 buffer.append(line)
 
-        return all_data
+    @classmethod
+    def _read_batches(cls, file: TextIO, batch_size: int,
+                      where: Sequence[tuple[str, Collection, bool]] = (),
+                      aspects: Collection[str] | None = None) -> Iterator[AtomTable]:
+
+        """Reads the _atom_site table of each block from an open file, in batches of rows. Rows that fail
+        any conditions given as where are left out of their batch, and if aspects are given, only fields
+        giving them are decoded."""
+
+        kept = None if aspects is None else set(cls._fields_holding(aspects))
+        fields = {}
+        rows = []
+
+        with file:
+            for event, *args in cls._parse((ln.rstrip() for ln in file), categories=("_atom_site",)):
+                if event == "row":
+                    values = args[1]
+                    if len(values) != len(fields):
+                        raise ValueError(f"Expected {len(fields)} values in table row, got {len(values)}")
+                    rows.append(values)
+                    if len(rows) == batch_size:
+                        yield from cls._decode(fields, rows, where, kept)
+                        rows = []
+                    continue
+                if rows:
+                    yield from cls._decode(fields, rows, where, kept)
+                    rows = []
+                if event == "block":
+                    fields = {}
+                elif event == "field":
+                    fields[args[1]] = None
+            if rows:
+                yield from cls._decode(fields, rows, where, kept)
+
+    @classmethod
+    def _decode(cls, fields: Sequence[str], rows: list[list[str]],
+                where: Sequence[tuple[str, Collection, bool]] = (),
+                kept: Collection[str] | None = None) -> Iterator[AtomTable]:
+
+        """
+        Builds a table from rows of a table's values, of just the kept fields if given, after dropping rows
+        which fail any of the conditions, judged on just the fields the conditions need. Yields nothing if
+        no rows are left.
+
+        >>> rows = [["1", "ALA"], ["2", "HOH"]]
+        >>> [table] = CIFFormat._decode(["id", "label_comp_id"], rows, [("resname", {"HOH"}, False)], {"id"})
+        >>> assert [atom.index for atom in table] == [1] and "resname" not in table.columns
+        """
+
+        if where:
+            tested = cls._fields_holding({aspect for aspect, _, _ in where})
+            columns = {field: [row[i] for row in rows] for i, field in enumerate(fields) if field in tested}
+            if columns:
+                flags = AtomTable.rows_passing(columns, cls._cmp_map, where, missing=MISSING_VALUES)
+                if flags is not None:
+                    rows = list(compress(rows, flags))
+        if rows:
+            yield cls._atoms_from_rows(fields, rows, kept)
+
+    @classmethod
+    def _atoms_from_rows(cls, fields: Iterable[str], rows: list[list[str]],
+                         kept: Collection[str] | None = None) -> AtomTable:
+        if kept is None:
+            data = dict(zip(fields, zip(*rows)))
+        else:
+            data = {field: [row[i] for row in rows] for i, field in enumerate(fields) if field in kept}
+        return AtomTable.from_columns(data, cls._cmp_map, missing=MISSING_VALUES, length=len(rows))
 
     @classmethod
     def _get_item_by_value(cls, category_data: dict[str, list | str], field: str, value: str) -> dict:
@@ -276,61 +494,71 @@ class CIFFormat(Format):
     @classmethod
     def _write_from_dict(cls, data: dict, path: str | os.PathLike) -> None:
 
-        lines = []
+        """Writes a dict of cif data to file, one category at a time."""
+
+        with open_file(path, "w", buffering=WRITE_BUFFER) as file:
+            sep = ""
+            for header, dataset in data.items():
+                file.write(sep + header + "\n#")
+                sep = "\n"
+                for category, fields in dataset.items():
+                    file.write("\n" + "\n".join(cls._category_lines(category, fields)) + "\n#")
+
+    @classmethod
+    def _category_lines(cls, category: str, fields: dict[str, str | list]) -> list[str]:
 
-        for header, dataset in data.items():
-            lines.extend([header, "#"])
-
-            for category in dataset:
-                fields = dataset[category]
-                labels = [category + "." + f for f in fields]
-
-                if all(isinstance(v, str) for v in fields.values()):
-                    # This category contains single label:value pairs
-                    col_width = max(map(len, labels)) + COLUMN_PADDING
-                    for item, value in fields.items():
-                        label = category + "." + item
-                        if col_width + len(value) > WRAP_AT:
-                            lines.extend([label] + cls._value_into_text_block(value, WRAP_AT))
-                        else:
-                            formatted = "'" + value + "'" if " " in value or "'" in value else value
-                            lines.append(f"{label: <{col_width}}{formatted}")
-
-                elif all(isinstance(v, list) for v in fields.values()):
-                    # This category is a table
-                    lines.append("loop_")
-                    columns = []
-                    widths = []
-                    for item, values in dataset[category].items():
-                        label = category + "." + item
-                        lines.append(label)
-                        col = []
-                        max_width = 0
-                        for v in values:
-                            # Surround strings containing spaces with quotes
-                            formatted = '"' + v + '"' if " " in v or "'" in v else v
-                            col.append(formatted)
-                            max_width = max(max_width, len(formatted))
-                        widths.append(max_width)
-                        columns.append(col)
-
-                    for row in zip(*columns):
-                        line = ""
-                        for width, value in zip(widths, row):
-                            padded = f"{value: <{width + COLUMN_PADDING}}"
-                            if len(line) + len(padded) > WRAP_AT:
-                                lines.append(line.rstrip())
-                                line = padded
-                            else:
-                                line += padded
-                        lines.append(line.rstrip())
+        labels = [category + "." + f for f in fields]
 
+        if all(isinstance(v, str) for v in fields.values()):
+            # This category contains single label:value pairs
+            lines = []
+            col_width = max(map(len, labels)) + COLUMN_PADDING
+            for label, value in zip(labels, fields.values()):
+                if col_width + len(value) > WRAP_AT:
+                    lines.extend([label] + cls._value_into_text_block(value, WRAP_AT))
                 else:
-                    raise ValueError(f"Unexpected field value types. Must be <str> or <list>.")
-                lines.append("#")
+                    formatted = "'" + value + "'" if " " in value or "'" in value else value
+                    lines.append(f"{label: <{col_width}}{formatted}")
+            return lines
+
+        elif all(isinstance(v, list) for v in fields.values()):
+            # This category is a table
+            return ["loop_", *labels, *cls._table_rows(fields)]
 
-        with open(path, "w") as file:
-            file.write("\n".join(lines))
+        else:
+            raise ValueError(f"Unexpected field value types. Must be <str> or <list>.")
+
+    @staticmethod
+    def _table_rows(fields: dict[str, list[str]]) -> list[str]:
+
+        """Lays out columns of table values as rows, with each column padded to its widest value."""
+
+        lines = []
+        columns = []
+        widths = []
+        for values in fields.values():
+            col = []
+            max_width = 0
+            for v in values:
+                # Surround strings containing spaces with quotes
+                formatted = '"' + v + '"' if " " in v or "'" in v else v
+                col.append(formatted)
+                max_width = max(max_width, len(formatted))
+            widths.append(max_width)
+            columns.append(col)
+
+        for row in zip(*columns):
+            line = ""
+            for width, value in zip(widths, row):
+                padded = f"{value: <{width + COLUMN_PADDING}}"
+                if len(line) + len(padded) > WRAP_AT:
+                    lines.append(line.rstrip())
+                    line = padded
+                else:
+                    line += padded
+            lines.append(line.rstrip())
+
+        return lines
 
     @staticmethod
     def _value_into_text_block(value: str, wrap_at) -> list[str]:
@@ -365,5 +593,135 @@ class CIFFormat(Format):
         text_block_lines.append(";")
         return text_block_lines
 
+
+class CIFIndex(FileIndex):
+
+    """
+    Byte offsets of each category in each data block of a cif file, found in one pass over the file
+    without parsing any values. A category (a table, or a run of single data items) usually spans
+    one range of the file, running from its 'loop_' or first label up to the next category, comment
+    or data block.
+    """
+
+    def __init__(self, blocks: dict[str, dict[str, list[tuple[int, int]]]], size: int = 0, mtime_ns: int = 0):
+        super().__init__(size, mtime_ns)
+        self.blocks = blocks
+
+    @classmethod
+    def build(cls, path: str | os.PathLike) -> CIFIndex:
+
+        """Index a cif file in one pass."""
+
+        blocks = {}
+        categories = None
+        current = None  # Category being read, and where its current range started
+        loop_start = None
+        in_text_block = False
+        offset = 0
+
+        def close(end):
+            nonlocal current
+            if current is not None:
+                cat, start = current
+                categories.setdefault(cat, []).append((start, end))
+                current = None
+
+        with open_file(path, "rb") as file:
+            for line in file:
+                if line.startswith(b";"):
+                    in_text_block = not in_text_block
+                elif in_text_block:
+                    pass
+                elif line.startswith(b"data_"):
+                    close(offset)
+                    categories = blocks.setdefault(line.rstrip().decode(), {})
+                elif line.startswith(b"#"):
+                    close(offset)
+                elif line.startswith(b"loop_"):
+                    close(offset)
+                    loop_start = offset
+                elif line.startswith(b"_") and categories is not None:
+                    cat = line.split(b".", 1)[0].decode()
+                    if current is None or current[0] != cat or loop_start is not None:
+                        close(offset)
+                        current = (cat, offset if loop_start is None else loop_start)
+                    loop_start = None
+                offset += len(line)
+            close(offset)
+
+        return cls(blocks, *cls._stamp(path))
+
+    def _dump(self) -> dict:
+        return self.blocks
+
+    @classmethod
+    def _restore(cls, data: dict, size: int, mtime_ns: int) -> CIFIndex:
+        blocks = {header: {cat: [tuple(r) for r in ranges] for cat, ranges in cats.items()}
+                  for header, cats in data.items()}
+        return cls(blocks, size, mtime_ns)
+
+
+class CIFBlock(Mapping):
+
+    """
+    Categories of one data block in a cif file, keyed by name. Each category is read from the file
+    and parsed the first time it's looked up, and kept from then on.
+    """
+
+    def __init__(self, path: str | os.PathLike, header: str, ranges: dict[str, list[tuple[int, int]]]):
+        self._path = path
+        self._header = header
+        self._ranges = ranges
+        self._parsed = {}
+
+    def __getitem__(self, category: str) -> dict:
+        if category not in self._parsed:
+            ranges = self._ranges[category]
+            self._parsed[category] = CIFFormat._read_category(self._path, self._header, category, ranges)
+        return self._parsed[category]
+
+    def __iter__(self):
+        return iter(self._ranges)
+
+    def __len__(self):
+        return len(self._ranges)
+
+    def __repr__(self):
+        return f"CIFBlock({self._header}, categories=[{', '.join(self._ranges)}])"
+
+
+class CIFWriter(FormatWriter):
+
+    """
+    Writes atoms to a cif file as the _atom_site table of a single data block, named after the file,
+    one batch at a time. Column widths are worked out separately for each batch. When appending,
+    the atoms go into a new data block at the end of the file, numbered if the file already has a
+    block of that name, e.g. 'data_1abc_2', so that blocks stay apart when read by name.
+    """
+
+    def __init__(self, path: str | os.PathLike, append: bool = False):
+        super().__init__(path, append)
+        path = pathlib.Path(path)
+        header = "data_" + path.name[:-len("".join(split_suffix(path)))]
+        if append and os.path.exists(path):
+            with open_file(path, "r") as file:
+                taken = {line.rstrip() for line in file if line.startswith("data_")}
+            names = chain([header], (f"{header}_{n}" for n in count(2)))
+            header = next(name for name in names if name not in taken)
+        self._header = header
+        self._in_table = False
+
+    def _write_batch(self, atoms: Sequence[Atom]) -> None:
+        fields = CIFFormat._atoms_to_dict(atoms)["_atom_site"]
+        lines = CIFFormat._table_rows(fields)
+        if not self._in_table:
+            lines = [self._header, "#", "loop_", *("_atom_site." + f for f in fields), *lines]
+            self._in_table = True
+        self._write_lines(lines)
+
+    def _finish(self) -> None:
+        self._write_lines(["#"] if self._in_table else [self._header, "#"])
+
+
 if __name__ == '__main__':
     pass
\ No newline at end of file
@@ -1,12 +1,18 @@
+from __future__ import annotations
+
 from collections import defaultdict
 from operator import itemgetter
+import mmap
 import os
 import pathlib
 import string
-from typing import Iterable
+import sys
+from typing import BinaryIO, Collection, Iterable, Iterator, Sequence, TextIO
 
 from atomflow.atom import Atom
-from atomflow.formats import Format
+from atomflow.formats import (Format, FileBatches, FileIndex, FormatWriter, BATCH_SIZE, open_file, recipe_aspects,
+                              split_suffix)
+from atomflow.table import AtomTable
 from atomflow.components import *
 from atomflow.knowledge import *
 
@@ -36,8 +42,9 @@ class ArbitraryBaseNumber:
 
 class ChainIdGenerator:
 
-    def __init__(self):
-        self._number = ArbitraryBaseNumber(26, 0)
+    def __init__(self, start: int = 0):
+        # Starting from n gives the IDs that follow the first n
+        self._number = ArbitraryBaseNumber(26, start)
 
     def __iter__(self):
         return self
@@ -59,65 +66,285 @@ class FastaFormat(Format):
 
     extensions = (".fasta", ".faa", ".fna")
 
+    _cmp_map = {
+        "resname": ResidueComponent,
+        "resindex": ResIndexComponent,
+        "chain": ChainComponent,
+    }
+
     @classmethod
-    def read_file(cls, path: str | os.PathLike) -> list[Atom]:
-
-        with open(path, "r") as file:
-            lines = reversed([line.strip() for line in file.readlines()])
-
-        atoms = []
-        seq_lines = []
-        chain_id_gen = ChainIdGenerator()
-
-        for ln in lines:
-            if ln.startswith(">"):
-                seq = "".join(seq_lines)
-
-                # Determine symbol:residue name mapping from the sequence
-                symbol_set = set(seq)
-
-                if not symbol_set - DNA_ONE_LETTER_CODES:
-                    name_mapping = DNA_SYM_TO_RES
-                elif not symbol_set - RNA_RES_CODES:
-                    name_mapping = RNA_SYM_TO_RES
-                elif not symbol_set - AA_ONE_LETTER_CODES:
-                    name_mapping = AA_SYM_TO_RES
-                else:
-                    sequence_rep = seq if len(seq) <= 20 else f"{seq[:10]}...{seq[-10:]}"
-                    raise ValueError(f"Could not interpet residue codes of sequence: \n{sequence_rep}")
-
-                # Convert sequence into atoms
-                new_atms = []
-                chain = ChainComponent(next(chain_id_gen))
-                for i, res in enumerate(seq):
-                    resn = ResidueComponent(name_mapping[res])
-                    resi = ResIndexComponent(i+1)
-                    new_atms.append(Atom(resn, resi, chain))
-                atoms = new_atms + atoms
-                seq_lines = []
-            else:
-                seq_lines.insert(0, ln)
+    def written_aspects(cls) -> set[str]:
+        return recipe_aspects(cls.recipe) | {ChainAspect.name}
+
+    @classmethod
+    def _read_records(cls, file: TextIO) -> Iterator[tuple[str, str]]:
+
+        """Yields the header and sequence of each record in a fasta file, in file order. Only the
+        record being read is held in memory."""
+
+        header, seq_lines = None, []
+        for line in file:
+            line = line.strip()
+            if line.startswith(">"):
+                if header is not None:
+                    yield header, "".join(seq_lines)
+                header, seq_lines = line[1:], []
+            elif header is not None:
+                seq_lines.append(line)
+        if header is not None:
+            yield header, "".join(seq_lines)
+
+    @staticmethod
+    def _residue_names(seq: str) -> list[str]:
+
+        """
+        Names of the residues in a sequence, interpreted as DNA, RNA or protein from its symbols.
+
+        >>> assert FastaFormat._residue_names("MKV") == ["MET", "LYS", "VAL"]
+        """
+
+        # Determine symbol:residue name mapping from the sequence
+        symbol_set = set(seq)
+
+        if not symbol_set - DNA_ONE_LETTER_CODES:
+            name_mapping = DNA_SYM_TO_RES
+        elif not symbol_set - RNA_RES_CODES:
+            name_mapping = RNA_SYM_TO_RES
+        elif not symbol_set - AA_ONE_LETTER_CODES:
+            name_mapping = AA_SYM_TO_RES
+        else:
+            sequence_rep = seq if len(seq) <= 20 else f"{seq[:10]}...{seq[-10:]}"
+            raise ValueError(f"Could not interpet residue codes of sequence: \n{sequence_rep}")
+
+        return list(map(name_mapping.__getitem__, seq))
+
+    @classmethod
+    def _read_batches(cls, file: TextIO, batch_size: int) -> Iterator[AtomTable]:
+
+        """Converts records into tables of residues, with a chain ID given to each record in turn. Records
+        are gathered until a batch holds at least batch_size residues. A file without residues gives one
+        empty batch."""
+
+        with file:
+            chain_id_gen = ChainIdGenerator()
+            data = {"resname": [], "resindex": [], "chain": []}
+            count = 0
+            for _, seq in cls._read_records(file):
+                names = cls._residue_names(seq)
+                data["resname"] += names
+                data["resindex"] += range(1, len(names) + 1)
+                data["chain"] += [next(chain_id_gen)] * len(names)
+                if len(data["resname"]) >= batch_size:
+                    yield AtomTable.from_columns(data, cls._cmp_map)
+                    count += 1
+                    data = {"resname": [], "resindex": [], "chain": []}
+            if data["resname"] or not count:
+                yield AtomTable.from_columns(data, cls._cmp_map)
+
+    @classmethod
+    def read_file(cls, path: str | os.PathLike) -> AtomTable:
+
+        # Read as one batch, which saves joining tables together afterwards
+        [table] = cls._read_batches(open_file(path, "r"), sys.maxsize)
+        return table
+
+    @classmethod
+    def read_iter(cls, path: str | os.PathLike, batch_size: int = BATCH_SIZE,
+                  where: Sequence[tuple[str, Collection, bool]] = (),
+                  aspects: Collection[str] | None = None) -> Iterator[AtomTable]:
+
+        file = open_file(path, "r")
+        return FileBatches(file, cls._read_batches(file, batch_size))
+
+    @classmethod
+    def read_records(cls, path: str | os.PathLike, records: Iterable[str]) -> Iterator[AtomTable]:
+
+        """
+        Read only the given records, one table each, through a FastaIndex of the file, which is saved
+        beside it as a .fai file. Records are named as in the index, and a range of residues can be
+        read with 'name:start-end', counting from 1 and including both ends. Residues keep the index
+        and chain ID they'd have if the whole file was read.
 
-        return atoms
+        A range is interpreted as DNA, RNA or protein from its own symbols, not the whole record's.
+        Compressed files can't be read this way.
+        """
 
+        if split_suffix(path)[1]:
+            raise ValueError(f"Compressed file {path} cannot be read by record")
+        index = FastaIndex.for_file(path, cache=True)
+        regions = [index.region(spec) for spec in records]
+        file = open(path, "rb")
+        return FileBatches(file, cls._read_regions(file, index, regions))
+
+    @classmethod
+    def _read_regions(cls, file: BinaryIO, index: FastaIndex,
+                      regions: Iterable[tuple[int, int, int]]) -> Iterator[AtomTable]:
+        with file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for position, start, end in regions:
+                seq = index.fetch(mm, position, start, end)
+                names = cls._residue_names(seq)
+                chain = next(ChainIdGenerator(position))
+                data = {"resname": names, "resindex": range(start, start + len(names)), "chain": [chain] * len(names)}
+                yield AtomTable.from_columns(data, cls._cmp_map)
 
     @classmethod
     def to_file(cls, atoms: Iterable[Atom], path: str | os.PathLike) -> None:
 
-        path = pathlib.Path(path)
-        stem = path.name[:-len(path.suffix)]
+        with cls.writer(path) as writer:
+            writer.write(atoms)
+
+    @classmethod
+    def writer(cls, path: str | os.PathLike, append: bool = False) -> FormatWriter:
+
+        return FastaWriter(path, append)
+
+
+class FastaIndex(FileIndex):
+
+    """
+    Index of the records in a fasta file, compatible with samtools faidx. For each record, in file
+    order, holds its name, number of residues, the byte offset of its sequence, and the residues and
+    bytes per line. Every line of a record but the last must be the same length.
+
+    Unlike other indexes, it's saved in the tab-separated .fai layout, and is out of date if the
+    file has been modified since.
+    """
 
-        residue_sets = defaultdict(set)
+    suffix = ".fai"
 
+    def __init__(self, entries: list[tuple[str, int, int, int, int]], size: int = 0, mtime_ns: int = 0):
+        super().__init__(size, mtime_ns)
+        # (name, length, offset, line bases, line width) of each record
+        self.entries = entries
+        self._positions = {}
+        for i, entry in enumerate(entries):
+            self._positions.setdefault(entry[0], i)
+
+    @classmethod
+    def build(cls, path: str | os.PathLike) -> FastaIndex:
+
+        entries = []
+        size, mtime_ns = cls._stamp(path)
+        with open(path, "rb") as file:
+            record = None  # [name, length, offset, line bases, line width] of the current record
+            short = False  # Whether a line shorter than the rest has been seen in the current record
+            offset = 0
+            for line in file:
+                offset += len(line)
+                if line.startswith(b">"):
+                    if record is not None:
+                        entries.append(tuple(record))
+                    name = line[1:].split(maxsplit=1)
+                    record = [name[0].decode() if name else "", 0, offset, 0, 0]
+                    short = False
+                elif record is not None:
+                    bases = len(line.rstrip(b"\r\n"))
+                    if not record[3]:
+                        record[3:] = bases, len(line)
+                    elif short and bases or bases > record[3]:
+                        raise ValueError(f"Different line length in sequence '{record[0]}' of {path}")
+                    elif bases < record[3] or len(line) != record[4]:
+                        short = True
+                    record[1] += bases
+            if record is not None:
+                entries.append(tuple(record))
+
+        return cls(entries, size, mtime_ns)
+
+    def _dump(self) -> dict:
+        return {"entries": self.entries}
+
+    @classmethod
+    def _restore(cls, data: dict, size: int, mtime_ns: int) -> FastaIndex:
+        return cls([tuple(entry) for entry in data["entries"]], size, mtime_ns)
+
+    @classmethod
+    def load(cls, path: str | os.PathLike) -> FastaIndex | None:
+        try:
+            index_stat = os.stat(str(path) + cls.suffix)
+            size, mtime_ns = cls._stamp(path)
+            if index_stat.st_mtime_ns < mtime_ns:
+                return None
+            with open(str(path) + cls.suffix, "r") as file:
+                rows = [line.rstrip("\n").split("\t") for line in file]
+            entries = [(name, *map(int, values[:4])) for name, *values in rows]
+        except (OSError, ValueError):
+            return None
+        return cls(entries, size, mtime_ns)
+
+    def save(self, path: str | os.PathLike) -> None:
+        self._save_text(path, "".join("\t".join(map(str, entry)) + "\n" for entry in self.entries))
+
+    def region(self, spec: str) -> tuple[int, int, int]:
+
+        """
+        Position of a record in the file, and the first and last residues to read from it, given its
+        name or 'name:start-end'. Either end of a range can be left out.
+
+        >>> index = FastaIndex([("a", 10, 3, 4, 5), ("b:1", 3, 20, 3, 4)])
+        >>> assert index.region("a") == (0, 1, 10)
+        >>> assert index.region("a:2-5") == (0, 2, 5)
+        >>> assert index.region("a:8-") == (0, 8, 10)
+        >>> assert index.region("b:1") == (1, 1, 3)
+        """
+
+        if (position := self._positions.get(spec)) is not None:
+            return position, 1, self.entries[position][1]
+
+        name, _, span = spec.rpartition(":")
+        if (position := self._positions.get(name)) is None:
+            raise ValueError(f"No record named '{spec}' in index")
+        length = self.entries[position][1]
+        try:
+            start, _, end = span.replace(",", "").partition("-")
+            start = max(int(start or 1), 1)
+            end = min(int(end or length), length)
+        except ValueError:
+            raise ValueError(f"Could not interpret residue range '{span}'")
+        return position, start, end
+
+    def fetch(self, data: bytes | mmap.mmap, position: int, start: int, end: int) -> str:
+
+        """Sequence of residues start to end of a record, cut from the file's data."""
+
+        _, _, offset, line_bases, line_width = self.entries[position]
+        if end < start:
+            return ""
+
+        def locate(residue: int) -> int:
+            line, column = divmod(residue - 1, line_bases)
+            return offset + line * line_width + column
+
+        chunk = data[locate(start):locate(end) + 1]
+        return chunk.replace(b"\n", b"").replace(b"\r", b"").decode()
+
+
+class FastaWriter(FormatWriter):
+
+    """
+    Writes the sequence of each chain to a fasta file. Since a chain's residues can arrive over
+    several batches, only the residues are kept as atoms are written, and sequences are written
+    out when the writer is closed.
+    """
+
+    def __init__(self, path: str | os.PathLike, append: bool = False):
+        super().__init__(path, append)
+        path = pathlib.Path(path)
+        self._stem = path.name[:-len("".join(split_suffix(path)))]
+        self._residue_sets = defaultdict(set)
+
+    def _write_batch(self, atoms: Sequence[Atom]) -> None:
         for atom in atoms:
-            if not atom.implements(cls.recipe):
+            if not atom.implements(FastaFormat.recipe):
                 continue
-            header = stem + "_" + atom.chain if atom.implements(ChainAspect) else stem
-            residue_sets[header].add((atom.resindex, atom.resname))
+            header = self._stem + "_" + atom.chain if atom.implements(ChainAspect) else self._stem
+            self._residue_sets[header].add((atom.resindex, atom.resname))
+
+    def _finish(self) -> None:
 
         # Assemble residue codes into sequences, and collect unique sequences by entity
         seqs = {}
-        for header, residues in residue_sets.items():
+        for header, residues in self._residue_sets.items():
 
             name_set = {name for index, name in residues}
 
@@ -137,8 +364,7 @@ class FastaFormat(Format):
             seqs[seq] = header
 
         # Write out all sequences to one file
-        with open(path, "w") as file:
-            file.writelines([f">{header}\n{seq}\n" for seq, header in seqs.items()])
+        self._open().writelines([f">{header}\n{seq}\n" for seq, header in seqs.items()])
 
 
 if __name__ == '__main__':
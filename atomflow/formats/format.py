@@ -1,10 +1,140 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from collections.abc import Iterable, Mapping
+import bz2
+from collections.abc import Collection, Iterable, Iterator, Mapping, Sequence
+import gzip
+from itertools import batched
+import json
+import lzma
+import mmap
 import os
+import pathlib
+import tempfile
+from typing import IO, TextIO
 
+from atomflow.aspects import Aspect
 from atomflow.atom import Atom
+from atomflow.memory import traced
+from atomflow.table import AtomTable
+
+BATCH_SIZE = 2 ** 16  # Default number of atoms per batch read by Format.read_iter()
+WRITE_BUFFER = 2 ** 20  # Bytes of output held by a FormatWriter before they're flushed to file
+INDEX_CACHE_SIZE = 64  # Number of recently used file indexes kept in memory
+PARALLEL_CHUNK = 2 ** 24  # Bytes of a file parsed by each task of Format.read_parallel()
+
+# Suffixes of compressed files, with the modules that read and write them
+COMPRESSIONS = {".gz": gzip, ".bz2": bz2, ".xz": lzma}
+
+# Methods of each format whose calls are recorded by an active MemoryTrace
+TRACED_METHODS = ("read_file", "read_iter", "read_selection", "read_parallel", "read_records", "to_file")
+
+# Values taken by atoms without an aspect, when selecting or grouping by it. Files without MODEL
+# records hold a single model, read without a model aspect, which is taken to be model 1.
+ASPECT_DEFAULTS = {"model": 1}
+
+
+def split_suffix(path: str | os.PathLike) -> tuple[str, str]:
+
+    """
+    Split the suffix of a file into the suffix of its format and that of its compression, if any.
+
+    >>> assert split_suffix("1abc.cif.gz") == (".cif", ".gz")
+    >>> assert split_suffix("data/1abc.v2.pdb") == (".pdb", "")
+    """
+
+    suffixes = pathlib.Path(path).suffixes
+    if suffixes and suffixes[-1] in COMPRESSIONS:
+        return "".join(suffixes[-2:-1]), suffixes[-1]
+    return "".join(suffixes[-1:]), ""
+
+
+def open_file(path: str | os.PathLike, mode: str = "r", buffering: int = -1) -> IO:
+
+    """
+    Open a file like open(), but read and write files with a compression suffix through their
+    compression, a block at a time, so that they're never decompressed in full.
+    """
+
+    compression = COMPRESSIONS.get(split_suffix(path)[1])
+    if compression is None:
+        return open(path, mode, buffering=buffering)
+    return compression.open(path, mode if "b" in mode else mode + "t")
+
+
+class FileBatches(Iterator):
+
+    """
+    Batches read from a file opened up front, by a generator that closes the file once it's done.
+    Closing the batches closes the file as well, even if none have been read, which closing the
+    generator alone wouldn't.
+    """
+
+    def __init__(self, file: IO, batches: Iterator):
+        self.file = file
+        self._batches = batches
+
+    def __next__(self):
+        return next(self._batches)
+
+    def close(self) -> None:
+        self._batches.close()
+        self.file.close()
+
+
+def line_ranges(data: bytes | mmap.mmap, start: int, end: int, size: int) -> list[tuple[int, int]]:
+
+    """
+    Split a span of data into ranges of about the given size, each extended to end on a line break.
+
+    >>> assert line_ranges(b"ab\\ncd\\nef\\n", 0, 9, 4) == [(0, 6), (6, 9)]
+    """
+
+    ranges = []
+    while start < end:
+        stop = data.find(b"\n", min(start + size, end) - 1, end) + 1 or end
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def recipe_aspects(recipe: Mapping | Aspect | str) -> set[str]:
+
+    """
+    Names of all the aspects a recipe mentions, on any branch.
+
+    >>> from atomflow.aspects import NameAspect, ElementAspect, PositionAspect
+    >>> sorted(recipe_aspects({"or": [NameAspect, {"and": [ElementAspect, PositionAspect]}]}))
+    ['element', 'name', 'position']
+    """
+
+    if isinstance(recipe, Mapping):
+        return {name for items in recipe.values() for item in items for name in recipe_aspects(item)}
+    return {recipe if isinstance(recipe, str) else recipe.name}
+
+
+def select(batches: Iterable[Sequence[Atom]], chains: Iterable[str] | None = None,
+           models: Iterable[int] | None = None) -> Iterator[AtomTable]:
+
+    """
+    Filter batches of atoms down to those of the given chains and/or models, with atoms that have
+    no model taken to be in model 1. Batches left empty are dropped.
+    """
+
+    selection = {}
+    if chains is not None:
+        selection["chain"] = (set(chains), None)
+    if models is not None:
+        selection["model"] = (set(models), ASPECT_DEFAULTS["model"])
+    for batch in batches:
+        table = batch if isinstance(batch, AtomTable) else AtomTable.from_atoms(batch)
+        rows = range(len(table))
+        for aspect, (allowed, default) in selection.items():
+            column = table.columns.get(aspect)
+            values = column.gather(rows) if column is not None else [None] * len(rows)
+            rows = [row for row, v in zip(rows, values) if (default if v is None else v) in allowed]
+        if rows:
+            yield table.take(rows)
 
 
 class Format(ABC):
@@ -19,19 +149,24 @@ class Format(ABC):
         super().__init_subclass__(**kwargs)
         for ext in cls.extensions:
             Format._register[ext] = cls
+        for name in TRACED_METHODS:
+            if isinstance(method := cls.__dict__.get(name), classmethod):
+                setattr(cls, name, classmethod(traced(method.__func__)))
 
     @classmethod
     def get_format(cls, ext: str) -> Format:
 
         """
-        Fetch the subclass registered for a given extension.
+        Fetch the subclass registered for a given extension. Compressed files are read as the
+        format of the suffix before the compression's, e.g. '.cif.gz' as '.cif'.
 
         :param ext: file suffix, e.g. '.pdb'.
         :return:
         """
 
+        stem, compression = os.path.splitext(ext)
         try:
-            return cls._register[ext]
+            return cls._register[stem if compression in COMPRESSIONS and stem else ext]
         except KeyError:
             raise ValueError(f"No format found for extension '{ext}'")
 
@@ -61,18 +196,322 @@ class Format(ABC):
         """
 
 
+    @classmethod
+    def written_aspects(cls) -> set[str] | None:
+
+        """
+        Names of the aspects this format's writer looks at, or None if they aren't known. Atoms only
+        read to be written to this format need no others.
+        """
+
+        return None
+
+    @classmethod
+    def _fields_holding(cls, aspects: Collection[str]) -> list[str]:
+
+        """Fields of the format's _cmp_map read as components with any of the aspects, in order."""
+
+        return [field for field, cmp_type in cls._cmp_map.items() if any(a.name in aspects for a in cmp_type.aspects)]
+
     @classmethod
     @abstractmethod
-    def read_file(cls, path: str | os.PathLike) -> list[Atom]:
+    def read_file(cls, path: str | os.PathLike) -> Sequence[Atom]:
 
         """
-        Read a file in this format into a list of atoms.
+        Read a file in this format into a sequence of atoms.
         """
 
+    @classmethod
+    def read_iter(cls, path: str | os.PathLike, batch_size: int = BATCH_SIZE,
+                  where: Sequence[tuple[str, Collection, bool]] = (),
+                  aspects: Collection[str] | None = None) -> Iterator[Sequence[Atom]]:
+
+        """
+        Read a file in this format incrementally, as an iterator over batches of atoms. The file is
+        opened straight away, but only read as batches are requested.
+
+        Formats which can't be read incrementally yield the whole file as one batch.
+
+        Conditions on atoms can be given as where, as (aspect, values, keep), as pushed down from filters
+        by read(). Formats which can check them on raw values, before atoms are built, may leave out atoms
+        which fail them, as in AtomTable.rows_passing(). Others ignore them, so atoms must still be filtered.
+        The conditions are only looked at once the first batch is requested.
+
+        If aspects are given, by name, formats which can may skip decoding fields that give atoms none of
+        them. Atoms can still have other aspects, but shouldn't be relied on to.
+        """
+
+        return iter([cls.read_file(path)])
+
+    @classmethod
+    def read_selection(cls, path: str | os.PathLike, chains: Iterable[str] | None = None,
+                       models: Iterable[int] | None = None, batch_size: int = BATCH_SIZE,
+                       where: Sequence[tuple[str, Collection, bool]] = (),
+                       aspects: Collection[str] | None = None) -> Iterator[AtomTable]:
+
+        """
+        Read only the atoms of the given chains and/or models from a file in this format, as an iterator
+        over batches of atoms.
+
+        By default, the whole file is read and atoms of other chains and models are dropped, with atoms
+        that have no model taken to be in model 1. Formats which keep an index of their files can instead
+        read just the parts of the file that are needed. Conditions given as where, and aspects, are as
+        in read_iter(). Atoms keep their chain and model, so that they can be selected.
+        """
+
+        if aspects is not None:
+            aspects = {*aspects, "chain", "model"}
+        return select(cls.read_iter(path, batch_size, where, aspects), chains, models)
+
+    @classmethod
+    def read_parallel(cls, path: str | os.PathLike, workers: int | None = None) -> Sequence[Atom]:
+
+        """
+        Read a file in full, like read_file(), but with parsing split between a pool of worker
+        processes, by default one per CPU. Atoms come out the same, and in the same order, as from
+        read_file().
+
+        Formats which can't split a file between workers read it in this process.
+        """
+
+        return cls.read_file(path)
+
+    @classmethod
+    def read_records(cls, path: str | os.PathLike, records: Iterable[str]) -> Iterator[AtomTable]:
+
+        """
+        Read only the named records from a file in this format, as an iterator over one table per record.
+        Only formats which index their records by name can be read this way.
+        """
+
+        raise ValueError(f"{cls.__name__} files cannot be read by record")
+
     @classmethod
     @abstractmethod
     def to_file(cls, atoms: Iterable[Atom], path: str | os.PathLike) -> None:
 
         """
         Write an iterable of atoms to a file in this format.
-        """
\ No newline at end of file
+        """
+
+    @classmethod
+    def writer(cls, path: str | os.PathLike, append: bool = False) -> FormatWriter:
+
+        """
+        Open an incremental writer to a file in this format, which atoms can be fed to in batches.
+        With append=True, output is added to the end of an existing file rather than replacing it.
+
+        Formats which can't be written incrementally hold atoms until the writer is closed, then
+        write them all at once.
+        """
+
+        return _CollectingWriter(cls, path, append)
+
+
+class FileIndex(ABC):
+
+    """
+    Index of where data lies in a file, so that parts of it can be read without reading the rest.
+    An index can be saved beside its file, as <file><suffix>, along with the file's size and
+    modification time, and is only loaded again while those still match. Where it can't be saved,
+    e.g. beside a file in a read-only folder, the index is still used, just rebuilt when next needed.
+    The most recently used indexes are also kept in memory, so that files read often don't need
+    their index loading again.
+    """
+
+    suffix = ".idx"
+    _recent: dict[tuple[type, str], FileIndex] = {}
+
+    def __init__(self, size: int = 0, mtime_ns: int = 0):
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    @classmethod
+    @abstractmethod
+    def build(cls, path: str | os.PathLike) -> FileIndex:
+
+        """Index a file in one pass."""
+
+    @abstractmethod
+    def _dump(self) -> dict:
+
+        """Contents of the index as JSON-serialisable data."""
+
+    @classmethod
+    @abstractmethod
+    def _restore(cls, data: dict, size: int, mtime_ns: int) -> FileIndex:
+
+        """Recreate an index from the data given by _dump()."""
+
+    @staticmethod
+    def _stamp(path: str | os.PathLike) -> tuple[int, int]:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+
+    @classmethod
+    def load(cls, path: str | os.PathLike) -> FileIndex | None:
+
+        """Load the index saved beside a file, or None if there isn't one, or the file has changed since."""
+
+        try:
+            with open(str(path) + cls.suffix, "r") as file:
+                saved = json.load(file)
+            stamp = cls._stamp(path)
+        except (OSError, ValueError):
+            return None
+        if (saved["size"], saved["mtime_ns"]) != stamp:
+            return None
+        return cls._restore(saved["index"], *stamp)
+
+    @classmethod
+    def for_file(cls, path: str | os.PathLike, cache: bool = False) -> FileIndex:
+
+        """Load the saved index of a file if it's up to date, otherwise build it, saving it if cache is True."""
+
+        key = (cls, os.path.abspath(path))
+        index = FileIndex._recent.pop(key, None)
+        if index is None or (index.size, index.mtime_ns) != cls._stamp(path):
+            index = cls.load(path)
+        if index is None:
+            index = cls.build(path)
+            if cache:
+                try:
+                    index.save(path)
+                except OSError:
+                    pass
+
+        FileIndex._recent[key] = index
+        if len(FileIndex._recent) > INDEX_CACHE_SIZE:
+            del FileIndex._recent[next(iter(FileIndex._recent))]
+        return index
+
+    def save(self, path: str | os.PathLike) -> None:
+
+        """Save the index beside the file at path."""
+
+        self._save_text(path, json.dumps({"size": self.size, "mtime_ns": self.mtime_ns, "index": self._dump()}))
+
+    def _save_text(self, path: str | os.PathLike, text: str) -> None:
+
+        """Write the saved index, through a temporary file so that it never appears part written."""
+
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as file:
+                file.write(text)
+            os.replace(temp, str(path) + self.suffix)
+        except BaseException:
+            os.remove(temp)
+            raise
+
+
+class FormatWriter(ABC):
+
+    """
+    Writer which adds atoms to a file over any number of calls to write(), sending output through
+    a buffered stream so that the whole file is never held in memory. The file is only opened once
+    there's something to put in it, and closing the writer finishes the file.
+
+    Used as a context manager, a writer removes the file it created if an exception is raised
+    before it's closed. Files being appended to are left as they are.
+    """
+
+    def __init__(self, path: str | os.PathLike, append: bool = False):
+        self.path = path
+        self._append = append
+        self._file = None
+        self._started = False
+        self._closed = False
+
+    def __enter__(self) -> FormatWriter:
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @traced
+    def write(self, atoms: Iterable[Atom]) -> None:
+
+        """Add atoms to the end of the file, in batches of up to BATCH_SIZE."""
+
+        if self._closed:
+            raise ValueError("Cannot write to a closed writer")
+        for batch in batched(atoms, BATCH_SIZE):
+            self._write_batch(batch)
+
+    @traced
+    def close(self) -> None:
+
+        """Finish the file and close it. A writer that was given no atoms still creates its file."""
+
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._finish()
+            self._open()
+        finally:
+            if self._file is not None:
+                self._file.close()
+
+    def abort(self) -> None:
+
+        """Close the writer without finishing the file, removing it unless it was being appended to."""
+
+        self._closed = True
+        if self._file is not None:
+            self._file.close()
+            if not self._append:
+                os.remove(self.path)
+
+    @abstractmethod
+    def _write_batch(self, atoms: Sequence[Atom]) -> None:
+
+        """Convert a batch of atoms to this format and add it to the file."""
+
+    def _finish(self) -> None:
+
+        """Add anything that has to come after the last batch."""
+
+    def _open(self) -> TextIO:
+        if self._file is None:
+            # Lines appended to an existing file need separating from its last line
+            self._started = self._append and os.path.exists(self.path) and os.path.getsize(self.path) > 0
+            self._file = open_file(self.path, "a" if self._append else "w", buffering=WRITE_BUFFER)
+        return self._file
+
+    def _write_lines(self, lines: Sequence[str]) -> None:
+
+        """Add lines to the file, separated by newlines but without a trailing newline."""
+
+        if not lines:
+            return
+        file = self._open()
+        if self._started:
+            file.write("\n")
+        file.write("\n".join(lines))
+        self._started = True
+
+
+class _CollectingWriter(FormatWriter):
+
+    """Writer for formats without incremental output, which holds atoms and writes them on close."""
+
+    def __init__(self, fmt: type[Format], path: str | os.PathLike, append: bool = False):
+        if append:
+            raise ValueError(f"{fmt.__name__} cannot append to an existing file")
+        super().__init__(path)
+        self._format = fmt
+        self._atoms = []
+
+    def _write_batch(self, atoms: Sequence[Atom]) -> None:
+        self._atoms.extend(atoms)
+
+    def _finish(self) -> None:
+        self._format.to_file(self._atoms, self.path)
+
+    def _open(self) -> None:
+        return None
\ No newline at end of file
@@ -1,14 +1,69 @@
+from __future__ import annotations
+
 from collections import Counter
+from collections.abc import Collection, Iterable, Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, compress, groupby, repeat
+import mmap
 import os
-from typing import Iterable
+from typing import BinaryIO
 
 from atomflow.components import *
 from atomflow.aspects import *
 from atomflow.atom import Atom
-from atomflow.formats import Format
+from atomflow.formats import (Format, FileBatches, FileIndex, FormatWriter, BATCH_SIZE, PARALLEL_CHUNK, line_ranges,
+                              open_file, recipe_aspects, split_suffix)
+from atomflow.table import AtomTable
 from atomflow.knowledge.codes import POLYMER_CODE_SETS, POLYMER_RESIDUE_CODES
 
 
+READ_CHUNK = 2 ** 22  # Bytes read from a PDB file at a time when searching for atom records
+RECORD_WIDTH = 80
+
+RECORD_TYPES = (b"ATOM  ", b"HETATM")
+MODEL_RECORD = b"MODEL "
+# Single-byte fields are decoded by lookup, which avoids building a new string for every value
+_BYTE_VALUES = tuple(chr(i).strip() for i in range(256))
+
+
+def _cut_column(rows: bytes, count: int, col: slice,
+                width: int = RECORD_WIDTH, keep_spaces: bool = True) -> list[str]:
+
+    """
+    Cut a field out of every row of a block of fixed-width rows. Each byte position of the field is
+    copied out with a single strided slice, into a buffer holding the values separated by NULs,
+    which is then decoded and split in one go. Values keep any padding, unless keep_spaces is False,
+    in which case all spaces are dropped.
+
+    >>> rows = b"AB 1CD 2"
+    >>> assert _cut_column(rows, 2, slice(0, 3), width=4) == ["AB ", "CD "]
+    >>> assert _cut_column(rows, 2, slice(1, 4), width=4, keep_spaces=False) == ["B1", "D2"]
+    """
+
+    start, stop, _ = col.indices(width)
+    size = stop - start
+    if size == 1 and keep_spaces:
+        return list(map(_BYTE_VALUES.__getitem__, rows[start::width]))
+    buffer = bytearray(count * (size + 1))
+    for k in range(size):
+        buffer[k::size + 1] = rows[start + k::width]
+    del buffer[-1]
+    if not keep_spaces:
+        buffer = buffer.replace(b" ", b"")
+    return buffer.decode("latin-1").split("\0")
+
+
+def _model_number(record: bytes) -> int:
+
+    """
+    Serial number of the model begun by a MODEL record.
+
+    >>> assert _model_number(b"MODEL        2") == 2
+    """
+
+    return int(record[6:].split()[0])
+
+
 class PDBFormat(Format):
 
     recipe = {
@@ -60,6 +115,7 @@ class PDBFormat(Format):
         "t_factor": TemperatureFactorComponent,
         "symbol": ElementComponent,
         "charge": FormalChargeComponent,
+        "model": ModelComponent,
     }
 
     _asp_map = {
@@ -85,6 +141,9 @@ class PDBFormat(Format):
         "t_factor": 10,
     }
 
+    # Fields read as numbers, which never contain spaces except as padding
+    _numeric_fields = frozenset(("serial_no", "residue_no", "x", "y", "z", "occupancy", "t_factor"))
+
     _line_template =\
             "{section: <6}{serial_no: >5} {name_field}{alt_loc: >1}"\
             "{residue_name: >3} {strand_id}{residue_no: >4}{ins_code: >1}   "\
@@ -92,15 +151,150 @@ class PDBFormat(Format):
             "{symbol: >2}{charge: <2}"
 
     @classmethod
-    def _extract_data(cls, path) -> dict:
+    def written_aspects(cls) -> set[str]:
+        return recipe_aspects(cls.recipe) | {aspect.name for aspect in cls._asp_map.values()} | {"model"}
+
+    @classmethod
+    def _extract_data(cls, records: Sequence[bytes], fields: Iterable[str] | None = None) -> dict:
+
+        """
+        Decodes ATOM/HETATM records into columns of field values, or only the given fields. Records are
+        laid end to end as fixed-width rows, and each field is then cut out of all of them at once, rather
+        than record by record.
+
+        >>> line = b"ATOM      1  N   MET A   1       1.000   2.000   3.000  1.00 10.00           N"
+        >>> data = PDBFormat._extract_data([line])
+        >>> assert data["atom_name"] == ["N"] and data["y"] == ["2.000"] and data["charge"] == [""]
+        """
+
+        if set(map(len, records)) != {RECORD_WIDTH}:
+            records = [rec[:RECORD_WIDTH].ljust(RECORD_WIDTH) for rec in records]
+        rows = b"".join(records)
+        count = len(records)
+
         data = {}
-        with open(path, "r") as file:
-            lines = (line.strip() for line in file.readlines() if line[:6] in ("ATOM  ", "HETATM"))
-        for line in lines:
-            for field, col in cls._fields.items():
-                data.setdefault(field, []).append(line[col].strip())
+        for field, col in cls._fields.items():
+            if fields is not None and field not in fields:
+                continue
+            if field in cls._numeric_fields:
+                # Padding is dropped from the whole column at once
+                data[field] = _cut_column(rows, count, col, keep_spaces=False)
+            else:
+                # Strings are only stripped once per distinct value
+                values = _cut_column(rows, count, col)
+                stripped = {v: v.strip() for v in set(values)}
+                data[field] = list(map(stripped.__getitem__, values))
         return data
 
+    @classmethod
+    def _read_records(cls, file: BinaryIO) -> Iterator[tuple[int | None, list[bytes]]]:
+
+        """
+        Yields the ATOM/HETATM records of a file, without line endings, searching it a chunk at a time.
+        Records come in runs from the same model, along with its number, or None if the records aren't
+        inside a MODEL record.
+        """
+
+        model = None
+        while chunk := file.read(READ_CHUNK):
+            # Complete the last line, so that no record is split between chunks
+            chunk += file.readline()
+            for model, run in cls._chunk_records(chunk, model):
+                yield model, run
+
+    @staticmethod
+    def _chunk_records(chunk: bytes, model: int | None) -> Iterator[tuple[int | None, list[bytes]]]:
+
+        """
+        Yields the ATOM/HETATM records of a chunk of whole lines, in runs from the same model, given the
+        model in force at the start of the chunk. The last run is always yielded, even if empty, so its
+        model is the one in force at the end of the chunk.
+
+        >>> chunk = b"ATOM      1\\nMODEL        2\\nATOM      2\\n"
+        >>> assert [(m, len(r)) for m, r in PDBFormat._chunk_records(chunk, None)] == [(None, 1), (2, 1)]
+        """
+
+        if MODEL_RECORD not in chunk:
+            yield model, [line for line in chunk.splitlines() if line[:6] in RECORD_TYPES]
+            return
+        run = []
+        for line in chunk.splitlines():
+            record = line[:6]
+            if record in RECORD_TYPES:
+                run.append(line)
+            elif record == MODEL_RECORD:
+                yield model, run
+                model, run = _model_number(line), []
+        yield model, run
+
+    @classmethod
+    def _read_ranges(cls, file: BinaryIO,
+                     ranges: Iterable[tuple[int | None, int, int]]) -> Iterator[tuple[int | None, list[bytes]]]:
+
+        """Yields the ATOM/HETATM records within the given byte ranges of a file, read through a memory map,
+        in runs along with the model of their range."""
+
+        if not ranges:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for model, start, end in ranges:
+                while start < end:
+                    # Ranges are read a chunk at a time, always ending on a line break
+                    stop = mm.find(b"\n", min(start + READ_CHUNK, end) - 1, end) + 1 or end
+                    yield model, [line for line in mm[start:stop].splitlines() if line[:6] in RECORD_TYPES]
+                    start = stop
+
+    @classmethod
+    def _read_batches(cls, file: BinaryIO, batch_size: int,
+                      ranges: Iterable[tuple[int | None, int, int]] | None = None,
+                      where: Sequence[tuple[str, Collection, bool]] = (),
+                      aspects: Collection[str] | None = None) -> Iterator[AtomTable]:
+
+        """Decodes runs of records into tables of up to batch_size atoms. A batch never holds atoms of more
+        than one model, so each model ends with a batch of its own. Records that fail any conditions given
+        as where are left out of their batch, and if aspects are given, only fields giving them are decoded."""
+
+        fields = None if aspects is None else cls._fields_holding(aspects)
+        with file:
+            runs = cls._read_records(file) if ranges is None else cls._read_ranges(file, ranges)
+            batch, batch_model = [], None
+            for model, records in runs:
+                if batch and model != batch_model:
+                    yield from cls._decode(batch, batch_model, where, fields)
+                    batch = []
+                batch_model = model
+                batch += records
+                while len(batch) >= batch_size:
+                    yield from cls._decode(batch[:batch_size], model, where, fields)
+                    del batch[:batch_size]
+            if batch:
+                yield from cls._decode(batch, batch_model, where, fields)
+
+    @classmethod
+    def _decode(cls, records: Sequence[bytes], model: int | None,
+                where: Sequence[tuple[str, Collection, bool]] = (),
+                fields: Iterable[str] | None = None) -> Iterator[AtomTable]:
+
+        """
+        Decodes a batch of records into a table of the given fields, or all of them, after dropping records
+        which fail any of the conditions, judged on just the fields the conditions need. Yields nothing if
+        no records are left.
+
+        >>> atom = b"ATOM      1  CA  ALA A   1       1.000   2.000   3.000  1.00 10.00           C"
+        >>> water = b"HETATM    2  O   HOH A   2       1.000   2.000   3.000  1.00 10.00           O"
+        >>> [table] = PDBFormat._decode([atom, water], None, [("resname", {"HOH"}, False)], ["residue_name"])
+        >>> assert len(table) == 1 and table[0].resname == "ALA" and "x" not in table.columns
+        """
+
+        if where:
+            tested = cls._fields_holding({aspect for aspect, _, _ in where})
+            if tested:
+                flags = AtomTable.rows_passing(cls._extract_data(records, tested), cls._cmp_map, where, missing={""})
+                if flags is not None:
+                    records = list(compress(records, flags))
+        if records:
+            yield cls._atoms_from_data(cls._extract_data(records, fields), model, len(records))
+
     @classmethod
     def _classify_chains(cls, data: dict) -> dict[str, PolymerComponent]:
 
@@ -112,8 +306,8 @@ class PDBFormat(Format):
         """
 
         chains = {}
-        for rec, res, chain in zip(data["section"], data["residue_name"], data["strand_id"]):
-            count = chains.setdefault(chain, Counter())
+        for rec, res, chain_id in zip(data["section"], data["residue_name"], data["strand_id"]):
+            count = chains.setdefault(chain_id, Counter())
             for poly_type, res_codes in POLYMER_CODE_SETS.items():
                 if res in res_codes:
                     count[poly_type] = count.setdefault(poly_type, 0) + 1
@@ -124,31 +318,17 @@ class PDBFormat(Format):
         return {k: PolymerComponent(v.most_common(1)[0][0]) for k, v in chains.items()}
 
     @classmethod
-    def _atoms_from_data(cls, data: dict) -> list[Atom]:
+    def _atoms_from_data(cls, data: dict, model: int | None = None, length: int | None = None) -> AtomTable:
 
         """
-        Composes Atom objects using data extracted from a PDB file.
+        Composes a table of atoms using data extracted from a PDB file, belonging to the given model if
+        the file has more than one. The number of atoms must be given if data may not hold any fields.
         """
 
-        polymer_classes = cls._classify_chains(data)
-
-        atoms = []
-        for i in range(len(data["section"])):
-            cmps = []
-            for field, col in data.items():
-                value = col[i]
-                if not value:
-                    continue
-                if cmp_type := cls._cmp_map.get(field):
-                    cmps.append(cmp_type(value))
-                if data["section"][i] == "HETATM":
-                    continue
-                # For ATOM records, assign polymer type
-                # if field == "strand_id" and value in polymer_classes:
-                #     cmps.append(polymer_classes[value])
-            atoms.append(Atom(*cmps))
-
-        return atoms
+        length = len(data["section"]) if length is None else length
+        if model is not None:
+            data["model"] = [model] * length
+        return AtomTable.from_columns(data, cls._cmp_map, missing={""}, length=length)
 
     @classmethod
     def _atoms_to_dict(cls, atoms: Iterable[Atom]) -> dict:
@@ -174,7 +354,7 @@ class PDBFormat(Format):
 
 
     @classmethod
-    def _dict_to_file(cls, data: dict, path) -> None:
+    def _dict_to_lines(cls, data: dict) -> list[str]:
 
         lines = []
         for i in range(len(data["section"])):
@@ -198,20 +378,237 @@ class PDBFormat(Format):
             line = cls._line_template.format(**values)
             lines.append(line)
 
-        with open(path, "w") as file:
-            file.write("\n".join(lines))
+        return lines
+
+    @classmethod
+    def read_file(cls, path: str | os.PathLike) -> AtomTable:
+
+        return AtomTable.concat(cls.read_iter(path))
+
+    @classmethod
+    def read_iter(cls, path: str | os.PathLike, batch_size: int = BATCH_SIZE,
+                  where: Sequence[tuple[str, Collection, bool]] = (),
+                  aspects: Collection[str] | None = None) -> Iterator[AtomTable]:
+
+        file = open_file(path, "rb")
+        return FileBatches(file, cls._read_batches(file, batch_size, where=where, aspects=aspects))
+
+    @classmethod
+    def read_parallel(cls, path: str | os.PathLike, workers: int | None = None) -> AtomTable:
+
+        """
+        Read a file in full, with parsing split between a pool of worker processes. The file is cut into
+        ranges of whole lines, along with the model in force at the start of each, which workers parse
+        into tables that are joined in order. Compressed files can't be cut, so are read in this process.
+        """
+
+        if split_suffix(path)[1] or workers == 1:
+            return cls.read_file(path)
+
+        with open(path, "rb") as file:
+            if not os.fstat(file.fileno()).st_size:
+                return AtomTable()
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                size = max(1, min(PARALLEL_CHUNK, -(-len(mm) // (workers or os.cpu_count() or 1))))
+                ranges = line_ranges(mm, 0, len(mm), size)
+                models = [None]
+                for start, end in ranges[:-1]:
+                    models.append(cls._model_after(mm, start, end, models[-1]))
+
+        with ProcessPoolExecutor(workers) as pool:
+            parts = pool.map(cls._parse_range, repeat(path), ranges, models)
+            return AtomTable.concat(chain.from_iterable(parts))
+
+    @staticmethod
+    def _model_after(data: bytes | mmap.mmap, start: int, end: int, model: int | None) -> int | None:
+
+        """
+        Model in force at the end of a range of whole lines, given the model at its start.
+
+        >>> assert PDBFormat._model_after(b"MODEL        3\\nATOM\\n", 0, 20, None) == 3
+        """
+
+        found = data.rfind(b"\n" + MODEL_RECORD, max(start - 1, 0), end)
+        if found >= 0:
+            line = found + 1
+        elif start == 0 and data[:len(MODEL_RECORD)] == MODEL_RECORD:
+            line = 0
+        else:
+            return model
+        stop = data.find(b"\n", line, end)
+        return _model_number(data[line:stop if stop >= 0 else end])
+
+    @classmethod
+    def _parse_range(cls, path: str | os.PathLike, span: tuple[int, int], model: int | None) -> list[AtomTable]:
+
+        """Parse the records in a range of a file into a table per run of records from the same model."""
+
+        start, end = span
+        with open(path, "rb") as file:
+            file.seek(start)
+            chunk = file.read(end - start)
+        return [cls._atoms_from_data(cls._extract_data(records), model)
+                for model, records in cls._chunk_records(chunk, model) if records]
+
+    @classmethod
+    def read_models(cls, path: str | os.PathLike) -> Iterator[AtomTable]:
+
+        """
+        Read a file with several models, such as an NMR ensemble or a trajectory, as an iterator over
+        one table per model. Only one model is read into memory at a time. A file without MODEL
+        records is read as a single model.
+        """
+
+        def model_of(batch: AtomTable) -> int | None:
+            column = batch.columns.get("model")
+            return column.gather([0])[0] if column is not None else None
+
+        # Batches never span models, so each model is a run of whole batches
+        for _, batches in groupby(cls.read_iter(path), key=model_of):
+            yield AtomTable.concat(batches)
 
     @classmethod
-    def read_file(cls, path: str | os.PathLike) -> list[Atom]:
+    def read_selection(cls, path: str | os.PathLike, chains: Iterable[str] | None = None,
+                       models: Iterable[int] | None = None, batch_size: int = BATCH_SIZE,
+                       where: Sequence[tuple[str, Collection, bool]] = (),
+                       aspects: Collection[str] | None = None) -> Iterator[AtomTable]:
+
+        """Read only the atoms of the given chains and/or models, using a PDBIndex to find and decode just
+        the lines holding them. The index is saved beside the file as a .idx file, to be reused while the
+        file is unchanged. Compressed files can't be indexed, so are read in full and filtered."""
 
-        data = cls._extract_data(path)
-        return cls._atoms_from_data(data)
+        if split_suffix(path)[1]:
+            return super().read_selection(path, chains, models, batch_size, where, aspects)
+        ranges = PDBIndex.for_file(path, cache=True).ranges(chains, models)
+        file = open(path, "rb")
+        return FileBatches(file, cls._read_batches(file, batch_size, ranges, where, aspects))
 
     @classmethod
     def to_file(cls, atoms: Iterable[Atom], path: str | os.PathLike) -> None:
 
-        data = cls._atoms_to_dict(atoms)
-        cls._dict_to_file(data, path)
+        with cls.writer(path) as writer:
+            writer.write(atoms)
+
+    @classmethod
+    def writer(cls, path: str | os.PathLike, append: bool = False) -> FormatWriter:
+
+        return PDBWriter(path, append)
+
+
+class PDBIndex(FileIndex):
+
+    """
+    Byte ranges of the atom records of each residue in a PDB file, with the model and chain they belong
+    to, found in one scan over a memory map of the file. Atoms which aren't inside a MODEL record have
+    no model, but are selected as model 1.
+    """
+
+    def __init__(self, runs: list[tuple[int | None, str, str, int, int]], size: int = 0, mtime_ns: int = 0):
+        super().__init__(size, mtime_ns)
+        # (model, chain, residue, start, end) for each run of records from the same residue
+        self.runs = runs
+
+    @classmethod
+    def build(cls, path: str | os.PathLike) -> PDBIndex:
+
+        runs = []
+        size, mtime_ns = cls._stamp(path)
+        if not size:
+            return cls(runs, size, mtime_ns)
+
+        with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            model = None
+            key = None  # Model, and chain and residue columns, of the current run
+            start = end = offset = 0
+            for line in iter(mm.readline, b""):
+                record = line[:6]
+                if record in RECORD_TYPES:
+                    residue = line[21:27]
+                    if key is None or residue != key[1] or model != key[0]:
+                        if key is not None:
+                            runs.append(cls._run(key, start, end))
+                        key = (model, residue)
+                        start = offset
+                    end = offset + len(line)
+                elif record == MODEL_RECORD:
+                    model = _model_number(line)
+                offset += len(line)
+            if key is not None:
+                runs.append(cls._run(key, start, end))
+
+        return cls(runs, size, mtime_ns)
+
+    @staticmethod
+    def _run(key: tuple[int | None, bytes], start: int, end: int) -> tuple[int | None, str, str, int, int]:
+        model, residue = key
+        return model, residue[:1].decode().strip(), residue[1:].decode().strip(), start, end
+
+    def _dump(self) -> dict:
+        # Saved column-wise, which is much quicker to save and load than a list per run
+        return dict(zip(("models", "chains", "residues", "starts", "ends"), map(list, zip(*self.runs))))
+
+    @classmethod
+    def _restore(cls, data: dict, size: int, mtime_ns: int) -> PDBIndex:
+        columns = [data.get(k, []) for k in ("models", "chains", "residues", "starts", "ends")]
+        return cls(list(zip(*columns)), size, mtime_ns)
+
+    def ranges(self, chains: Iterable[str] | None = None,
+               models: Iterable[int] | None = None) -> list[tuple[int | None, int, int]]:
+
+        """
+        Byte ranges holding the atoms of the given chains and models, in file order, each with the model
+        it belongs to. Residues that follow one another in the file are merged into one range.
+
+        >>> index = PDBIndex([(1, "A", "1", 0, 81), (1, "A", "2", 81, 162), (1, "B", "1", 162, 243)])
+        >>> assert index.ranges(chains=["A"]) == [(1, 0, 162)]
+        >>> assert index.ranges(models=[2]) == []
+        """
+
+        chains = None if chains is None else set(chains)
+        models = None if models is None else set(models)
+        out = []
+        for model, chain_id, _, start, end in self.runs:
+            if (chains is None or chain_id in chains) and (models is None or (1 if model is None else model) in models):
+                if out and out[-1][2] == start and out[-1][0] == model:
+                    out[-1] = (model, out[-1][1], end)
+                else:
+                    out.append((model, start, end))
+        return out
+
+
+class PDBWriter(FormatWriter):
+
+    """
+    Writes atoms to a PDB file as ATOM/HETATM records, one batch at a time. Every atom in a batch
+    is checked against the format recipe before any of the batch is written. Atoms with a model are
+    written between MODEL and ENDMDL records, starting a new model whenever the model changes.
+    """
+
+    def __init__(self, path: str | os.PathLike, append: bool = False):
+        super().__init__(path, append)
+        self._model = None
+
+    def _write_batch(self, atoms: Sequence[Atom]) -> None:
+        lines = []
+        for model, run in groupby(atoms, key=lambda atom: atom.model if atom.implements(ModelAspect) else None):
+            run_lines = PDBFormat._dict_to_lines(PDBFormat._atoms_to_dict(run))
+            if model != self._model:
+                lines += self._model_lines(model)
+            lines += run_lines
+        self._write_lines(lines)
+
+    def _finish(self) -> None:
+        self._write_lines(self._model_lines(None))
+
+    def _model_lines(self, model: int | None) -> list[str]:
+
+        """Records closing the current model and opening the next, if there are any."""
+
+        lines = ["ENDMDL"] if self._model is not None else []
+        if model is not None:
+            lines.append(f"MODEL     {model: >4}")
+        self._model = model
+        return lines
 
 
 if __name__ == '__main__':
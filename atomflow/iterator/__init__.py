@@ -1,4 +1,8 @@
 from atomflow.iterator.iterator import (
     AtomIterator,
-    read
+    BatchIterator,
+    Pipeline,
+    read,
+    read_many,
+    count_atoms,
 )
\ No newline at end of file
@@ -1,19 +1,202 @@
 from __future__ import annotations
 
+from array import array
 from collections import deque
-from collections.abc import Iterable
-from operator import attrgetter
+from collections.abc import Callable, Collection, Iterable, Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import batched, chain, compress, count, pairwise, repeat
+from operator import attrgetter, ne, not_
 import os
 import pathlib
+from time import perf_counter
 
 from atomflow.atom import Atom
 from atomflow.components import NameComponent, ResidueComponent, IndexComponent
-from atomflow.formats import Format
+from atomflow.formats import ASPECT_DEFAULTS, Format, ParseCache, select, split_suffix
+from atomflow.memory import MemoryTrace, active_trace
+from atomflow.table import AtomTable, StringColumn, TableAtom
 
 
 END = object()
 
 
+class _StageStats:
+
+    """Running counts, time and memory of one stage of an instrumented iterator chain."""
+
+    __slots__ = ("name", "label", "seconds", "atoms", "groups", "peak", "current_bytes", "peak_bytes", "done")
+
+    def __init__(self, name: str, label: str):
+        self.name = name
+        self.label = label
+        self.seconds = 0.0
+        self.atoms = 0
+        self.groups = 0
+        self.peak = 0
+        self.current_bytes = 0
+        self.peak_bytes = 0
+        self.done = False
+
+    def record(self, atoms: int, groups: int, held: int) -> None:
+        self.atoms += atoms
+        self.groups += groups
+        if held > self.peak:
+            self.peak = held
+
+
+class _Profile:
+
+    """
+    Counts and times of each stage of an instrumented iterator chain, in order from the source. Stages
+    pull from the stages before them while they work, so time spent in those calls is taken off, to
+    leave each stage with only its own time, and with a MemoryTrace, its own memory.
+    """
+
+    def __init__(self, hook: Callable[[dict], None] | None = None, memory: MemoryTrace | None = None):
+        self.stages: list[_StageStats] = []
+        self.hook = hook
+        self.memory = memory
+        # Total time of timed calls so far, for calls to tell how much of their own time was nested calls
+        self.nested = 0.0
+
+    def new_stage(self, name: str) -> _StageStats:
+        stats = _StageStats(name, f"stage {len(self.stages)}: {name}")
+        self.stages.append(stats)
+        return stats
+
+    def add(self, stage: AtomIterator) -> AtomIterator:
+
+        """Start counting the output of an iterator, as the next stage of the chain. Batch iterators are
+        counted as they are, while atom-wise iterators are given a _TimedStage to hand out their groups."""
+
+        stats = self.new_stage(type(stage).__name__)
+        stage._profile = self
+        stage._stats = stats
+        if isinstance(stage, BatchIterator):
+            stage._batches = self.count_batches(stage._batches, stats)
+            return stage
+        return _TimedStage(stage)
+
+    def begin(self) -> tuple[float, float, list[int] | None]:
+        frame = None if self.memory is None or not self.memory.active else self.memory._begin()
+        return perf_counter(), self.nested, frame
+
+    def end(self, stats: _StageStats, began: tuple[float, float, list[int] | None]) -> None:
+        start, nested, frame = began
+        elapsed = perf_counter() - start
+        stats.seconds += elapsed - (self.nested - nested)
+        self.nested = nested + elapsed
+        if frame is not None and self.memory.active:
+            current, peak = self.memory._end(frame)
+            stats.current_bytes += current
+            stats.peak_bytes = max(stats.peak_bytes, peak)
+            self.memory.add(stats.label, current, peak)
+
+    def count_groups(self, groups: Iterable[Sequence[Atom]], stats: _StageStats) -> Iterator[Sequence[Atom]]:
+        groups = iter(groups)
+        while True:
+            began = self.begin()
+            group = next(groups, END)
+            self.end(stats, began)
+            if group is END:
+                self.finish(stats)
+                return
+            stats.record(len(group), 1, len(group))
+            yield group
+
+    def count_batches(self, batches: Iterable[tuple], stats: _StageStats) -> Iterator[tuple]:
+        batches = iter(batches)
+        while True:
+            began = self.begin()
+            batch = next(batches, END)
+            self.end(stats, began)
+            if batch is END:
+                self.finish(stats)
+                return
+            _, rows, bounds = batch
+            stats.record(len(rows), len(bounds) - 1, len(rows))
+            yield batch
+
+    def finish(self, stats: _StageStats) -> None:
+        if not stats.done:
+            stats.done = True
+            if self.hook is not None:
+                self.hook(self.report()[self.stages.index(stats)])
+
+    def report(self) -> list[dict]:
+        out = []
+        previous = None
+        for stats in self.stages:
+            out.append({
+                "stage": stats.name,
+                "seconds": stats.seconds,
+                "atoms_in": previous.atoms if previous else None,
+                "atoms_out": stats.atoms,
+                "groups_in": previous.groups if previous else None,
+                "groups_out": stats.groups,
+                "peak_buffer": stats.peak,
+                "atoms_per_second": stats.atoms / stats.seconds if stats.seconds > 0 else None,
+            })
+            if self.memory is not None:
+                out[-1]["current_bytes"] = stats.current_bytes
+                out[-1]["peak_bytes"] = stats.peak_bytes
+            previous = stats
+        return out
+
+
+class _ReadSource:
+
+    """
+    Batches of atoms read from a file by read(). Filters chained straight after read() can be pushed down
+    to the reader, which then leaves out atoms failing them as it parses the file, before their columns are
+    built. Several branches can be chained from the same iterator, so a filter's conditions are only handed
+    to the reader if its branch is the first to take a batch, and only the conditions of that branch. The
+    reader is handed the list of conditions as it's opened, and only looks at it once it starts reading.
+    """
+
+    def __init__(self, open_batches: Callable[[list], Iterator[Sequence[Atom]]]):
+        self.where = []
+        self.started = False
+        self.claimed = False
+        self._batches = open_batches(self.where)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self.started = True
+        return next(self._batches)
+
+    def condition(self, aspect: str, values: Iterable | None, keep: bool) -> tuple[str, frozenset, bool] | None:
+
+        """A condition for the reader to check, or None if it can't be pushed, e.g. as reading has started."""
+
+        if self.started or not isinstance(values, Collection):
+            return None
+        try:
+            return aspect, frozenset(values), keep
+        except TypeError:
+            return None
+
+    def claimed_by(self, where: Sequence[tuple[str, frozenset, bool]], items: Iterator) -> Iterator:
+
+        """Pass on items from a branch of the chain, handing the reader the branch's conditions before the
+        first is taken, unless another branch has claimed the reader, or it has started reading."""
+
+        if not (self.started or self.claimed):
+            self.claimed = True
+            self.where.extend(where)
+        yield from items
+
+    def close(self) -> None:
+
+        """Stop reading, closing the file without reading the rest of it."""
+
+        self.started = True
+        if (close := getattr(self._batches, "close", None)) is not None:
+            close()
+
+
 class AtomIterator:
 
     """
@@ -48,6 +231,15 @@ class AtomIterator:
     >>> assert a_list == [atom_c]
     """
 
+    # Shared by every stage of an instrumented chain, see instrument()
+    _profile = None
+    # Reader of the file this iterator reads straight from, with nothing but filters in between, if any,
+    # and the conditions of those filters
+    _source = None
+    _where = ()
+    # Reader of the file at the start of the chain, if any, through any stages
+    _reader = None
+
     def __init__(self, atom_groups: Iterable[Iterable[Atom]]):
         self._atom_groups = iter(atom_groups)
 
@@ -57,12 +249,98 @@ class AtomIterator:
     def __iter__(self):
         return self
 
+    def instrument(self, hook: Callable[[dict], None] | None = None, memory: bool = False) -> AtomIterator:
+
+        """
+        Count and time the atoms and groups passing through this iterator, what it reads from, and every
+        stage chained from it from now on, including write(). The instrumented iterator is returned, to be
+        read or chained from in place of this one. Uninstrumented iterators aren't slowed down at all.
+        Counts are read with profile(), and a hook, if given, is called with each stage's counts
+        as the stage finishes, e.g. to forward them on to a metrics system. With memory=True, the memory
+        used by each stage is also measured, and recorded to the MemoryTrace that's active.
+
+        >>> atoms = [Atom(NameComponent(n), ResidueComponent(r)) for n, r in ("AX", "BX", "CY")]
+        >>> a_iter = AtomIterator.from_list(atoms).instrument().group_by("resname")
+        >>> assert len(a_iter.to_list()) == 3
+        >>> [(s["stage"], s["groups_in"], s["groups_out"]) for s in a_iter.profile()]
+        [('source', None, 1), ('GroupIterator', 1, 3), ('GroupIterator', 3, 2)]
+        """
+
+        if memory and active_trace() is None:
+            raise ValueError("Memory can only be profiled while a MemoryTrace is active")
+        if self._profile is None:
+            profile = _Profile(hook, active_trace() if memory else None)
+            source = profile.new_stage("source")
+            if isinstance(self, BatchIterator):
+                self._batches = profile.count_batches(self._batches, source)
+            else:
+                self._atom_groups = profile.count_groups(self._atom_groups, source)
+            return profile.add(self)
+        return self
+
+    def profile(self) -> list[dict]:
+
+        """
+        Report of each stage of an instrumented chain, in order from the source, as dicts of:
+            stage: name of the stage, e.g. 'GroupIterator', or 'source' for what the chain reads from
+            seconds: time spent in the stage itself, not counting the stages before it
+            atoms_in, groups_in: atoms and groups taken from the previous stage
+            atoms_out, groups_out: atoms and groups handed out, or written, by the stage
+            peak_buffer: most atoms the stage held at once, in a group or batch it handed out, along
+            with any it had held back
+            atoms_per_second: atoms handed out per second spent in the stage
+            current_bytes, peak_bytes: with memory=True, memory used by the stage, as in MemoryTrace
+        """
+
+        if self._profile is None:
+            raise ValueError("Iterator isn't instrumented, see instrument()")
+        return self._profile.report()
+
+    def _pushed(self, stage: AtomIterator, aspect: str,
+                any_of: None | Iterable, none_of: None | Iterable) -> AtomIterator:
+
+        """
+        Push a filter chained straight after read() down to the file's reader, so that atoms it would drop
+        aren't built at all. Straight after read(), each group is a single atom, so dropping failing atoms
+        early doesn't change the outcome, and the filter itself still runs on the atoms left, e.g. to raise
+        for atoms without the aspect. The reader is only handed the conditions once the filter starts taking
+        atoms, so the iterator it was chained from, and other branches chained from that, are left as they
+        are, unless they're read from after the filter has started.
+        """
+
+        if self._source is None:
+            return stage
+        condition = self._source.condition(str(aspect), none_of if any_of is None else any_of, any_of is not None)
+        if condition is None:
+            return stage
+        stage._source = self._source
+        stage._where = (*self._where, condition)
+        # The conditions are only handed over once this branch starts taking atoms
+        if isinstance(stage, BatchIterator):
+            stage._batches = self._source.claimed_by(stage._where, stage._batches)
+        else:
+            stage._atom_groups = self._source.claimed_by(stage._where, stage._atom_groups)
+        return stage
+
+    def _chained(self, stage: AtomIterator, began: tuple[float, float] | None = None) -> AtomIterator:
+
+        """Carry the reader of the chain's file over to a new stage chained from this iterator, and include
+        the stage in its instrumentation, if it has any. Stages that do their work as they're made, such as
+        collect(), pass when they began it."""
+
+        stage._reader = self._reader
+        if self._profile is not None:
+            stage = self._profile.add(stage)
+            if began is not None:
+                self._profile.end(stage._stats, began)
+        return stage
+
     def group_by(self, aspect: str | None = None) -> GroupIterator:
 
         """Group sequential atoms which share the aspect value. Precede with .collect().sort(aspect) to group
-        all atoms"""
+        all atoms. Atoms without a model, as read from files without MODEL records, are grouped as model 1."""
 
-        return GroupIterator(self, aspect)
+        return self._chained(GroupIterator(self, aspect))
 
     def filter(self, aspect: str,
                any_of: None | Iterable = None, none_of: None | Iterable = None) -> FilterIterator:
@@ -70,7 +348,8 @@ class AtomIterator:
         """Filter atom groups based on the given criteria. If the value of aspect for any one atom in a group matches
         the any_of or none_of conditions, the whole group is included or excluded, respectively."""
 
-        return FilterIterator(self, aspect, any_of, none_of)
+        stage = FilterIterator(self, aspect, any_of, none_of)
+        return self._chained(self._pushed(stage, aspect, any_of, none_of))
 
     @classmethod
     def from_list(cls, atoms: Iterable[Atom]) -> GroupIterator:
@@ -83,13 +362,34 @@ class AtomIterator:
 
         """Create an iterator that returns all atoms in one group."""
 
-        return AtomIterator([tuple(self.to_list())])
+        began = None if self._profile is None else self._profile.begin()
+        return self._chained(AtomIterator([tuple(self.to_list())]), began)
 
     def sort(self, aspect: str) -> SortedIterator:
 
         """Sort each group by the given aspect."""
 
-        return SortedIterator(self, aspect, rev=False)
+        return self._chained(SortedIterator(self, aspect, rev=False))
+
+    def _stop(self) -> None:
+
+        """Close the file the chain reads from, if any, once nothing more is needed from it."""
+
+        if self._reader is not None:
+            self._reader.close()
+
+    def take(self, n: int) -> TakeIterator:
+
+        """Give only the first n groups. Once they've been given, nothing more is taken from the stages before,
+        and the file being read, if any, is closed without reading the rest."""
+
+        return self._chained(TakeIterator(self, n))
+
+    def head(self, n: int) -> AtomIterator:
+
+        """Same as take()."""
+
+        return self.take(n)
 
     def to_list(self) -> list[Atom]:
 
@@ -104,7 +404,8 @@ class AtomIterator:
 
         """
         Writes atoms group-wise to the path. Intended format is inferred from the file
-        extension. Variations of the file name are produced automatically if needed.
+        extension, and output is compressed if it ends in '.gz', '.bz2' or '.xz'. Variations of
+        the file name are produced automatically if needed.
 
         :param path: location for output file, e.g. './data/struct.pdb'
         :param path_fmt: aspects to insert into empty curly brace pairs in path name. Values are
@@ -117,17 +418,19 @@ class AtomIterator:
         """
 
         path = pathlib.Path(path)
-        ext = path.suffix
+        ext = "".join(split_suffix(path))
 
         # Retrieve the correct format
         writer = Format.get_format(ext)
 
         filenames = []
         errors = []
+        stats = None if self._profile is None else self._profile.new_stage("write")
+        began = None if stats is None else self._profile.begin()
 
         for i, group in enumerate(self):
 
-            stem = path.stem
+            stem = path.name[:-len(ext)] if ext else path.name
 
             # Format filename with aspects
             if path_fmt:
@@ -146,12 +449,51 @@ class AtomIterator:
             try:
                 writer.to_file(group, filename)
                 filenames.append(str(filename))
+                if stats is not None:
+                    stats.record(len(group), 1, len(group))
             except Exception as e:
                 errors.append(e)
 
+        if stats is not None:
+            self._profile.end(stats, began)
+            self._profile.finish(stats)
+
         return filenames, errors
 
 
+class _TimedStage(AtomIterator):
+
+    """
+    Stand-in for an atom-wise stage of an instrumented chain, handing out the stage's groups while timing
+    and counting them. Further stages are chained from it as they would be from the stage itself.
+    """
+
+    def __init__(self, stage: AtomIterator):
+        super().__init__(stage)
+        self._stage = stage
+        self._profile = stage._profile
+        self._stats = stage._stats
+        self._source = stage._source
+        self._where = stage._where
+        self._reader = stage._reader
+
+    def __next__(self):
+        profile, stats, stage = self._profile, self._stats, self._stage
+        began = profile.begin()
+        try:
+            group = next(stage)
+        except StopIteration:
+            profile.end(stats, began)
+            profile.finish(stats)
+            raise
+        profile.end(stats, began)
+        size = len(group)
+        # Atoms held back while GroupIterator finds where a group ends count towards its buffer
+        held = size + len(stage._queue) + len(stage._buffer) if isinstance(stage, GroupIterator) else size
+        stats.record(size, 1, held)
+        return group
+
+
 class GroupIterator(AtomIterator):
 
     """
@@ -206,7 +548,7 @@ class GroupIterator(AtomIterator):
             # Get the next atom and its grouping value. If no grouping key was given, use
             # object id as the value so that each atom gets grouped separately.
             atom = self._queue.popleft()
-            value = atom[self._group_by] if self._group_by is not None else id(atom)
+            value = self._value(atom) if self._group_by is not None else id(atom)
 
             # If the atom is the first, or it has the same grouping value as the previous, add
             # it to the buffer
@@ -221,6 +563,17 @@ class GroupIterator(AtomIterator):
                 self._last_value = value
                 return tuple(out)
 
+    def _value(self, atom):
+
+        """Grouping value of an atom, or the aspect's default if the atom has none and it has a default."""
+
+        try:
+            return atom[self._group_by]
+        except AttributeError:
+            if self._group_by in ASPECT_DEFAULTS:
+                return ASPECT_DEFAULTS[self._group_by]
+            raise
+
 
 class FilterIterator(AtomIterator):
 
@@ -294,16 +647,643 @@ class SortedIterator(AtomIterator):
             return tuple(sorted(group, key=self._key_fn, reverse=self._rev))
 
 
-def read(path: str | os.PathLike) -> AtomIterator:
+def _limit(n: int) -> int:
+    if not isinstance(n, int) or n < 0:
+        raise ValueError(f"Number of groups to take must be a whole number, not {n!r}")
+    return n
+
+
+class TakeIterator(AtomIterator):
+
+    """
+    Dispense only the first n groups, without taking any more from the source.
+
+    >>> atom_a = Atom(NameComponent("A"))
+    >>> atom_b = Atom(NameComponent("B"))
+    >>> atom_c = Atom(NameComponent("C"))
+    >>> groups = iter([(atom_a,), (atom_b, atom_c), (atom_c,)])
+    >>> assert list(TakeIterator(groups, 2)) == [(atom_a,), (atom_b, atom_c)]
+    >>> assert next(groups) == (atom_c,)
+    """
+
+    def __init__(self, atom_groups, n: int):
+        super().__init__(atom_groups)
+        self._left = _limit(n)
+
+    def __next__(self):
+        if not self._left:
+            self._stop()
+            raise StopIteration
+        group = next(self._atom_groups)
+        self._left -= 1
+        if not self._left:
+            self._stop()
+        return group
+
+
+class BatchIterator(AtomIterator):
+
+    """
+    Iterator over groups of atoms held in batches. Each batch is a table of atoms, a selection of
+    its rows, and the bounds of the groups within that selection, such that group i is made of
+    the atoms at rows[bounds[i]:bounds[i+1]].
+
+    Stages chained from a BatchIterator work on whole columns of a batch at a time, rather than
+    on one atom at a time, and only pass on the selection of rows, so atom data isn't copied
+    between stages. They give the same groups as the per-atom iterators.
+    >>> atom_a = Atom(NameComponent("A"), ResidueComponent("X"), IndexComponent(3))
+    >>> atom_b = Atom(NameComponent("B"), ResidueComponent("X"), IndexComponent(1))
+    >>> atom_c = Atom(NameComponent("C"), ResidueComponent("Y"), IndexComponent(2))
+    >>> table = AtomTable.from_atoms([atom_a, atom_b, atom_c])
+
+    >>> b_iter = BatchIterator([(table, [2, 0, 1], [0, 2, 3])])
+    >>> assert list(b_iter) == [(atom_c, atom_a), (atom_b,)]
+
+    BatchIterator.from_table() creates an iterator over groups containing individual atoms.
+    >>> b_iter = BatchIterator.from_table(table)
+    >>> assert list(b_iter) == [(atom_a,), (atom_b,), (atom_c,)]
+
+    >>> b_iter = BatchIterator.from_table(table)
+    >>> a_list = b_iter.group_by("resname").filter("name", none_of=["B"]).to_list()
+    >>> assert a_list == [atom_c]
+    """
+
+    def __init__(self, batches: Iterable[tuple[AtomTable, Sequence[int], Sequence[int]]]):
+        super().__init__(())
+        self._batches = iter(batches)
+        self._current = None
+        self._bounds = iter(())
+
+    def __next__(self):
+        while (span := next(self._bounds, None)) is None:
+            table, rows, bounds = next(self._batches)
+            self._current = (table, rows)
+            self._bounds = pairwise(bounds)
+        table, rows = self._current
+        lo, hi = span
+        return tuple(map(TableAtom, repeat(table), rows[lo:hi]))
+
+    @classmethod
+    def from_table(cls, table: AtomTable) -> BatchIterator:
+
+        """Create an iterator over groups containing individual atoms from a table."""
+
+        return cls.from_tables([table])
+
+    @classmethod
+    def from_tables(cls, tables: Iterable[Sequence[Atom]]) -> BatchIterator:
+
+        """Create an iterator over groups containing individual atoms from a series of tables, which
+        are only taken from the iterable as they're needed."""
+
+        return cls(cls._singletons(tables))
+
+    @staticmethod
+    def _singletons(tables: Iterable[Sequence[Atom]]) -> Iterator[tuple[AtomTable, range, range]]:
+        empty = True
+        for table in tables:
+            if not isinstance(table, AtomTable):
+                table = AtomTable.from_atoms(table)
+            if len(table):
+                empty = False
+                yield table, range(len(table)), range(len(table) + 1)
+        # As with AtomIterator.from_list(), no atoms at all still gives one (empty) group
+        if empty:
+            yield AtomTable(), range(0), (0, 0)
+
+    def iter_batches(self) -> Iterator[tuple[AtomTable, Sequence[int], Sequence[int]]]:
+
+        """Yield the remaining batches of atoms, as (table, rows, bounds)."""
+
+        if remaining := list(self._bounds):
+            table, rows = self._current
+            start, end = remaining[0][0], remaining[-1][1]
+            yield table, rows[start:end], [lo - start for lo, _ in remaining] + [end - start]
+        yield from self._batches
+
+    def group_by(self, aspect: str | None = None) -> BatchGroupIterator:
+        return self._chained(BatchGroupIterator(self, aspect))
+
+    def filter(self, aspect: str,
+               any_of: None | Iterable = None, none_of: None | Iterable = None) -> BatchFilterIterator:
+        stage = BatchFilterIterator(self, aspect, any_of, none_of)
+        return self._chained(self._pushed(stage, aspect, any_of, none_of))
+
+    def collect(self) -> BatchIterator:
+        began = None if self._profile is None else self._profile.begin()
+        table, rows = _join([(table, rows) for table, rows, _ in self.iter_batches()])
+        return self._chained(BatchIterator([(table, rows, (0, len(rows)))]), began)
+
+    def sort(self, aspect: str) -> BatchSortedIterator:
+        return self._chained(BatchSortedIterator(self, aspect, rev=False))
+
+    def take(self, n: int) -> BatchTakeIterator:
+        return self._chained(BatchTakeIterator(self, n))
+
+
+def _missing(aspect: str) -> AttributeError:
+    return AttributeError(f"Atom has no data for '{aspect}'")
+
+
+def _join(pieces: list[tuple[AtomTable, Sequence[int]]]) -> tuple[AtomTable, Sequence[int]]:
+
+    """Join selections of rows into one. Rows from different tables are copied into a new table."""
+
+    if len(pieces) == 1:
+        return pieces[0]
+    if len({id(table) for table, _ in pieces}) == 1:
+        return pieces[0][0], array("q", chain.from_iterable(rows for _, rows in pieces))
+    table = AtomTable.concat(table.take(rows) for table, rows in pieces)
+    return table, range(len(table))
+
+
+def _values(table: AtomTable, rows: Sequence[int], aspect: str) -> list:
+
+    """Values of an aspect at the given rows of a table, raising AttributeError if any are missing."""
+
+    column = table.columns.get(aspect)
+    values = [None] * len(rows) if column is None else column.gather(rows)
+    if None in values:
+        raise _missing(aspect)
+    return values
+
+
+def _group_values(table: AtomTable, rows: Sequence[int], aspect: str) -> list:
+
+    """Values of an aspect at the given rows of a table to group by, using the aspect's default where
+    it's missing, if it has one."""
+
+    if aspect not in ASPECT_DEFAULTS:
+        return _values(table, rows, aspect)
+    column = table.columns.get(aspect)
+    default = ASPECT_DEFAULTS[aspect]
+    if column is None:
+        return [default] * len(rows)
+    return [default if v is None else v for v in column.gather(rows)]
+
+
+def _flags(table: AtomTable, rows: Sequence[int], aspect: str, test) -> list[bool | None]:
+
+    """Result of a test on the value of an aspect at the given rows of a table, or None where the
+    value is missing. The test is applied once per distinct value."""
+
+    column = table.columns.get(aspect)
+    if column is None:
+        return [None] * len(rows)
+    if isinstance(column, StringColumn):
+        results = [None] + [test(v) for v in column.values[1:]]
+        return list(map(results.__getitem__, map(column.codes.__getitem__, rows)))
+    cache = {None: None}
+    return [cache[v] if v in cache else cache.setdefault(v, test(v)) for v in column.gather(rows)]
+
+
+class BatchGroupIterator(BatchIterator):
+
+    """
+    Dispense sequential atoms grouped by a given aspect, splitting batches into runs of the same value.
+    >>> atom_a = Atom(NameComponent("A"), ResidueComponent("X"))
+    >>> atom_b = Atom(NameComponent("B"), ResidueComponent("Y"))
+    >>> atom_c = Atom(NameComponent("B"), ResidueComponent("X"))
+    >>> table = AtomTable.from_atoms([atom_a, atom_b, atom_c])
+    >>> g_iter = BatchGroupIterator(BatchIterator.from_table(table), group_by="name")
+    >>> assert list(g_iter) == [(atom_a,), (atom_b, atom_c)]
+
+    Runs which continue from one batch to the next are joined.
+    >>> source = BatchIterator([(table, range(2), range(3)), (table, range(2, 3), range(2))])
+    >>> assert list(BatchGroupIterator(source, group_by="name")) == [(atom_a,), (atom_b, atom_c)]
+    """
+
+    def __init__(self, source: BatchIterator, group_by: str | None = None):
+        super().__init__(self._group(source.iter_batches(), group_by))
+
+    @staticmethod
+    def _group(batches, aspect):
+
+        seen = False
+        pending = []
+        last_value = None
+
+        for table, rows, _ in batches:
+
+            if not len(rows):
+                continue
+            seen = True
+
+            if aspect is None:
+                yield table, rows, range(len(rows) + 1)
+                continue
+
+            values = _group_values(table, rows, aspect)
+            runs = [0, *compress(count(1), map(ne, values, values[1:])), len(values)]
+
+            # The first run continues the pending group if it has the same value
+            if pending and values[0] == last_value:
+                pending.append((table, rows[:runs[1]]))
+                runs = runs[1:]
+                if len(runs) == 1:
+                    continue
+
+            # Otherwise, dispense the pending group, and all complete runs from this batch
+            if pending:
+                group_table, group_rows = _join(pending)
+                yield group_table, group_rows, (0, len(group_rows))
+            start, last_start = runs[0], runs[-2]
+            if last_start > start:
+                yield table, rows[start:last_start], [r - start for r in runs[:-1]]
+            pending = [(table, rows[last_start:])]
+            last_value = values[-1]
+
+        if pending:
+            group_table, group_rows = _join(pending)
+            yield group_table, group_rows, (0, len(group_rows))
+        elif not seen:
+            # As with GroupIterator, a source without atoms gives one empty group
+            yield AtomTable(), range(0), (0, 0)
+
+
+class BatchFilterIterator(BatchIterator):
+
+    """
+    Filter groups of atoms in batches, based on either allowed or disallowed values of an aspect. The
+    condition is checked once for each distinct value in a batch.
+
+    >>> atom_a = Atom(NameComponent("A"))
+    >>> atom_b = Atom(NameComponent("B"))
+    >>> atom_c = Atom(NameComponent("C"))
+    >>> table = AtomTable.from_atoms([atom_a, atom_b, atom_c])
+    >>> f_iter = BatchFilterIterator(BatchIterator.from_table(table), "name", none_of=["B"])
+    >>> assert list(f_iter) == [(atom_a,), (atom_c,)]
+
+    >>> f_iter = BatchFilterIterator(BatchIterator([(table, range(3), [0, 2, 3])]), "name", any_of=["A"])
+    >>> assert list(f_iter) == [(atom_a, atom_b)]
+    """
+
+    def __init__(self, source: BatchIterator, aspect: str,
+                 any_of: None | Iterable = None, none_of: None | Iterable = None):
+
+        aspect = str(aspect)
+
+        if any_of is None:
+            values, keep = none_of, False
+        elif none_of is None:
+            values, keep = any_of, True
+        else:
+            raise ValueError("One of 'any_of' or 'none_of' must be provided")
+
+        super().__init__(self._filter(source.iter_batches(), aspect, values, keep))
+
+    @staticmethod
+    def _filter(batches, aspect, values, keep):
+
+        for table, rows, bounds in batches:
+
+            flags = _flags(table, rows, aspect, lambda v: v in values)
+
+            # Each group is a single atom, so its flag decides whether it's kept
+            if isinstance(bounds, range):
+                if None in flags:
+                    raise _missing(aspect)
+                kept = array("q", compress(rows, flags if keep else map(not_, flags)))
+                if kept:
+                    yield table, kept, range(len(kept) + 1)
+                continue
+
+            kept = array("q")
+            new_bounds = [0]
+            for lo, hi in pairwise(bounds):
+                group = flags[lo:hi]
+                end = group.index(True) if True in group else len(group)
+                # As with FilterIterator, atoms after the first match aren't checked
+                if None in group[:end]:
+                    raise _missing(aspect)
+                if (end < len(group)) is keep:
+                    kept.extend(rows[lo:hi])
+                    new_bounds.append(len(kept))
+            if len(new_bounds) > 1:
+                yield table, kept, new_bounds
+
+
+class BatchSortedIterator(BatchIterator):
+
+    """Sorts the atoms in each group of a batch by the given key.
+
+    >>> atom_a = Atom(NameComponent("A"))
+    >>> atom_b = Atom(NameComponent("B"))
+    >>> atom_c = Atom(NameComponent("C"))
+    >>> atom_d = Atom(NameComponent("D"))
+    >>> table = AtomTable.from_atoms([atom_c, atom_a, atom_b, atom_d])
+    >>> source = BatchIterator([(table, range(4), [0, 2, 4])])
+    >>> assert list(BatchSortedIterator(source, "name")) == [(atom_a, atom_c), (atom_b, atom_d)]
+    """
+
+    def __init__(self, source: BatchIterator, aspect: str, rev=False):
+        super().__init__(self._sort(source.iter_batches(), str(aspect), rev))
+
+    @staticmethod
+    def _sort(batches, aspect, rev):
+
+        for table, rows, bounds in batches:
+
+            keys = _values(table, rows, aspect)
+
+            # Groups of single atoms are already sorted
+            if isinstance(bounds, range):
+                yield table, rows, bounds
+                continue
+
+            order = []
+            for lo, hi in pairwise(bounds):
+                order.extend(sorted(range(lo, hi), key=keys.__getitem__, reverse=rev))
+            yield table, array("q", map(rows.__getitem__, order)), bounds
+
+
+class BatchTakeIterator(BatchIterator):
 
     """
-    Read a file into an iterator of atoms. Format is inferred from file extension.
+    Dispense only the first n groups of batches, cutting short the batch that holds the last of them.
+
+    >>> atom_a = Atom(NameComponent("A"))
+    >>> atom_b = Atom(NameComponent("B"))
+    >>> atom_c = Atom(NameComponent("C"))
+    >>> table = AtomTable.from_atoms([atom_a, atom_b, atom_c])
+    >>> source = BatchIterator([(table, range(3), [0, 2, 3])])
+    >>> assert list(BatchTakeIterator(source, 1)) == [(atom_a, atom_b)]
+    """
+
+    def __init__(self, source: BatchIterator, n: int):
+        super().__init__(self._take(source.iter_batches(), _limit(n)))
+
+    def _take(self, batches, left):
+
+        for table, rows, bounds in batches if left else ():
+            if len(bounds) - 1 < left:
+                left -= len(bounds) - 1
+                yield table, rows, bounds
+                continue
+            # The last groups needed are at hand, so the file can be closed before they're passed on
+            self._stop()
+            yield table, rows[:bounds[left]], bounds[:left + 1]
+            return
+        self._stop()
+
+
+class Pipeline:
+
+    """
+    Recipe of stages to run over atoms, built apart from any source, so that it can be run over many
+    sources, or sent to worker processes. Stages are added with the same methods as on an AtomIterator,
+    each giving a new pipeline, and work such as checking filter conditions is done once, as they're
+    added. Pipelines only hold names and values, so pickle cheaply.
+
+    >>> atom_a = Atom(NameComponent("A"), ResidueComponent("X"))
+    >>> atom_b = Atom(NameComponent("B"), ResidueComponent("X"))
+    >>> atom_c = Atom(NameComponent("C"), ResidueComponent("Y"))
+    >>> pipeline = Pipeline().group_by("resname").filter("name", none_of=["B"])
+    >>> assert pipeline.run(AtomIterator.from_list([atom_a, atom_b, atom_c])).to_list() == [atom_c]
+    >>> pipeline
+    Pipeline().group_by('resname').filter('name', none_of=frozenset({'B'}))
+
+    Running a pipeline on a path reads the file first, passing on any options to read(). Pipelines can
+    be called like functions, so can be given to read_many() to run over each file. Pipelines that end
+    by writing only need the aspects their stages and the output format look at, see aspects(), so only
+    those are read, unless read() is given aspects of its own.
+    """
+
+    def __init__(self, stages: Sequence[tuple[str, tuple, dict]] = ()):
+        self._stages = tuple(stages)
+
+    def __repr__(self):
+        calls = []
+        for name, args, kwargs in self._stages:
+            params = [*map(repr, args), *(f"{k}={v!r}" for k, v in kwargs.items())]
+            calls.append(f".{name}({', '.join(params)})")
+        return "Pipeline()" + "".join(calls)
+
+    def _then(self, name: str, *args, **kwargs) -> Pipeline:
+        if self._stages and self._stages[-1][0] == "write":
+            raise ValueError("No stages can follow write()")
+        return Pipeline(self._stages + ((name, args, kwargs),))
+
+    def group_by(self, aspect: str | None = None) -> Pipeline:
+        return self._then("group_by", *(() if aspect is None else (str(aspect),)))
+
+    def filter(self, aspect: str, any_of: None | Iterable = None, none_of: None | Iterable = None) -> Pipeline:
+        if (any_of is None) == (none_of is None):
+            raise ValueError("One of 'any_of' or 'none_of' must be provided")
+        if any_of is not None:
+            return self._then("filter", str(aspect), any_of=frozenset(any_of))
+        return self._then("filter", str(aspect), none_of=frozenset(none_of))
+
+    def collect(self) -> Pipeline:
+        return self._then("collect")
+
+    def sort(self, aspect: str) -> Pipeline:
+        return self._then("sort", str(aspect))
+
+    def take(self, n: int) -> Pipeline:
+        return self._then("take", _limit(n))
+
+    def head(self, n: int) -> Pipeline:
+        return self.take(n)
+
+    def write(self, path: str | os.PathLike, path_fmt: Iterable[str] | None = None) -> Pipeline:
+
+        """
+        End the pipeline by writing its groups to file, as AtomIterator.write() does, so that running it
+        gives ([paths to outputs], [errors]). The path can hold '{source}', which is replaced by the name
+        of the file the pipeline is run on, without its suffixes.
+        """
+
+        return self._then("write", str(path), *(() if path_fmt is None else (tuple(path_fmt),)))
+
+    def aspects(self) -> set[str] | None:
+
+        """
+        Names of the aspects the pipeline looks at, if it ends by writing to a format whose writer's aspects
+        are known, or None if what the pipeline gives could be looked at in any way.
+
+        >>> sorted(Pipeline().filter("chain", none_of=["B"]).sort("resindex").write("out.fasta").aspects())
+        ['chain', 'resindex', 'resname']
+        """
+
+        if not self._stages or self._stages[-1][0] != "write":
+            return None
+        path, *path_fmt = self._stages[-1][1]
+        aspects = Format.get_format("".join(split_suffix(path))).written_aspects()
+        if aspects is None:
+            return None
+        aspects = {*aspects, *chain.from_iterable(path_fmt)}
+        for stage, args, _ in self._stages[:-1]:
+            # Every other stage but take() takes an aspect as its first argument, if it takes any
+            if args and stage != "take":
+                aspects.add(args[0])
+        return aspects
+
+    def run(self, source: str | os.PathLike | AtomIterator | Iterable[Atom], **options):
+
+        """
+        Run the pipeline over atoms from a source: a path to read, an AtomIterator, or an iterable of atoms.
+        Gives an iterator over the resulting groups, or the outcome of write() if the pipeline ends with it.
+        """
+
+        name = None
+        if isinstance(source, (str, os.PathLike)):
+            path = pathlib.Path(source)
+            name = path.name[:-len("".join(split_suffix(path)))] or path.name
+            if "aspects" not in options:
+                options["aspects"] = self.aspects()
+            atoms = read(path, **options)
+        elif isinstance(source, AtomIterator):
+            atoms = source
+        else:
+            atoms = AtomIterator.from_list(source)
+
+        for stage, args, kwargs in self._stages:
+            if stage == "write" and "{source}" in args[0]:
+                if name is None:
+                    raise ValueError("Only pipelines run on a file can write to a path holding '{source}'")
+                args = (args[0].replace("{source}", name), *args[1:])
+            atoms = getattr(atoms, stage)(*args, **kwargs)
+        return atoms
+
+    __call__ = run
+
+
+def read(path: str | os.PathLike, engine: str = "atom",
+         chains: Iterable[str] | None = None, models: Iterable[int] | None = None,
+         records: Iterable[str] | None = None, cache: ParseCache | None = None,
+         aspects: Iterable[str] | None = None) -> AtomIterator:
+
+    """
+    Read a file into an iterator of atoms. Format is inferred from file extension. The file is
+    opened immediately, but read incrementally as atoms are taken from the iterator. Files
+    compressed with gzip, bzip2 or xz, e.g. '1abc.cif.gz', are decompressed as they're read.
+    Filters chained straight after read() are pushed down to readers that can check them as
+    they parse the file, such as PDB and CIF, so that atoms they'd drop are never built.
+
+    :param path: location of the file to read.
+    :param engine: how stages chained from the iterator are run. 'atom' handles atoms one at a
+    time, while 'vectorized' handles columns of atoms in batches. Both give the same groups.
+    :param chains: only read atoms from these chains.
+    :param models: only read atoms from these models. For formats which keep an index of their
+    files, only the parts of the file holding the chains and models asked for are read.
+    :param records: only read these records, by name, from formats which index their records, e.g.
+    sequences of a fasta file or structures of an archive. Cannot be combined with chains or models.
+    :param cache: a ParseCache to read the file through, which holds on to the parsed file, so that
+    reading it again skips parsing. The whole file is parsed up front, rather than incrementally.
+    :param aspects: names of the aspects that will be looked at, e.g. ['resname', 'resindex', 'chain'] to
+    write sequences. Formats such as PDB and CIF then skip decoding the fields giving atoms any others,
+    which atoms may or may not have. Ignored when reading records or through a cache.
     """
 
     path = pathlib.Path(path)
-    reader = Format.get_format(path.suffix)
-    atoms = reader.read_file(path)
-    return AtomIterator.from_list(atoms)
+    reader = Format.get_format("".join(split_suffix(path)))
+    if aspects is not None:
+        aspects = frozenset(map(str, aspects))
+
+    # The file is read in batches as atoms are taken from the iterator
+    if records is not None:
+        if chains is not None or models is not None:
+            raise ValueError("Records cannot be read by chain or model")
+        if cache is not None:
+            raise ValueError("Records cannot be read through a cache")
+        batches = reader.read_records(path, records)
+    elif cache is not None:
+        batches = select([cache.read(path)], chains, models)
+    elif chains is None and models is None:
+        batches = _ReadSource(lambda where: reader.read_iter(path, where=where, aspects=aspects))
+    else:
+        batches = _ReadSource(lambda where: reader.read_selection(path, chains=chains, models=models, where=where,
+                                                                  aspects=aspects))
+
+    if engine == "atom":
+        a_iter = GroupIterator(batches)
+    elif engine == "vectorized":
+        a_iter = BatchIterator.from_tables(batches)
+    else:
+        raise ValueError(f"Unknown engine '{engine}'")
+    if isinstance(batches, _ReadSource):
+        a_iter._source = a_iter._reader = batches
+    return a_iter
+
+
+def read_many(paths: Iterable[str | os.PathLike], pipeline: Callable[[AtomIterator], object] | None = None,
+              workers: int | None = None, chunksize: int = 16, ordered: bool = True,
+              **options) -> tuple[list[tuple[str, object]], list[Exception]]:
+
+    """
+    Read many files and run a pipeline over each, spread across a pool of worker processes.
+    Paths are handed to workers in chunks, so that short files don't cost a round trip each.
+
+    >>> import tempfile
+    >>> from atomflow.formats import FastaFormat
+    >>> with tempfile.TemporaryDirectory() as folder:
+    ...     paths = [f"{folder}/a.fasta", f"{folder}/b.fasta"]
+    ...     with open(paths[0], "w") as file:
+    ...         _ = file.write(">seq\\nMKV\\n")
+    ...     results, errors = read_many(paths, count_atoms, workers=1)
+    >>> assert results == [(paths[0], 3)] and isinstance(errors[0], FileNotFoundError)
+
+    :param paths: locations of the files to read.
+    :param pipeline: Pipeline, or function, run on the iterator read from each file, e.g. one that filters
+    atoms and writes them out, giving a result to send back. Functions must be picklable, i.e. defined at
+    the top level of a module, as must results. By default, each file's atoms are sent back as an AtomTable.
+    :param workers: number of worker processes, by default one per CPU. With 1, files are read in
+    this process, one after another.
+    :param chunksize: number of paths handed to a worker at a time.
+    :param ordered: give results in the order of paths if True, otherwise as each chunk finishes.
+    :param options: passed on to read() for each file, e.g. engine or chains.
+    :return: ([(path, result)], [errors]), where each error notes the path of the file it came from.
+    """
+
+    pipeline = pipeline or _to_table
+    chunks = list(batched(map(str, paths), chunksize))
+    results = []
+    errors = []
+
+    def gather(outcomes: Iterable[list[tuple[str, object, Exception | None]]]) -> None:
+        for chunk in outcomes:
+            for path, result, error in chunk:
+                if error is None:
+                    results.append((path, result))
+                else:
+                    errors.append(error)
+
+    if workers == 1:
+        gather(_run_chunk(chunk, pipeline, options) for chunk in chunks)
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(_run_chunk, chunk, pipeline, options) for chunk in chunks]
+            gather(future.result() for future in (futures if ordered else as_completed(futures)))
+
+    return results, errors
+
+
+def count_atoms(atoms: AtomIterator) -> int:
+
+    """Count the atoms in an iterator, a pipeline for read_many() that sends back as little as possible."""
+
+    return sum(map(len, atoms))
+
+
+def _to_table(atoms: AtomIterator) -> AtomTable:
+    return AtomTable.from_atoms(atoms.to_list())
+
+
+def _run_chunk(paths: Sequence[str], pipeline: Callable[[AtomIterator], object],
+               options: dict) -> list[tuple[str, object, Exception | None]]:
+
+    """Run a pipeline over each of a chunk of files, in a worker process, keeping errors rather than raising them."""
+
+    outcomes = []
+    for path in paths:
+        try:
+            result = pipeline.run(path, **options) if isinstance(pipeline, Pipeline) else pipeline(read(path, **options))
+            outcomes.append((path, result, None))
+        except Exception as e:
+            e.add_note(f"Reading {path}")
+            outcomes.append((path, None, e))
+    return outcomes
 
 
 if __name__ == '__main__':
@@ -0,0 +1 @@
+from atomflow.memory.memory import MemoryTrace, active_trace, traced
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+import functools
+import tracemalloc
+
+END = object()
+
+# The trace that calls are currently recorded to, if any
+_active: MemoryTrace | None = None
+
+
+class MemoryTrace:
+
+    """
+    Record of the memory used by each Format read and write call, and each stage of iterator chains
+    instrumented with memory=True, while the trace is active. Built on tracemalloc, which is started
+    for the length of the trace unless it's already running, and which slows down code that allocates
+    a lot while it runs. Only one trace can be active at a time.
+
+    Each call is only charged with memory allocated while its own code ran, not that of the calls it
+    made, e.g. a stage pulling atoms from the stage before it, and results are summed by name:
+        current_bytes: bytes allocated and not yet freed by the end of each call. Memory a call hands
+        on, e.g. a group of atoms, stays counted to it, so stages that free what others allocated can
+        come out negative.
+        peak_bytes: most bytes in use above the level at the start of a single call, including those
+        handed back to it by calls it made.
+
+    >>> with MemoryTrace() as trace:
+    ...     with trace.measure("list"):
+    ...         data = [0] * 100_000
+    >>> [(r["name"], r["calls"], r["current_bytes"] >= 800_000) for r in trace.report()]
+    [('list', 1, True)]
+    """
+
+    def __init__(self):
+        self.active = False
+        self.start_bytes = 0
+        self.peak_bytes = 0
+        self.snapshot: tracemalloc.Snapshot | None = None
+        # calls, current bytes and peak bytes of each name, in order of first call
+        self._records: dict[str, list[int]] = {}
+        # Calls underway, innermost last, as [bytes at start, most bytes since, bytes kept by nested calls]
+        self._frames: list[list[int]] = []
+        self._started = False
+
+    def __enter__(self) -> MemoryTrace:
+        global _active
+        if _active is not None:
+            raise ValueError("Another MemoryTrace is already active")
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.start_bytes = self.peak_bytes = tracemalloc.get_traced_memory()[0]
+        self.active = True
+        _active = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        global _active
+        _active = None
+        self.active = False
+        self.peak_bytes = max(self.peak_bytes, tracemalloc.get_traced_memory()[1])
+        self.snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ])
+        if self._started:
+            tracemalloc.stop()
+
+    def _begin(self) -> list[int]:
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak_bytes = max(self.peak_bytes, peak)
+        if self._frames:
+            self._frames[-1][1] = max(self._frames[-1][1], peak)
+        tracemalloc.reset_peak()
+        frame = [current, current, 0]
+        self._frames.append(frame)
+        return frame
+
+    def _end(self, frame: list[int]) -> tuple[int, int]:
+
+        """Finish a call begun with _begin(), giving the bytes its own code kept and its peak."""
+
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak_bytes = max(self.peak_bytes, peak)
+        # The caller carries on from here, so its peak so far is already counted
+        tracemalloc.reset_peak()
+        self._frames.pop()
+        kept = current - frame[0]
+        if self._frames:
+            self._frames[-1][2] += kept
+        return kept - frame[2], max(frame[1], peak) - frame[0]
+
+    def add(self, name: str, current: int, peak: int) -> None:
+        record = self._records.setdefault(name, [0, 0, 0])
+        record[0] += 1
+        record[1] += current
+        record[2] = max(record[2], peak)
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+
+        """Record the memory used by a block of code, under a name, while the trace is active."""
+
+        if not self.active:
+            yield
+            return
+        frame = self._begin()
+        try:
+            yield
+        finally:
+            if self.active:
+                self.add(name, *self._end(frame))
+
+    def _steps(self, name: str, items: Iterator) -> Iterator:
+
+        """Pass on the items of an iterator, recording the memory used to make each."""
+
+        while True:
+            with self.measure(name):
+                item = next(items, END)
+            if item is END:
+                return
+            yield item
+
+    def report(self) -> list[dict]:
+
+        """Memory used under each name, in order of first call, as dicts of name, calls, current_bytes and peak_bytes."""
+
+        return [{"name": name, "calls": calls, "current_bytes": current, "peak_bytes": peak}
+                for name, (calls, current, peak) in self._records.items()]
+
+    def top(self, limit: int = 10) -> list[tuple[str, int, int]]:
+
+        """Lines of code holding the most memory when the trace ended, as (location, bytes, allocations)."""
+
+        if self.snapshot is None:
+            return []
+        return [(str(stat.traceback[0]), stat.size, stat.count)
+                for stat in self.snapshot.statistics("lineno")[:limit]]
+
+    def summary(self, limit: int = 10) -> str:
+
+        """Plain text report of the trace, e.g. to attach to a bug report."""
+
+        width = max([len("name"), *map(len, self._records)])
+        lines = [f"Peak memory: {self.peak_bytes - self.start_bytes:,} bytes above the start of the trace", "",
+                 f"{'name':<{width}}  {'calls':>8}  {'current_bytes':>15}  {'peak_bytes':>15}"]
+        for record in self.report():
+            lines.append(f"{record['name']:<{width}}  {record['calls']:>8}  "
+                         f"{record['current_bytes']:>15,}  {record['peak_bytes']:>15,}")
+        if sites := self.top(limit):
+            lines += ["", "Most memory held at the end of the trace:"]
+            lines += [f"{size:>15,}  {count:>8} allocations  {where}" for where, size, count in sites]
+        return "\n".join(lines)
+
+
+def active_trace() -> MemoryTrace | None:
+
+    """The MemoryTrace currently active, if any."""
+
+    return _active
+
+
+def traced(method: Callable) -> Callable:
+
+    """
+    Wrap a method so that calls made while a MemoryTrace is active are recorded, under the name of the
+    class and method, e.g. 'PDBFormat.read_file'. Iterators it returns have each step recorded under
+    the same name. Outside a trace, the method is called as it is.
+    """
+
+    @functools.wraps(method)
+    def wrapper(owner, *args, **kwargs):
+        trace = _active
+        if trace is None:
+            return method(owner, *args, **kwargs)
+        name = f"{(owner if isinstance(owner, type) else type(owner)).__name__}.{method.__name__}"
+        with trace.measure(name):
+            result = method(owner, *args, **kwargs)
+        if isinstance(result, Iterator):
+            return trace._steps(name, result)
+        return result
+
+    return wrapper
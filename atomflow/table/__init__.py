@@ -0,0 +1,6 @@
+from atomflow.table.table import (
+    AtomTable,
+    NumericColumn,
+    StringColumn,
+    TableAtom,
+)
\ No newline at end of file
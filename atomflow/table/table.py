@@ -0,0 +1,542 @@
+from __future__ import annotations
+
+from array import array
+from collections.abc import Collection, Iterable, Mapping, Sequence
+from itertools import repeat
+
+from atomflow.aspects import Aspect
+from atomflow.atom import Atom
+from atomflow.components import Component
+
+_TYPECODES = {int: "q", float: "d"}
+
+
+def _value_type(cmp_type: type[Component], aspect: str) -> type:
+
+    """Python type of the values a component holds for an aspect, taken from its property annotation."""
+
+    prop = getattr(cmp_type, aspect)
+    return prop.fget.__annotations__.get("return", str)
+
+
+def _new_column(cmp_type: type[Component], aspect: str) -> StringColumn | NumericColumn:
+    kind = _value_type(cmp_type, aspect)
+    if kind in _TYPECODES:
+        return NumericColumn(cmp_type, kind)
+    return StringColumn(cmp_type)
+
+
+class _Encoder(dict):
+
+    """Maps raw values onto dictionary codes of a string column, adding unseen values as they occur."""
+
+    def __init__(self, column: StringColumn, convert, missing: Collection):
+        super().__init__((m, 0) for m in missing)
+        self._column = column
+        self._convert = convert
+
+    def __missing__(self, raw):
+        code = self._column.code(self._convert(raw))
+        self[raw] = code
+        return code
+
+
+class _Verdicts(dict):
+
+    """Caches whether each distinct raw value passes a check, checking values as they first occur."""
+
+    def __init__(self, check):
+        super().__init__()
+        self._check = check
+
+    def __missing__(self, raw):
+        verdict = self[raw] = self._check(raw)
+        return verdict
+
+
+class StringColumn:
+
+    """
+    Dictionary-encoded column of string values. Each row holds a code into a list of distinct
+    values, with code 0 reserved for missing data.
+
+    >>> from atomflow.components import ChainComponent
+    >>> col = StringColumn(ChainComponent)
+    >>> col.extend(["A", "A", "", "B"], missing={""})
+    >>> assert col.to_list() == ["A", "A", None, "B"]
+    >>> assert list(col.codes) == [1, 1, 0, 2]
+    """
+
+    __slots__ = ("component", "codes", "values", "components", "_index")
+
+    kind = str
+
+    def __init__(self, component: type[Component], codes: array | None = None,
+                 values: list | None = None, components: list | None = None):
+        self.component = component
+        self.codes = array("I") if codes is None else codes
+        self.values = [None] if values is None else values
+        self.components = [None] if components is None else components
+        # Built on first use, as columns taken from another share its dictionary until they add to it
+        self._index = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    def code(self, value, cmp: Component | None = None) -> int:
+
+        """Return the code for a value, adding it to the dictionary if it's new."""
+
+        if value is None:
+            return 0
+        if cmp is None:
+            cmp = self.component(value)
+        if self._index is None:
+            self.values = self.values[:]
+            self.components = self.components[:]
+            self._index = {(type(c), v): i for i, (v, c) in enumerate(zip(self.values, self.components)) if i}
+        key = (type(cmp), value)
+        code = self._index.get(key)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.components.append(cmp)
+            self._index[key] = code
+        return code
+
+    def extend(self, raw: Iterable, missing: Collection = (), convert=None) -> None:
+        encoder = _Encoder(self, convert or self.kind, missing)
+        self.codes.extend(map(encoder.__getitem__, raw))
+
+    def extend_column(self, other: StringColumn) -> None:
+        recode = array("I", (self.code(v, c) for v, c in zip(other.values, other.components)))
+        if recode == array("I", range(len(recode))):
+            # Codes mean the same in both columns, e.g. the first column joined onto an empty one
+            self.codes.extend(other.codes)
+        else:
+            self.codes.extend(map(recode.__getitem__, other.codes))
+
+    def pad(self, count: int) -> None:
+        self.codes.frombytes(bytes(count * self.codes.itemsize))
+
+    def get(self, row: int):
+        return self.values[self.codes[row]]
+
+    def component_at(self, row: int) -> Component | None:
+        return self.components[self.codes[row]]
+
+    def take(self, rows: range | Sequence[int]) -> StringColumn:
+        if isinstance(rows, range) and rows.step == 1:
+            codes = self.codes[rows.start:rows.stop]
+        else:
+            codes = array("I", map(self.codes.__getitem__, rows))
+        return StringColumn(self.component, codes, self.values, self.components)
+
+    def to_list(self) -> list:
+        return list(map(self.values.__getitem__, self.codes))
+
+    def gather(self, rows: Iterable[int]) -> list:
+
+        """Values at the given rows, with None for missing values."""
+
+        return list(map(self.values.__getitem__, map(self.codes.__getitem__, rows)))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.codes) * self.codes.itemsize + sum(len(v) for v in self.values[1:])
+
+
+class NumericColumn:
+
+    """
+    Column of int or float values held in a typed array, with an optional mask marking which rows
+    hold data (1) or are missing (0).
+
+    >>> from atomflow.components import CoordXComponent
+    >>> col = NumericColumn(CoordXComponent, float)
+    >>> col.extend(["1.5", "", "2"], missing={""})
+    >>> assert col.to_list() == [1.5, None, 2.0]
+    """
+
+    __slots__ = ("component", "kind", "data", "mask")
+
+    def __init__(self, component: type[Component], kind: type,
+                 data: array | None = None, mask: bytearray | None = None):
+        self.component = component
+        self.kind = kind
+        self.data = array(_TYPECODES[kind]) if data is None else data
+        self.mask = mask
+
+    def __len__(self):
+        return len(self.data)
+
+    def extend(self, raw: Iterable, missing: Collection = (), convert=None) -> None:
+        convert = convert or self.kind
+        raw = raw if isinstance(raw, Sequence) else list(raw)
+        try:
+            new = array(self.data.typecode, map(convert, raw))
+            mask = None
+        except (ValueError, TypeError):
+            # Only fall back to masking rows if there's something missing
+            values = [None if v in missing else convert(v) for v in raw]
+            new = array(self.data.typecode, (0 if v is None else v for v in values))
+            mask = bytearray(v is not None for v in values)
+        self._extend_masked(new, mask)
+
+    def extend_column(self, other: NumericColumn) -> None:
+        self._extend_masked(other.data, other.mask)
+
+    def _extend_masked(self, data: array, mask: bytearray | None) -> None:
+        if mask is not None and self.mask is None:
+            self.mask = bytearray(b"\x01" * len(self.data))
+        if self.mask is not None:
+            self.mask += b"\x01" * len(data) if mask is None else mask
+        self.data.extend(data)
+
+    def pad(self, count: int) -> None:
+        self._extend_masked(array(self.data.typecode, bytes(count * self.data.itemsize)), bytearray(count))
+
+    def get(self, row: int):
+        if self.mask is not None and not self.mask[row]:
+            return None
+        return self.data[row]
+
+    def component_at(self, row: int) -> Component | None:
+        value = self.get(row)
+        return None if value is None else self.component(value)
+
+    def take(self, rows: range | Sequence[int]) -> NumericColumn:
+        if isinstance(rows, range) and rows.step == 1:
+            data = self.data[rows.start:rows.stop]
+            mask = None if self.mask is None else self.mask[rows.start:rows.stop]
+        else:
+            data = array(self.data.typecode, map(self.data.__getitem__, rows))
+            mask = None if self.mask is None else bytearray(map(self.mask.__getitem__, rows))
+        return NumericColumn(self.component, self.kind, data, mask)
+
+    def to_list(self) -> list:
+        if self.mask is None:
+            return self.data.tolist()
+        return [v if m else None for v, m in zip(self.data, self.mask)]
+
+    def gather(self, rows: Iterable[int]) -> list:
+
+        """Values at the given rows, with None for missing values."""
+
+        if self.mask is None:
+            return list(map(self.data.__getitem__, rows))
+        return [self.data[i] if self.mask[i] else None for i in rows]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data) * self.data.itemsize + (0 if self.mask is None else len(self.mask))
+
+
+class AtomTable(Sequence):
+
+    """
+    Columnar store of atom data. Each aspect is held in a single column, numeric aspects as typed
+    arrays and string aspects as dictionary-encoded arrays, rather than as a component per atom.
+
+    Tables are built from columns of raw values, keyed by field, along with a mapping of fields to
+    the components that interpret them. Values in 'missing' are treated as absent.
+    >>> from atomflow.components import NameComponent, IndexComponent, CoordXComponent
+    >>> cmp_map = {"name": NameComponent, "id": IndexComponent, "x": CoordXComponent}
+    >>> data = {"name": ["CA", "CB"], "id": ["1", "2"], "x": ["1.0", ""]}
+    >>> table = AtomTable.from_columns(data, cmp_map, missing={""})
+    >>> assert len(table) == 2
+
+    Indexing returns atoms which are views of a row in the table.
+    >>> atom = table[0]
+    >>> assert atom.name == "CA" and atom["x"] == 1.0
+    >>> assert table[1] == Atom(NameComponent("CB"), IndexComponent(2))
+
+    Tables compare equal to other sequences of the same atoms.
+    >>> assert table == [Atom(NameComponent("CA"), IndexComponent(1), CoordXComponent(1.0)), table[1]]
+    """
+
+    def __init__(self, columns: Mapping[str, StringColumn | NumericColumn] | None = None, length: int = 0):
+        self._columns = dict(columns or {})
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return self.take(range(*item.indices(self._length)))
+        if item < 0:
+            item += self._length
+        if not 0 <= item < self._length:
+            raise IndexError("AtomTable index out of range")
+        return TableAtom(self, item)
+
+    def __iter__(self):
+        return map(TableAtom, repeat(self), range(self._length))
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return f"AtomTable(atoms={self._length}, aspects=[{', '.join(self._columns)}])"
+
+    @property
+    def columns(self) -> Mapping[str, StringColumn | NumericColumn]:
+
+        """Columns of the table, keyed by aspect name."""
+
+        return self._columns
+
+    @property
+    def nbytes(self) -> int:
+
+        """Approximate size of the column data in bytes."""
+
+        return sum(col.nbytes for col in self._columns.values())
+
+    @classmethod
+    def from_columns(cls, data: Mapping[str, Sequence], cmp_map: Mapping[str, type[Component]],
+                     missing: Collection = frozenset(), length: int | None = None) -> AtomTable:
+
+        """
+        Build a table from columns of raw values, e.g. as extracted from a file. Fields are
+        interpreted by the component they map to in cmp_map, and are skipped if they have none.
+        Where several fields map to the same aspect, later fields take precedence in rows where
+        they aren't missing. The number of rows is taken from the columns, unless given as length.
+        """
+
+        if length is None:
+            length = len(next(iter(data.values()), ()))
+        table = cls(length=length)
+        for field, raw in data.items():
+            if cmp_type := cmp_map.get(field):
+                table._add_field(cmp_type, raw, missing)
+        return table
+
+    @staticmethod
+    def rows_passing(data: Mapping[str, Sequence], cmp_map: Mapping[str, type[Component]],
+                     where: Iterable[tuple[str, Collection, bool]],
+                     missing: Collection = frozenset()) -> list[bool] | None:
+
+        """
+        Check columns of raw values, as they'd be given to from_columns(), against conditions on the values
+        rows would have for aspects, as (aspect, values, keep). A row passes if its value is in values when
+        keep is True, or isn't when keep is False, and also if its value can't be told, e.g. it's missing.
+        Readers can use this to drop rows before a table is built from them. Each distinct raw value is
+        only checked once.
+
+        :return: whether each row passes, or None if they all do.
+
+        >>> from atomflow.components import ResidueComponent
+        >>> data = {"res": ["ALA", "HOH", "", "HOH"]}
+        >>> AtomTable.rows_passing(data, {"res": ResidueComponent}, [("resname", {"HOH"}, False)], {""})
+        [True, False, True, False]
+        """
+
+        flags = None
+        for aspect, values, keep in where:
+            sources = [(raw, cmp_type) for field, raw in data.items()
+                       if (cmp_type := cmp_map.get(field)) and any(a.name == aspect for a in cmp_type.aspects)]
+            if not sources:
+                continue
+            cmp_types = [cmp_type for _, cmp_type in sources]
+
+            def passes(raws: tuple) -> bool:
+                # As in from_columns(), later fields take precedence where they aren't missing
+                value = None
+                for raw, cmp_type in zip(raws, cmp_types):
+                    if raw in missing:
+                        continue
+                    try:
+                        if len(cmp_type.aspects) == 1:
+                            value = _value_type(cmp_type, aspect)(raw)
+                        else:
+                            value = getattr(cmp_type(raw), aspect)
+                    except ValueError:
+                        # Left for building the table to complain about
+                        return True
+                return value is None or (value in values) is keep
+
+            if len(sources) == 1:
+                verdicts = _Verdicts(lambda raw: passes((raw,)))
+                checked = list(map(verdicts.__getitem__, sources[0][0]))
+            else:
+                verdicts = _Verdicts(passes)
+                checked = list(map(verdicts.__getitem__, zip(*(raw for raw, _ in sources))))
+            flags = checked if flags is None else [a and b for a, b in zip(flags, checked)]
+
+        if flags is None or all(flags):
+            return None
+        return flags
+
+    @classmethod
+    def from_atoms(cls, atoms: Iterable[Atom]) -> AtomTable:
+
+        """Build a table from any iterable of atoms."""
+
+        atoms = atoms if isinstance(atoms, Sequence) else list(atoms)
+
+        # Atoms which are all unmodified views of the same table can be taken directly from it
+        if atoms and all(type(a) is TableAtom and a._own is None for a in atoms):
+            source = atoms[0]._table
+            if all(a._table is source for a in atoms):
+                return source.take([a._row for a in atoms])
+
+        values: dict[str, list] = {}
+        cmps: dict[str, list] = {}
+        for i, atom in enumerate(atoms):
+            for asp, asp_cmps in atom._components.items():
+                if asp.name not in values:
+                    values[asp.name] = [None] * i
+                    cmps[asp.name] = [None] * i
+                values[asp.name].append(getattr(asp_cmps[-1], asp.name))
+                cmps[asp.name].append(asp_cmps[-1])
+            for name, col in values.items():
+                if len(col) == i:
+                    col.append(None)
+                    cmps[name].append(None)
+
+        table = cls(length=len(atoms))
+        for name, col in values.items():
+            cmp_type = type(next(c for c in cmps[name] if c is not None))
+            column = _new_column(cmp_type, name)
+            if isinstance(column, StringColumn):
+                column.codes.extend(map(column.code, col, cmps[name]))
+            else:
+                column.extend(col, missing={None})
+            table._columns[name] = column
+        return table
+
+    @classmethod
+    def concat(cls, tables: Iterable[AtomTable]) -> AtomTable:
+
+        """Join tables end to end into a new table."""
+
+        out = cls()
+        for table in tables:
+            out.extend(table)
+        return out
+
+    def extend(self, other: AtomTable) -> None:
+
+        """Append the rows of another table to this one."""
+
+        for name, column in self._columns.items():
+            if name not in other._columns:
+                column.pad(len(other))
+        for name, column in other._columns.items():
+            if name not in self._columns:
+                self._columns[name] = _new_column(column.component, name)
+                self._columns[name].pad(self._length)
+            self._columns[name].extend_column(column)
+        self._length += len(other)
+
+    def take(self, rows: range | Sequence[int]) -> AtomTable:
+
+        """Return a new table made from the given rows, in order."""
+
+        columns = {name: col.take(rows) for name, col in self._columns.items()}
+        return AtomTable(columns, len(rows))
+
+    def _add_field(self, cmp_type: type[Component], raw: Sequence, missing: Collection) -> None:
+        if len(cmp_type.aspects) > 1:
+            # Components implementing several aspects are built once per distinct raw value
+            built = dict.fromkeys(missing)
+            cmps = [built[v] if v in built else built.setdefault(v, cmp_type(v)) for v in raw]
+        for asp in cmp_type.aspects:
+            column = _new_column(cmp_type, asp.name)
+            if len(cmp_type.aspects) == 1:
+                column.extend(raw, missing)
+            elif isinstance(column, StringColumn):
+                column.codes.extend(column.code(getattr(c, asp.name), c) if c else 0 for c in cmps)
+            else:
+                column.extend([getattr(c, asp.name) if c else None for c in cmps], missing={None})
+            if asp.name in self._columns:
+                column = self._overlay(self._columns[asp.name], column)
+            self._columns[asp.name] = column
+
+    @staticmethod
+    def _overlay(under, over):
+
+        """Merge two columns for the same aspect, preferring values from 'over' where they exist."""
+
+        column = _new_column(over.component, next(a.name for a in over.component.aspects))
+        if isinstance(column, StringColumn):
+            pairs = zip(under.codes, over.codes)
+            column.codes.extend(
+                column.code(over.values[o], over.components[o]) if o else
+                column.code(under.values[u], under.components[u])
+                for u, o in pairs
+            )
+        else:
+            values = [u if o is None else o for u, o in zip(under.to_list(), over.to_list())]
+            column.extend(values, missing={None})
+        return column
+
+    def _row_components(self, row: int) -> dict[Aspect, list[Component]]:
+        cmps = {}
+        for column in self._columns.values():
+            if (cmp := column.component_at(row)) is not None:
+                cmps[id(cmp)] = cmp
+        out = {}
+        for cmp in cmps.values():
+            for asp in cmp.aspects:
+                out.setdefault(asp, []).append(cmp)
+        return out
+
+
+class TableAtom(Atom):
+
+    """
+    An atom which is a view of one row of an AtomTable. Data is read from the table's columns on
+    access, and components are only built if they're asked for, or if the atom is modified, at
+    which point the atom holds its own copy of its data.
+
+    >>> from atomflow.components import NameComponent, IndexComponent
+    >>> table = AtomTable.from_columns({"name": ["CA"]}, {"name": NameComponent})
+    >>> atom = table[0]
+    >>> assert atom.name == "CA" and atom.implements("name") and not atom.implements("index")
+    >>> atom.add(IndexComponent(4))
+    >>> assert atom == Atom(NameComponent("CA"), IndexComponent(4))
+    """
+
+    __slots__ = ("_table", "_row", "_own")
+
+    def __init__(self, table: AtomTable, row: int):
+        self._table = table
+        self._row = row
+        self._own = None
+
+    @property
+    def _components(self) -> dict[Aspect, list[Component]]:
+        if self._own is None:
+            return self._table._row_components(self._row)
+        return self._own
+
+    def __getattr__(self, item):
+        if self._own is not None:
+            return super().__getattr__(item)
+        if (column := self._table._columns.get(item)) is not None:
+            if (value := column.get(self._row)) is not None:
+                return value
+        raise AttributeError(f"Atom has no data for '{item}'")
+
+    def __format__(self, format_spec):
+        if self._own is None and format_spec in ("", "s"):
+            items = ((name, col.get(self._row)) for name, col in self._table._columns.items())
+            vals = [f"{name}={value}" for name, value in sorted(items) if value is not None]
+            return f"Atom({', '.join(vals)})"
+        return super().__format__(format_spec)
+
+    def add(self, cmp: Component) -> None:
+        if self._own is None:
+            self._own = self._table._row_components(self._row)
+        super().add(cmp)
+
+    def implements(self, item: Aspect | str | Mapping) -> bool:
+        if self._own is None and isinstance(item, (Aspect, str)):
+            column = self._table._columns.get(item)
+            return column is not None and column.get(self._row) is not None
+        return super().implements(item)
@@ -0,0 +1,49 @@
+"""
+Compare reading a structure file plain and through each supported compression.
+
+Usage: python benchmarks/compression.py <structure file> [repeats]
+
+The file is copied into a temporary folder as-is and compressed with each of gzip, bzip2 and xz,
+then each copy is read in full with read_file(). The best of the repeated timings is reported.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from atomflow.formats import Format, COMPRESSIONS, split_suffix
+
+
+def time_read(path: str, repeats: int) -> tuple[int, float]:
+    fmt = Format.get_format("".join(split_suffix(path)))
+    best = float("inf")
+    count = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        count = len(fmt.read_file(path))
+        best = min(best, time.perf_counter() - start)
+    return count, best
+
+
+def main(source: str, repeats: int = 3) -> None:
+    with tempfile.TemporaryDirectory() as folder:
+        plain = os.path.join(folder, os.path.basename(source))
+        shutil.copyfile(source, plain)
+        paths = {"plain": plain}
+        for suffix, module in COMPRESSIONS.items():
+            paths[suffix] = plain + suffix
+            with open(plain, "rb") as src, module.open(paths[suffix], "wb") as dst:
+                shutil.copyfileobj(src, dst)
+
+        _, baseline = time_read(plain, repeats)
+        print(f"{'file':<8}{'MB':>10}{'atoms':>12}{'seconds':>10}{'vs plain':>10}")
+        for name, path in paths.items():
+            count, seconds = time_read(path, repeats)
+            size = os.path.getsize(path) / 2 ** 20
+            print(f"{name:<8}{size:>10.1f}{count:>12}{seconds:>10.2f}{seconds / baseline:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], *map(int, sys.argv[2:3]))
@@ -0,0 +1,332 @@
+"""
+Benchmark reading, writing and iterating over synthetic structures of increasing size.
+
+Usage: python benchmarks/suite.py [--sizes 1000 10000 ...] [--chains 5] [--models 1]
+                                  [--mix protein=0.6,dna=0.2,water=0.2] [--formats .pdb .cif .fasta]
+                                  [--output results.json] [--compare previous.json]
+
+A structure is generated for each size, from the same seed so that runs are comparable, and written
+to each format. Each file is then read in full, read in batches, and run through a chain of iterator
+stages with each engine, with every stage timed through AtomIterator.instrument(). Each measurement
+runs in a fresh process, so that its peak RSS is its own. Results are printed as they come and saved
+as JSON, which --compare reads back to show how a run differs from an earlier one.
+
+Sizes up to 10M atoms can be asked for, though the largest take a long time to write as CIF.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from importlib import metadata
+import json
+import math
+import multiprocessing
+import os
+import pathlib
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Iterator, Mapping
+
+from atomflow.components import *
+from atomflow.formats import AFBFormat, BATCH_SIZE, FastaFormat, Format
+from atomflow.iterator import read
+from atomflow.table import AtomTable
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, where peak RSS isn't reported
+    resource = None
+
+BACKBONE = ("P", "OP1", "OP2", "O5'", "C5'", "C4'", "O4'", "C3'", "O3'", "C2'", "C1'")
+
+# Residues of each kind of chain, by the names of their atoms
+RESIDUES = {
+    "protein": {
+        "GLY": ("N", "CA", "C", "O"),
+        "ALA": ("N", "CA", "C", "O", "CB"),
+        "SER": ("N", "CA", "C", "O", "CB", "OG"),
+        "LEU": ("N", "CA", "C", "O", "CB", "CG", "CD1", "CD2"),
+        "LYS": ("N", "CA", "C", "O", "CB", "CG", "CD", "CE", "NZ"),
+        "PHE": ("N", "CA", "C", "O", "CB", "CG", "CD1", "CD2", "CE1", "CE2", "CZ"),
+    },
+    "dna": {
+        "DA": BACKBONE + ("N9", "C8", "N7", "C5", "C6", "N6", "N1", "C2", "N3", "C4"),
+        "DC": BACKBONE + ("N1", "C2", "O2", "N3", "C4", "N4", "C5", "C6"),
+        "DG": BACKBONE + ("N9", "C8", "N7", "C5", "C6", "O6", "N1", "C2", "N2", "N3", "C4"),
+        "DT": BACKBONE + ("N1", "C2", "O2", "N3", "C4", "O4", "C5", "C7", "C6"),
+    },
+    "water": {
+        "HOH": ("O",),
+    },
+}
+
+CHAIN_IDS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+
+CMP_MAP = {
+    "section": SectionComponent,
+    "serial": IndexComponent,
+    "name": NameComponent,
+    "resname": ResidueComponent,
+    "chain": ChainComponent,
+    "resindex": ResIndexComponent,
+    "x": CoordXComponent,
+    "y": CoordYComponent,
+    "z": CoordZComponent,
+    "occupancy": OccupancyComponent,
+    "bfactor": TemperatureFactorComponent,
+    "element": ElementComponent,
+    "model": ModelComponent,
+}
+
+BOX = 500.0  # Walks turn back at this distance from the origin, to keep coordinates within PDB columns
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+ENGINES = ("atom", "vectorized")
+
+
+def chain_kinds(chains: int, mix: Mapping[str, float]) -> list[str]:
+
+    """Kind of each chain, with chains shared between kinds by their weight in the mix, largest first."""
+
+    total = sum(mix.values())
+    shares = {kind: chains * weight / total for kind, weight in mix.items()}
+    counts = {kind: math.floor(share) for kind, share in shares.items()}
+    for kind in sorted(shares, key=lambda k: counts[k] - shares[k])[:chains - sum(counts.values())]:
+        counts[kind] += 1
+    return [kind for kind in sorted(counts, key=counts.get, reverse=True) for _ in range(counts[kind])]
+
+
+def generate(atoms: int, chains: int = 4, models: int = 1, mix: Mapping[str, float] | None = None,
+             seed: int = 0, batch_size: int = BATCH_SIZE) -> Iterator[AtomTable]:
+
+    """
+    Generate a structure of the given number of atoms, as batches of up to batch_size atoms. The same
+    arguments always give the same structure. Atoms are shared evenly between models and chains, and
+    chains are made of residues picked at random from those of their kind, placed along a random walk.
+    Every model has the same residues, with atoms moved a little in each.
+
+    Serial numbers wrap at 99999, and residue numbers at 9999, as in large PDB files, so that files
+    of any size can be written in every format.
+    """
+
+    kinds = chain_kinds(chains, mix or {"protein": 1.0})
+    data = {field: [] for field in CMP_MAP}
+    serial = 0
+
+    for model in range(1, models + 1):
+        rng = random.Random(seed)
+        jitter = random.Random(seed * 1000 + model)
+        in_model = atoms // models + (model <= atoms % models)
+
+        for number, kind in enumerate(kinds):
+            templates = sorted(RESIDUES[kind].items())
+            section = "HETATM" if kind == "water" else "ATOM"
+            remaining = in_model // chains + (number < in_model % chains)
+            position = [(number % 10) * 50.0 - 250.0, 0.0, 0.0]
+            residue = 0
+
+            while remaining > 0:
+                resname, names = rng.choice(templates)
+                residue += 1
+                for axis in range(3):
+                    step = rng.uniform(-2.2, 2.2) if kind != "water" else rng.uniform(-10, 10)
+                    position[axis] += step if abs(position[axis] + step) <= BOX else -step
+
+                for name in names[:remaining]:
+                    serial += 1
+                    coords = [round(p + rng.uniform(-1.5, 1.5) + jitter.uniform(-0.2, 0.2), 3) for p in position]
+                    row = (section, (serial - 1) % 99999 + 1, name, resname, CHAIN_IDS[number % len(CHAIN_IDS)],
+                           (residue - 1) % 9999 + 1, *coords, 1.0, round(rng.uniform(5, 80), 2), name[0], model)
+                    for column, value in zip(data.values(), row):
+                        column.append(value)
+
+                    if len(data["serial"]) == batch_size:
+                        yield _to_table(data, models)
+                        data = {field: [] for field in CMP_MAP}
+                remaining -= len(names)
+
+    if data["serial"]:
+        yield _to_table(data, models)
+
+
+def _to_table(data: dict[str, list], models: int) -> AtomTable:
+    if models == 1:
+        # Single model structures are written without model numbers by formats which don't need them
+        data = {field: values for field, values in data.items() if field != "model"}
+    return AtomTable.from_columns(data, CMP_MAP)
+
+
+def peak_rss() -> int | None:
+
+    """Peak resident memory of this process in bytes."""
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_task(task: str, path: str, source: str, engine: str | None = None) -> dict:
+
+    """
+    Time a task on a file, returning its time, atoms handled and peak RSS, and for 'stages', the profile
+    of each stage. Run in a fresh process for each measurement.
+    """
+
+    fmt = Format.get_format(pathlib.Path(path).suffix)
+    profile = None
+
+    if task == "write":
+        table = AFBFormat.read_file(source)
+        if fmt is FastaFormat:
+            # Fasta files only hold the sequences of polymers, so waters are left out
+            resnames = table.columns["resname"].gather(range(len(table)))
+            table = table.take([row for row, name in enumerate(resnames) if name != "HOH"])
+        start = time.perf_counter()
+        fmt.to_file(table, path)
+        atoms = len(table)
+    elif task == "read":
+        start = time.perf_counter()
+        atoms = len(fmt.read_file(path))
+    elif task == "read_iter":
+        start = time.perf_counter()
+        atoms = sum(map(len, fmt.read_iter(path)))
+    elif task == "stages":
+        out = str(pathlib.Path(path).with_stem("out"))
+        start = time.perf_counter()
+        a_iter = (read(path, engine=engine).instrument()
+                  .filter("resname", none_of=["HOH"]).group_by("chain").sort("resindex").collect())
+        a_iter.write(out)
+        profile = a_iter.profile()
+        atoms = profile[0]["atoms_out"]
+    else:
+        raise ValueError(f"Unknown task '{task}'")
+
+    return {"seconds": time.perf_counter() - start, "atoms": atoms, "peak_rss_bytes": peak_rss(), "profile": profile}
+
+
+def measure(pool: ProcessPoolExecutor, repeats: int, *args) -> dict:
+
+    """Best of several runs of a task, by time."""
+
+    return min((pool.submit(run_task, *args).result() for _ in range(repeats)), key=lambda r: r["seconds"])
+
+
+def rows_of(size: int, suffix: str, task: str, engine: str | None, outcome: dict, file_bytes: int) -> list[dict]:
+
+    """Result rows of a measurement, with one for each stage of a 'stages' task."""
+
+    common = {"size": size, "format": suffix, "task": task, "engine": engine, "file_bytes": file_bytes,
+              "peak_rss_bytes": outcome["peak_rss_bytes"]}
+    if outcome["profile"] is None:
+        seconds = outcome["seconds"]
+        return [common | {"stage": None, "atoms": outcome["atoms"], "seconds": seconds,
+                          "atoms_per_second": outcome["atoms"] / seconds if seconds else None}]
+    rows = [common | {"stage": "total", "atoms": outcome["atoms"], "seconds": outcome["seconds"],
+                      "atoms_per_second": outcome["atoms"] / outcome["seconds"] if outcome["seconds"] else None}]
+    for position, stage in enumerate(outcome["profile"]):
+        rows.append(common | {"stage": f"{position} {stage['stage']}", "atoms": stage["atoms_out"],
+                              "seconds": stage["seconds"], "atoms_per_second": stage["atoms_per_second"]})
+    return rows
+
+
+def key_of(row: dict) -> tuple:
+    return row["size"], row["format"], row["task"], row["engine"], row["stage"]
+
+
+def describe(row: dict, baseline: dict[tuple, dict]) -> str:
+    task = "/".join(filter(None, (row["task"], row["engine"], row["stage"])))
+    speed = f"{row['atoms_per_second']:>14,.0f}" if row["atoms_per_second"] else f"{'-':>14}"
+    rss = f"{row['peak_rss_bytes'] / 2 ** 20:>10.1f}" if row["peak_rss_bytes"] else f"{'-':>10}"
+    line = f"{row['size']:>10,}  {row['format']:<7}{task:<40}{row['seconds']:>10.3f}{speed}{rss}"
+    if (old := baseline.get(key_of(row))) and old["seconds"]:
+        line += f"{row['seconds'] / old['seconds']:>9.2f}x"
+    return line
+
+
+def environment() -> dict:
+
+    """Details of the machine and code a run was made on, to tell runs apart when comparing them."""
+
+    try:
+        version = metadata.version("atomflow")
+    except metadata.PackageNotFoundError:
+        version = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=pathlib.Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "atomflow": version,
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in RESIDUES:
+            raise argparse.ArgumentTypeError(f"Unknown kind of chain '{kind}', expected one of {list(RESIDUES)}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="atoms in each structure")
+    parser.add_argument("--chains", type=int, default=5)
+    parser.add_argument("--models", type=int, default=1)
+    parser.add_argument("--mix", type=parse_mix, default={"protein": 0.6, "dna": 0.2, "water": 0.2},
+                        help="weights of each kind of chain, e.g. protein=0.8,dna=0.1,water=0.1")
+    parser.add_argument("--formats", nargs="+", default=[".pdb", ".cif", ".fasta"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=1, help="runs of each measurement, of which the best is kept")
+    parser.add_argument("--output", default="benchmark.json", help="where to save results")
+    parser.add_argument("--compare", help="results of an earlier run, to compare times against")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = {key_of(row): row for row in json.load(file)["results"]}
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    print(f"{'atoms':>10}  {'format':<7}{'task':<40}{'seconds':>10}{'atoms/s':>14}{'RSS MB':>10}"
+          + (f"{'vs before':>10}" if baseline else ""))
+
+    with (tempfile.TemporaryDirectory() as folder,
+          ProcessPoolExecutor(1, mp_context=context, max_tasks_per_child=1) as pool):
+        for size in args.sizes:
+            source = os.path.join(folder, f"{size}.afb")
+            AFBFormat.to_file(AtomTable.concat(generate(size, args.chains, args.models, args.mix, args.seed)), source)
+
+            for suffix in args.formats:
+                path = os.path.join(folder, f"{size}{suffix}")
+                tasks = [("write", None), ("read", None), ("read_iter", None)]
+                tasks += [("stages", engine) for engine in ENGINES]
+                for task, engine in tasks:
+                    outcome = measure(pool, args.repeats, task, path, source, engine)
+                    for row in rows_of(size, suffix, task, engine, outcome, os.path.getsize(path)):
+                        results.append(row)
+                        print(describe(row, baseline), flush=True)
+
+            os.remove(source)
+
+    config = {field: getattr(args, field) for field in ("sizes", "chains", "models", "mix", "formats", "seed", "repeats")}
+    with open(args.output, "w") as file:
+        json.dump({"environment": environment(), "config": config, "results": results}, file, indent=1)
+    print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
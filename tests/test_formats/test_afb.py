@@ -0,0 +1,82 @@
+import os
+import pathlib
+
+import pytest
+
+from atomflow.atom import Atom
+from atomflow.components import *
+from atomflow.formats import AFBFormat, PDBFormat
+from atomflow.iterator import read
+from atomflow.table import AtomTable
+
+TEST_FOLDER = pathlib.Path("tests/test_formats")
+
+
+@pytest.fixture
+def test_atoms() -> list[Atom]:
+
+    return [
+        Atom(IndexComponent(1), NameComponent("CA"), AAResidueComponent("MET"), ChainComponent("A"),
+             CoordXComponent(1.5), ModelComponent(1)),
+        Atom(IndexComponent(2), NameComponent("P"), DNAResidueComponent("DA"), ChainComponent("B"),
+             CoordXComponent(-2.25)),
+        Atom(IndexComponent(3), ResidueComponent("HOH"), ElementComponent("O")),
+    ]
+
+
+@pytest.mark.parametrize("suffix", [".afb", ".afb.gz"])
+def test_afb_round_trip(test_atoms, suffix):
+
+    """Atoms written to .afb are read back identically, with the same components and missing data."""
+
+    filename = TEST_FOLDER / f"test{suffix}"
+
+    try:
+        AFBFormat.to_file(test_atoms, filename)
+        table = AFBFormat.read_file(filename)
+    finally:
+        os.remove(filename)
+
+    assert isinstance(table, AtomTable)
+    assert table == test_atoms
+    assert table[0].res_olc == "M" and table[1].polymer == "dna"
+    assert not table[2].implements("x") and not table[1].implements("model")
+
+
+def test_afb_cache_of_pdb():
+
+    """A parsed structure can be cached as .afb through the iterator, and read from the cache instead."""
+
+    pdb_name = TEST_FOLDER / "test.pdb"
+    afb_name = TEST_FOLDER / "test.afb"
+    lines = [
+        "ATOM      1  N   MET A   1       1.000   2.000   3.000  1.00 10.00           N  ",
+        "HETATM    2  O   HOH B   2       4.000   5.000   6.000  0.50 20.00           O1-",
+    ]
+
+    with open(pdb_name, "w") as file:
+        file.write("\n".join(lines))
+
+    try:
+        read(pdb_name).collect().write(afb_name)
+        assert read(afb_name).to_list() == PDBFormat.read_file(pdb_name)
+    finally:
+        for name in (pdb_name, afb_name):
+            if os.path.exists(name):
+                os.remove(name)
+
+
+def test_afb_rejects_other_files():
+
+    """Files without the .afb header aren't read."""
+
+    filename = TEST_FOLDER / "test.afb"
+
+    with open(filename, "wb") as file:
+        file.write(b"ATOM      1  N   MET A   1")
+
+    try:
+        with pytest.raises(ValueError):
+            AFBFormat.read_file(filename)
+    finally:
+        os.remove(filename)
@@ -0,0 +1,94 @@
+import os
+import pathlib
+
+import pytest
+
+from atomflow.atom import Atom
+from atomflow.components import *
+from atomflow.formats import ArchiveFormat, ArchiveIndex
+from atomflow.iterator import read
+
+TEST_FOLDER = pathlib.Path("tests/test_formats")
+
+
+def structure(entry_id: str, count: int) -> list[Atom]:
+    return [Atom(StructureComponent(entry_id), IndexComponent(i), NameComponent("CA"), ChainComponent("A"),
+                 CoordXComponent(i / 2)) for i in range(1, count + 1)]
+
+
+def test_archive_entries():
+
+    """Entries can be written, appended and read back by ID, with the last entry under an ID taking
+    precedence."""
+
+    filename = TEST_FOLDER / "test.afa"
+    index_name = str(filename) + ArchiveIndex.suffix
+
+    try:
+        ArchiveFormat.to_file(structure("1abc", 3) + structure("2def", 2), filename)
+        with ArchiveFormat.writer(filename, append=True) as writer:
+            writer.write(structure("3ghi", 1))
+            writer.add("1abc", structure("ignored", 4))
+
+        assert [len(t) for t in ArchiveFormat.read_records(filename, ["2def", "3ghi"])] == [2, 1]
+        assert list(ArchiveIndex.for_file(filename).entries) == ["2def", "3ghi", "1abc"]
+
+        atoms = read(filename, records=["1abc"]).to_list()
+        assert atoms == structure("1abc", 4)
+
+        groups = list(read(filename).group_by("structure"))
+        assert [(group[0].structure, len(group)) for group in groups] == [("2def", 2), ("3ghi", 1), ("1abc", 4)]
+
+        with pytest.raises(ValueError):
+            ArchiveFormat.read_records(filename, ["4jkl"])
+    finally:
+        for name in (filename, index_name):
+            if os.path.exists(name):
+                os.remove(name)
+
+
+def test_archive_append_failure():
+
+    """An aborted append leaves the archive as it was."""
+
+    filename = TEST_FOLDER / "test.afa"
+    index_name = str(filename) + ArchiveIndex.suffix
+
+    try:
+        ArchiveFormat.to_file(structure("1abc", 2), filename)
+        size = os.path.getsize(filename)
+
+        with pytest.raises(ValueError):
+            with ArchiveFormat.writer(filename, append=True) as writer:
+                writer.write(structure("2def", 2))
+                writer.write([Atom(IndexComponent(1))])
+
+        assert os.path.getsize(filename) == size
+        assert list(ArchiveIndex.build(filename).entries) == ["1abc"]
+    finally:
+        for name in (filename, index_name):
+            if os.path.exists(name):
+                os.remove(name)
+
+
+def test_archive_unsaved_index():
+
+    """Entries are still read where the index can't be saved beside the archive."""
+
+    filename = TEST_FOLDER / "test_unsaved.afa"
+    index_name = str(filename) + ArchiveIndex.suffix
+
+    try:
+        ArchiveFormat.to_file(structure("1abc", 3) + structure("2def", 2), filename)
+        # A folder in the way of the index, as a read-only folder would be
+        if os.path.exists(index_name):
+            os.remove(index_name)
+        os.mkdir(index_name)
+
+        assert [len(t) for t in ArchiveFormat.read_records(filename, ["2def"])] == [2]
+        assert len(read(filename).to_list()) == 5
+        assert os.listdir(index_name) == []
+    finally:
+        os.remove(filename)
+        if os.path.isdir(index_name):
+            os.rmdir(index_name)
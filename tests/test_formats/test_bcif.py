@@ -0,0 +1,91 @@
+import os
+import pathlib
+
+import pytest
+
+from atomflow.atom import Atom
+from atomflow.components import *
+from atomflow.formats import BinaryCIFFormat, CIFFormat
+from atomflow.formats.bcif import _decode, _pack, _unpack
+
+TEST_FOLDER = pathlib.Path("tests/test_formats")
+
+
+@pytest.fixture
+def test_atoms() -> list[Atom]:
+
+    return [
+        Atom(SectionComponent("ATOM"), IndexComponent(1), ElementComponent("N"), NameComponent("N"),
+             ResidueComponent("MET"), ChainComponent("A"), ResIndexComponent(1), CoordXComponent(1.5),
+             CoordYComponent(-2.25), CoordZComponent(3), OccupancyComponent(1), TemperatureFactorComponent(10.5)),
+        Atom(SectionComponent("ATOM"), IndexComponent(2), ElementComponent("C"), NameComponent("CA"),
+             ResidueComponent("MET"), ChainComponent("A"), ResIndexComponent(1), CoordXComponent(-150.125),
+             CoordYComponent(200), CoordZComponent(0.001), OccupancyComponent(0.5), TemperatureFactorComponent(99.99)),
+        Atom(SectionComponent("HETATM"), IndexComponent(300), ElementComponent("O"), NameComponent("O"),
+             ResidueComponent("HOH"), ChainComponent("B"), CoordXComponent(0), CoordYComponent(0),
+             CoordZComponent(0), OccupancyComponent(1), TemperatureFactorComponent(0), FormalChargeComponent(-1)),
+    ]
+
+
+@pytest.mark.parametrize("suffix", [".bcif", ".bcif.gz"])
+def test_bcif_round_trip(test_atoms, suffix):
+
+    """Atoms written to BinaryCIF are read back as the same atoms as from text CIF, missing values included."""
+
+    bcif_name = TEST_FOLDER / f"test{suffix}"
+    cif_name = TEST_FOLDER / "test.cif"
+
+    try:
+        BinaryCIFFormat.to_file(test_atoms, bcif_name)
+        CIFFormat.to_file(test_atoms, cif_name)
+        atoms = BinaryCIFFormat.read_file(bcif_name)
+        assert atoms == CIFFormat.read_file(cif_name)
+    finally:
+        for name in (bcif_name, cif_name):
+            if os.path.exists(name):
+                os.remove(name)
+
+    assert atoms == test_atoms
+    assert not atoms[2].implements("resindex") and not atoms[0].implements("fcharge")
+
+
+def test_msgpack_round_trip():
+
+    """Every size class of each MessagePack type survives encoding and decoding."""
+
+    obj = {
+        "ints": [0, 127, 128, 65536, 2 ** 40, -1, -32, -33, -40000, -2 ** 40],
+        "floats": [0.5, -1e300],
+        "strings": ["", "a" * 31, "b" * 32, "c" * 300, "d" * 70000, "é"],
+        "bytes": [b"", b"x" * 300, b"y" * 70000],
+        "arrays": [list(range(15)), list(range(16)), list(range(70000))],
+        "maps": [{str(i): i for i in range(15)}, {str(i): i for i in range(16)}],
+        "other": [None, True, False],
+    }
+
+    assert _unpack(_pack(obj)) == obj
+    # Fixed-size types are packed into as few bytes as possible
+    assert _pack([1, "a"]) == b"\x92\x01\xa1a"
+
+
+def test_decode_encodings():
+
+    """Columns encoded as by other BinaryCIF writers are decoded, applying encodings from last to first."""
+
+    # 10 values in steps of 0.5 from 1.0, stored as uint8 step numbers
+    quantized = [{"kind": "IntervalQuantization", "min": 1.0, "max": 5.5, "numSteps": 10, "srcType": 33},
+                 {"kind": "ByteArray", "type": 4}]
+    assert list(_decode(bytes([0, 3, 9]), quantized)) == [1.0, 2.5, 5.5]
+
+    # Values beyond the int8 range are split across several packed values
+    packed = [{"kind": "IntegerPacking", "byteCount": 1, "isUnsigned": False, "srcSize": 3},
+              {"kind": "ByteArray", "type": 1}]
+    assert list(_decode(bytes([127, 73, 5, 128, 128, 0x100 - 4]), packed)) == [200, 5, -260]
+
+    # Indices of -1 mark missing strings
+    strings = [{"kind": "StringArray", "dataEncoding": [{"kind": "ByteArray", "type": 1}], "stringData": "ALAGLY",
+                "offsetEncoding": [{"kind": "ByteArray", "type": 4}], "offsets": bytes([0, 3, 6])}]
+    assert _decode(bytes([1, 0xff, 0]), strings) == ["GLY", None, "ALA"]
+
+    with pytest.raises(ValueError):
+        _decode(b"", [{"kind": "Zstandard"}])
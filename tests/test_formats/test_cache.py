@@ -0,0 +1,107 @@
+import os
+import pathlib
+import shutil
+
+from atomflow.formats import ParseCache, PDBFormat
+from atomflow.iterator import read
+
+TEST_FOLDER = pathlib.Path("tests/test_formats")
+
+LINES = [
+    "ATOM      1  N   MET A   1       1.000   2.000   3.000  1.00 10.00           N  ",
+    "ATOM      2  CA  MET A   1       2.000   3.000   4.000  1.00 10.00           C  ",
+    "ATOM      3  N   GLY B   1       4.000   5.000   6.000  1.00 20.00           N  ",
+]
+
+
+def write_pdb(path: pathlib.Path, lines: list[str]) -> None:
+    with open(path, "w") as file:
+        file.write("\n".join(lines))
+
+
+def test_cache_hits_and_changes():
+
+    """Files are parsed once, then served from memory until they change."""
+
+    filename = TEST_FOLDER / "test.pdb"
+    write_pdb(filename, LINES)
+    cache = ParseCache()
+
+    try:
+        first = cache.read(filename)
+        assert cache.read(filename) is first
+        assert first == PDBFormat.read_file(filename)
+
+        write_pdb(filename, LINES[:2])
+        assert len(cache.read(filename)) == 2
+    finally:
+        os.remove(filename)
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 1)
+    assert 0 < stats["nbytes"] == cache.nbytes
+
+
+def test_cache_evicts_least_recent():
+
+    """Tables beyond the byte budget push out those used longest ago."""
+
+    names = [TEST_FOLDER / f"test_{i}.pdb" for i in range(3)]
+    for name in names:
+        write_pdb(name, LINES)
+
+    try:
+        size = PDBFormat.read_file(names[0]).nbytes
+        cache = ParseCache(max_bytes=2 * size)
+        first, second, third = names
+        cache.read(first)
+        cache.read(second)
+        cache.read(first)
+        cache.read(third)  # Evicts second
+        cache.read(first)
+        cache.read(second)
+    finally:
+        for name in names:
+            os.remove(name)
+
+    assert cache.stats()["evictions"] == 2
+    assert (cache.hits, cache.misses) == (2, 4)
+    assert cache.nbytes <= cache.max_bytes
+
+
+def test_cache_on_disk():
+
+    """Parsed tables saved to a folder are loaded by other caches instead of parsing the file again."""
+
+    filename = TEST_FOLDER / "test.pdb"
+    folder = TEST_FOLDER / "cache"
+    write_pdb(filename, LINES)
+
+    try:
+        expected = ParseCache(folder=folder).read(filename)
+        cache = ParseCache(folder=folder)
+        assert cache.read(filename) == expected
+        assert (cache.disk_hits, cache.misses) == (1, 0)
+        assert [p.suffix for p in folder.iterdir()] == [".afb"]
+    finally:
+        os.remove(filename)
+        shutil.rmtree(folder)
+
+
+def test_cache_by_content():
+
+    """Keyed by content, copies of a file share an entry."""
+
+    names = [TEST_FOLDER / "test_a.pdb", TEST_FOLDER / "test_b.pdb"]
+    for name in names:
+        write_pdb(name, LINES)
+    cache = ParseCache(by_content=True)
+
+    try:
+        assert cache.read(names[0]) is cache.read(names[1])
+        assert [a.resname for a in read(names[1], cache=cache, chains=["B"]).to_list()] == ["GLY"]
+    finally:
+        for name in names:
+            os.remove(name)
+
+    assert (cache.hits, cache.misses) == (2, 1)
@@ -7,6 +7,7 @@ import pytest
 from atomflow.atom import Atom
 from atomflow.components import *
 from atomflow.formats import CIFFormat
+from atomflow.formats.cif import CIFIndex
 
 TEST_FOLDER = pathlib.Path("tests/test_formats")
 DATA_FOLDER = pathlib.Path("tests/data/cif")
@@ -143,6 +144,37 @@ def test_extract_data_tables():
                               "description": ["red and bouncy", "soft and sticky"]}}}
 
 
+def test_extract_data_quoted_values():
+
+    """Quote marks inside values don't end them, unless followed by whitespace."""
+
+    file_name = TEST_FOLDER / "test.cif"
+
+    text = "\n".join([
+        "data_",
+        "#",
+        "loop_",
+        "_info.name",
+        "_info.description",
+        "\"O5'\" 'a  \"quoted\" word'",
+        "'N'-methyl' 3'-end",
+        "#"
+    ])
+
+    with open(file_name, "w") as file:
+        file.write(text)
+
+    try:
+        data = CIFFormat._extract_data(file_name)
+    finally:
+        os.remove(file_name)
+
+    assert data == {"data_":
+                        {"_info":
+                             {"name": ["O5'", "N'-methyl"],
+                              "description": ['a  "quoted" word', "3'-end"]}}}
+
+
 def test_extract_data_selection():
 
     """If provided, only named data categories are extracted."""
@@ -174,6 +206,60 @@ def test_extract_data_selection():
     assert data == {"data_": {"_type": {"name": "A"}}}
 
 
+def test_read_blocks():
+
+    """Categories are found through an index of the file, which can be saved beside it and is only reused
+    while the file is unchanged."""
+
+    file_name = TEST_FOLDER / "test.cif"
+    index_name = str(file_name) + CIFIndex.suffix
+
+    text = "\n".join([
+        "data_A",
+        "#",
+        "_info.item      1",
+        "_info.text",
+        ";The quick brown",
+        " fox",
+        ";",
+        "#",
+        "loop_",
+        "_type.name",
+        "_type.count",
+        "X 1",
+        "Y 2",
+        "#",
+        "_info.cost      10",
+        "data_B",
+        "_type.name      Z",
+    ])
+
+    with open(file_name, "w") as file:
+        file.write(text)
+
+    try:
+        blocks = CIFFormat.read_blocks(file_name, cache_index=True)
+        assert list(blocks) == ["data_A", "data_B"]
+        assert list(blocks["data_A"]) == ["_info", "_type"]
+        assert blocks["data_A"]["_info"] == {"item": "1", "text": "The quick brown fox", "cost": "10"}
+        assert blocks["data_A"]["_type"] == {"name": ["X", "Y"], "count": ["1", "2"]}
+        assert blocks["data_B"]["_type"] == {"name": "Z"}
+        assert CIFFormat._extract_data(file_name, categories=("_type",)) == {
+            "data_A": {"_type": {"name": ["X", "Y"], "count": ["1", "2"]}},
+            "data_B": {"_type": {"name": "Z"}},
+        }
+
+        assert CIFIndex.load(file_name).blocks == CIFIndex.build(file_name).blocks
+        with open(file_name, "a") as file:
+            file.write("\n_type.count     3")
+        assert CIFIndex.load(file_name) is None
+
+    finally:
+        os.remove(file_name)
+        if os.path.exists(index_name):
+            os.remove(index_name)
+
+
 def test_extract_data_table_failures():
 
     # Read fails if there's a mismatch between the number of declared fields and the number of data items
@@ -345,6 +431,45 @@ def test_read_multi_dataset():
                     "data_B": {"_type": {"name": "X"}}}
 
 
+def test_read_iter():
+
+    """The atom site table of each dataset is read in batches, and other categories are skipped."""
+
+    file_name = TEST_FOLDER / "test.cif"
+
+    text = "\n".join([
+        "data_A",
+        "#",
+        "_info.item      1",
+        "loop_",
+        "_atom_site.id",
+        "_atom_site.label_atom_id",
+        "1 N",
+        "2 CA",
+        "3 C",
+        "#",
+        "data_B",
+        "loop_",
+        "_atom_site.id",
+        "_atom_site.type_symbol",
+        "4 O",
+        "#"
+    ])
+
+    with open(file_name, "w") as file:
+        file.write(text)
+
+    try:
+        batches = list(CIFFormat.read_iter(file_name, batch_size=2))
+    finally:
+        os.remove(file_name)
+
+    assert [len(batch) for batch in batches] == [2, 1, 1]
+    assert [atom.index for batch in batches for atom in batch] == [1, 2, 3, 4]
+    assert batches[1][0].name == "C"
+    assert batches[2][0].element == "O"
+
+
 def test_write_multi_dataset():
 
     file_name = TEST_FOLDER / "test.cif"
@@ -455,6 +580,50 @@ def test_dict_from_atom(example_atom):
 
     assert CIFFormat._atoms_to_dict([example_atom]) == data
 
+def test_writer_batches(example_atom):
+
+    """Atoms written in several batches are read back as a single table."""
+
+    file_name = TEST_FOLDER / "test.cif"
+
+    try:
+        with CIFFormat.writer(file_name) as writer:
+            writer.write([example_atom])
+            writer.write([example_atom, example_atom])
+        data = CIFFormat._extract_data(file_name)
+        atoms = CIFFormat.read_file(file_name)
+    finally:
+        os.remove(file_name)
+
+    assert list(data) == ["data_test"]
+    assert data["data_test"]["_atom_site"]["id"] == ["1", "1", "1"]
+    assert atoms == [example_atom] * 3
+
+def test_writer_append(example_atom):
+
+    """Atoms appended to a file go into a block of their own, which readers of blocks by name keep apart."""
+
+    file_name = TEST_FOLDER / "test.cif"
+
+    try:
+        CIFFormat.to_file([example_atom, example_atom], file_name)
+        for _ in range(2):
+            with CIFFormat.writer(file_name, append=True) as writer:
+                writer.write([example_atom])
+        data = CIFFormat._extract_data(file_name)
+        # Blocks are only read as they're looked at
+        blocks = {header: len(block["_atom_site"]["id"]) for header, block in CIFFormat.read_blocks(file_name).items()}
+        index = CIFIndex.build(file_name)
+        atoms = CIFFormat.read_file(file_name)
+    finally:
+        os.remove(file_name)
+
+    assert list(data) == list(blocks) == list(index.blocks) == ["data_test", "data_test_2", "data_test_3"]
+    assert [len(block["_atom_site"]["id"]) for block in data.values()] == [2, 1, 1]
+    assert list(blocks.values()) == [2, 1, 1]
+    assert atoms == [example_atom] * 4
+
+
 def test_full_atom_read_write(sample_size=10):
 
     """Read and write, to atoms and back to file, are consistent."""
@@ -492,4 +661,33 @@ def test_full_atom_read_write(sample_size=10):
 
     if other_errors:
         filename, error = other_errors.pop()
-        print(f"There were {len(other_errors)} other errors. First ({filename}):\n{str(error)}")
\ No newline at end of file
+        print(f"There were {len(other_errors)} other errors. First ({filename}):\n{str(error)}")
+
+@pytest.mark.parametrize("split_row", [False, True])
+def test_read_parallel(split_row):
+
+    """Parsing split between workers gives the same atoms as reading serially, even if a row runs
+    across lines, in which case the file is read serially."""
+
+    filename = TEST_FOLDER / "test.cif"
+
+    def block(header, count):
+        rows = [f"ATOM {i} C CA GLY A {i} {i}.000 2.000 3.000" for i in range(1, count + 1)]
+        if split_row:
+            rows[count // 2] = rows[count // 2].replace(" GLY", "\nGLY")
+        return [f"data_{header}", "#", "_entry.id " + header, "#", "loop_",
+                *(f"_atom_site.{f}" for f in ("group_PDB", "id", "type_symbol", "label_atom_id", "label_comp_id",
+                                               "label_asym_id", "label_seq_id", "Cartn_x", "Cartn_y", "Cartn_z")),
+                *rows, "#"]
+
+    with open(filename, "w") as file:
+        file.write("\n".join(block("ONE", 9) + block("TWO", 5)) + "\n")
+
+    try:
+        expected = CIFFormat.read_file(filename)
+        atoms = CIFFormat.read_parallel(filename, workers=4)
+    finally:
+        os.remove(filename)
+
+    assert len(expected) == 14
+    assert atoms == expected
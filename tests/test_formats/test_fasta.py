@@ -6,7 +6,8 @@ import pytest
 
 from atomflow.atom import Atom
 from atomflow.components import *
-from atomflow.formats import FastaFormat
+from atomflow.formats import FastaFormat, FastaIndex
+from atomflow.iterator import read
 
 DATA_FOLDER = pathlib.Path("tests/data/fasta")
 
@@ -77,6 +78,99 @@ def test_rna_fasta_into_atoms():
     assert atoms[0] == target_atom
 
 
+def test_read_records_in_order():
+
+    """Records are read in file order, each with the next chain ID, and can be read in batches."""
+
+    fasta = ">first\nMK\nV\n>second\nACGT\n>third\nW\n"
+    filename = "test.fasta"
+
+    with open(filename, "w") as file:
+        file.write(fasta)
+
+    try:
+        atoms = FastaFormat.read_file(filename)
+        batches = list(FastaFormat.read_iter(filename, batch_size=2))
+    finally:
+        os.remove(filename)
+
+    assert [(a.chain, a.resindex, a.resname) for a in atoms] == [
+        ("A", 1, "MET"), ("A", 2, "LYS"), ("A", 3, "VAL"),
+        ("B", 1, "DA"), ("B", 2, "DC"), ("B", 3, "DG"), ("B", 4, "DT"),
+        ("C", 1, "TRP"),
+    ]
+    assert [len(batch) for batch in batches] == [3, 4, 1]
+
+
+def test_read_indexed_records():
+
+    """Records and ranges of residues can be read by name through a faidx-style index."""
+
+    fasta = ">first desc\nMKVL\nMKVL\nMK\n>second\nACGTACGTAC\n>third\nWWWW\nWW\n"
+    filename = "test.fasta"
+    index_name = filename + FastaIndex.suffix
+
+    with open(filename, "w") as file:
+        file.write(fasta)
+
+    try:
+        FastaFormat.read_records(filename, [])
+        with open(index_name) as file:
+            assert file.read() == "first\t10\t12\t4\t5\nsecond\t10\t33\t10\t11\nthird\t6\t51\t4\t5\n"
+
+        third, first = FastaFormat.read_records(filename, ["third", "first:3-9"])
+        assert [(a.chain, a.resindex, a.resname) for a in third] == [("C", i, "TRP") for i in range(1, 7)]
+        assert [a.resindex for a in first] == list(range(3, 10))
+        assert "".join(AA_RES_TO_SYM[a.resname] for a in first) == "VLMKVLM"
+
+        atoms = read(filename, records=["second:9-"]).to_list()
+        assert [(a.chain, a.resindex, a.resname) for a in atoms] == [("B", 9, "DA"), ("B", 10, "DC")]
+
+        with pytest.raises(ValueError):
+            FastaFormat.read_records(filename, ["fourth"])
+    finally:
+        os.remove(filename)
+        if os.path.exists(index_name):
+            os.remove(index_name)
+
+
+def test_read_records_unsaved_index():
+
+    """Records are still read by name where the index can't be saved beside the file."""
+
+    filename = "test_unsaved.fasta"
+    index_name = filename + FastaIndex.suffix
+
+    with open(filename, "w") as file:
+        file.write(">first\nMKVL\n>second\nWWWW\n")
+    # A folder in the way of the index, as a read-only folder would be
+    os.mkdir(index_name)
+
+    try:
+        atoms = read(filename, records=["second:2-3"]).to_list()
+        assert [(a.resindex, a.resname) for a in atoms] == [(2, "TRP"), (3, "TRP")]
+        assert os.listdir(index_name) == []
+    finally:
+        os.remove(filename)
+        os.rmdir(index_name)
+
+
+def test_reject_uneven_lines():
+
+    """Records with lines of different lengths can't be indexed."""
+
+    filename = "test.fasta"
+
+    with open(filename, "w") as file:
+        file.write(">uneven\nMK\nMKV\n")
+
+    try:
+        with pytest.raises(ValueError):
+            FastaIndex.build(filename)
+    finally:
+        os.remove(filename)
+
+
 def test_reject_unparseable_sequence():
 
     """Sequences with ambiguous mixtures of residue codes should be rejected."""
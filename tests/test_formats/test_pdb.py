@@ -1,3 +1,4 @@
+import gzip
 import os
 import pathlib
 import random
@@ -7,6 +8,8 @@ import pytest
 from atomflow.atom import Atom
 from atomflow.components import *
 from atomflow.formats import *
+from atomflow.formats.pdb import PDBIndex
+from atomflow.iterator import read
 
 TEST_FOLDER = pathlib.Path("tests/test_formats")
 PDB_STRUCTURES_FOLDER = pathlib.Path("tests/data/pdb")
@@ -45,6 +48,50 @@ def test_pdb_line_read(test_atom):
     assert file_atom == [test_atom]
 
 
+def test_pdb_read_iter(test_atom):
+
+    """Files can be read incrementally in batches, giving the same atoms as reading the whole file."""
+
+    filename = TEST_FOLDER / "test.pdb"
+    lines = [f"ATOM  {i: >5}  N   MET A   1       1.000   1.000   1.000  1.00 10.00           N  \n"
+             for i in range(1, 6)]
+
+    with open(filename, "w") as file:
+        file.writelines(lines)
+
+    try:
+        batches = list(PDBFormat.read_iter(filename, batch_size=2))
+        atoms = PDBFormat.read_file(filename)
+    finally:
+        os.remove(filename)
+
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert [atom for batch in batches for atom in batch] == list(atoms)
+    assert atoms[0] == test_atom
+
+
+def test_pdb_record_widths(test_atom):
+
+    """Records are read the same whether they're padded to 80 characters or not, and whatever
+    their line endings. Other records are skipped."""
+
+    filename = TEST_FOLDER / "test.pdb"
+    line = "ATOM      1  N   MET A   1       1.000   1.000   1.000  1.00 10.00           N"
+    text = f"HEADER    TEST\r\n{line}\r\n{line}  \nTER\n{line.rstrip(' N')}"
+
+    with open(filename, "w", newline="") as file:
+        file.write(text)
+
+    try:
+        atoms = PDBFormat.read_file(filename)
+    finally:
+        os.remove(filename)
+
+    assert len(atoms) == 3
+    assert atoms[0] == atoms[1] == test_atom
+    assert not atoms[2].implements("element")
+
+
 def test_pdb_line_write(test_atom):
 
     filename = TEST_FOLDER / "test.pdb"
@@ -118,3 +165,203 @@ def test_pdb_rwr(sample_size=10):
     if other_errors:
         filename, error = other_errors.pop()
         print(f"There were {len(other_errors)} other errors. First ({filename}):\n{str(error)}")
+
+
+def test_pdb_writer(test_atom):
+
+    """Atoms written over several calls give the same file as writing them at once, and can be
+    appended to an existing file."""
+
+    filename = TEST_FOLDER / "test.pdb"
+    line = "ATOM      1  N   MET A   1       1.000   1.000   1.000  1.00 10.00           N  "
+
+    try:
+        with PDBFormat.writer(filename) as writer:
+            writer.write([test_atom])
+            writer.write([test_atom, test_atom])
+        with PDBFormat.writer(filename, append=True) as writer:
+            writer.write([test_atom])
+        with open(filename) as file:
+            text = file.read()
+    finally:
+        os.remove(filename)
+
+    assert text == "\n".join([line] * 4)
+
+
+def test_pdb_writer_failure(test_atom):
+
+    """A file left incomplete by an error is removed."""
+
+    filename = TEST_FOLDER / "test.pdb"
+    bad_atom = Atom(IndexComponent(2), NameComponent("N"))
+
+    with pytest.raises(ValueError):
+        with PDBFormat.writer(filename) as writer:
+            writer.write([test_atom])
+            writer.write([bad_atom])
+
+    assert not os.path.exists(filename)
+
+
+def test_pdb_read_selection():
+
+    """Atoms can be read by chain and model, through an index of the file, which can be saved beside it."""
+
+    filename = TEST_FOLDER / "test.pdb"
+    index_name = str(filename) + PDBIndex.suffix
+
+    def line(serial, chain, resindex):
+        return f"ATOM  {serial: >5}  N   MET {chain}{resindex: >4}       1.000   1.000   1.000  1.00 10.00           N  \n"
+
+    lines = ["MODEL        1\n", line(1, "A", 1), line(2, "A", 1), line(3, "B", 2), "ENDMDL\n",
+             "MODEL        2\n", line(4, "A", 1), line(5, "B", 2), line(6, "B", 3), "ENDMDL\n"]
+
+    with open(filename, "w") as file:
+        file.writelines(lines)
+
+    try:
+        def indices(**selection):
+            return [atom.index for batch in PDBFormat.read_selection(filename, **selection) for atom in batch]
+
+        assert indices(chains=["A"]) == [1, 2, 4]
+        assert PDBIndex.load(filename).runs == PDBIndex.build(filename).runs
+        assert indices(models=[2]) == [4, 5, 6]
+        assert indices(chains=["B"], models=[2]) == [5, 6]
+        assert indices(chains=["C"]) == []
+        assert [atom.index for atom in read(filename, chains=["B"]).to_list()] == [3, 5, 6]
+    finally:
+        os.remove(filename)
+        if os.path.exists(index_name):
+            os.remove(index_name)
+
+
+def test_pdb_read_selection_unsaved_index():
+
+    """Atoms are still read by chain where the index can't be saved beside the file."""
+
+    filename = TEST_FOLDER / "test_unsaved.pdb"
+    index_name = str(filename) + PDBIndex.suffix
+
+    with open(filename, "w") as file:
+        file.write("ATOM      1  N   MET A   1       1.000   1.000   1.000  1.00 10.00           N  \n"
+                   "ATOM      2  N   GLU B   2       1.000   1.000   1.000  1.00 10.00           N  \n")
+    # A folder in the way of the index, as a read-only folder would be
+    os.mkdir(index_name)
+
+    try:
+        assert [atom.index for atom in read(filename, chains=["B"]).to_list()] == [2]
+        assert os.listdir(index_name) == []
+        assert [name for name in os.listdir(TEST_FOLDER) if name.endswith(".tmp")] == []
+    finally:
+        os.remove(filename)
+        os.rmdir(index_name)
+
+
+def test_pdb_models():
+
+    """Models of an ensemble are read as batches of their own, and written back between MODEL records."""
+
+    filename = TEST_FOLDER / "test.pdb"
+    copy_name = TEST_FOLDER / "test_copy.pdb"
+
+    def line(serial, resindex):
+        return f"ATOM  {serial: >5}  N   MET A{resindex: >4}       1.000   1.000   1.000  1.00 10.00           N  \n"
+
+    lines = ["MODEL        1\n", line(1, 1), line(2, 2), line(3, 3), "ENDMDL\n",
+             "MODEL        2\n", line(1, 1), line(2, 2), line(3, 3), "ENDMDL\n"]
+
+    with open(filename, "w") as file:
+        file.writelines(lines)
+
+    try:
+        batches = list(PDBFormat.read_iter(filename, batch_size=2))
+        assert [[atom.model for atom in batch] for batch in batches] == [[1, 1], [1], [2, 2], [2]]
+
+        frames = list(PDBFormat.read_models(filename))
+        assert [len(frame) for frame in frames] == [3, 3]
+        assert [atom.index for atom in frames[1]] == [1, 2, 3]
+
+        groups = list(read(filename).group_by("model"))
+        assert [[atom.model for atom in group] for group in groups] == [[1, 1, 1], [2, 2, 2]]
+
+        PDBFormat.to_file(PDBFormat.read_file(filename), copy_name)
+        with open(copy_name) as file:
+            written = file.read().splitlines()
+        assert [ln for ln in written if not ln.startswith("ATOM")] == ["MODEL        1", "ENDMDL", "MODEL        2", "ENDMDL"]
+        assert PDBFormat.read_file(copy_name) == PDBFormat.read_file(filename)
+    finally:
+        for name in (filename, copy_name):
+            if os.path.exists(name):
+                os.remove(name)
+
+
+def test_pdb_single_model():
+
+    """Atoms of a file without MODEL records have no model, but are grouped and selected as model 1."""
+
+    filename = TEST_FOLDER / "test_single.pdb"
+
+    with open(filename, "w") as file:
+        file.write("ATOM      1  N   MET A   1       1.000   1.000   1.000  1.00 10.00           N  \n"
+                   "ATOM      2  N   GLU B   2       1.000   1.000   1.000  1.00 10.00           N  \n")
+
+    try:
+        for engine in ("atom", "vectorized"):
+            groups = list(read(filename, engine=engine).group_by("model"))
+            assert [[atom.index for atom in group] for group in groups] == [[1, 2]]
+            assert [atom.index for atom in read(filename, engine=engine, models=[1]).to_list()] == [1, 2]
+        assert not PDBFormat.read_file(filename)[0].implements(ModelAspect)
+    finally:
+        os.remove(filename)
+        if os.path.exists(str(filename) + PDBIndex.suffix):
+            os.remove(str(filename) + PDBIndex.suffix)
+
+
+def test_pdb_compressed(test_atom):
+
+    """Gzipped files can be written, appended to, and read, including by chain."""
+
+    filename = TEST_FOLDER / "test.pdb.gz"
+    other = Atom(IndexComponent(2), NameComponent("N"), ResidueComponent("MET"), ChainComponent("B"),
+                 ResIndexComponent(1), CoordXComponent(1), CoordYComponent(1), CoordZComponent(1),
+                 ElementComponent("N"))
+
+    try:
+        PDBFormat.to_file([test_atom], filename)
+        with PDBFormat.writer(filename, append=True) as writer:
+            writer.write([other])
+
+        with gzip.open(filename, "rt") as file:
+            assert len(file.read().splitlines()) == 2
+        assert [atom.chain for atom in PDBFormat.read_file(filename)] == ["A", "B"]
+        assert [atom.index for atom in read(filename, chains=["B"]).to_list()] == [2]
+    finally:
+        os.remove(filename)
+
+
+@pytest.mark.parametrize("workers", [2, 5])
+def test_pdb_read_parallel(workers):
+
+    """Parsing split between workers gives the same atoms, in the same order and models, as reading serially."""
+
+    filename = TEST_FOLDER / "test.pdb"
+
+    def line(serial, chain, resindex):
+        return f"ATOM  {serial: >5}  CA  GLY {chain}{resindex: >4}       1.000   2.000  {serial: >6.3f}  1.00 10.00           C  \n"
+
+    lines = ["HEADER    TEST\n"]
+    for model in (1, 2, 3):
+        lines += [f"MODEL        {model}\n", *(line(i, "AB"[i % 2], i) for i in range(1, 8)), "ENDMDL\n"]
+
+    with open(filename, "w") as file:
+        file.writelines(lines)
+
+    try:
+        expected = PDBFormat.read_file(filename)
+        atoms = PDBFormat.read_parallel(filename, workers=workers)
+    finally:
+        os.remove(filename)
+
+    assert atoms == expected
+    assert [atom.model for atom in atoms] == [1] * 7 + [2] * 7 + [3] * 7
@@ -0,0 +1,44 @@
+import os
+import pathlib
+
+import pytest
+
+TEST_FOLDER = pathlib.Path("./tests/test_iterator")
+
+PDB_LINES = [
+    "ATOM      1  N   MET A   1       1.000   1.000   1.000  1.00  0.00           N  ",
+    "ATOM      2  CA  MET A   1       2.000   2.000   2.000  1.00  0.00           C  ",
+    "ATOM      3  N   GLU B   2       3.000   3.000   3.000  1.00  0.00           N  ",
+    "HETATM    4  O   HOH B   3       4.000   4.000   4.000  1.00  0.00           O  ",
+]
+
+
+@pytest.fixture
+def make_pdb():
+
+    """Writes PDB files of the given lines into the test folder, and removes them (and any index saved beside them)
+    after the test."""
+
+    names = []
+
+    def make(name="test.pdb", lines=PDB_LINES):
+        filename = TEST_FOLDER / name
+        with open(filename, "w") as file:
+            file.write("\n".join(lines))
+        names.append(filename)
+        return filename
+
+    yield make
+
+    for filename in names:
+        for path in (filename, str(filename) + ".idx"):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+@pytest.fixture
+def pdb_file(request, make_pdb):
+
+    """A small PDB file, of PDB_LINES unless other lines are given by indirect parametrisation."""
+
+    return make_pdb(lines=getattr(request, "param", PDB_LINES))
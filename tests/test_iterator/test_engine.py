@@ -0,0 +1,32 @@
+import pytest
+
+from atomflow.iterator import read
+
+
+@pytest.mark.parametrize("pdb_file", [[
+    "ATOM      1  N   MET A   1       1.000   1.000   1.000  1.00  0.00           N  ",
+    "ATOM      2  CA  MET A   1       2.000   2.000   2.000  1.00  0.00           C  ",
+    "ATOM      3  N   GLU B   2       3.000   3.000   3.000  1.00  0.00           N  ",
+    "HETATM    4  O   HOH B   3       4.000   4.000   4.000  1.00  0.00           O  ",
+    "ATOM      5  N   HIS A   3       5.000   5.000   5.000  1.00  0.00           N  ",
+]], indirect=True)
+def test_vectorized_engine(pdb_file):
+
+    """The vectorized engine gives the same groups as the per-atom engine."""
+
+    chains = [
+        lambda it: it,
+        lambda it: it.filter("resname", none_of=["HOH"]).collect().sort("chain").group_by("chain"),
+        lambda it: it.group_by("resindex").filter("name", any_of=["CA"]),
+        lambda it: it.collect().sort("x").group_by("resname"),
+        lambda it: it.filter("chain", any_of=["C"]).group_by("chain"),
+    ]
+
+    for chain in chains:
+        assert list(chain(read(pdb_file))) == list(chain(read(pdb_file, engine="vectorized")))
+
+
+def test_unknown_engine(pdb_file):
+
+    with pytest.raises(ValueError):
+        read(pdb_file, engine="gpu")
@@ -5,7 +5,8 @@ import pytest
 
 from atomflow.components import *
 from atomflow.atom import Atom
-from atomflow.iterator import AtomIterator
+from atomflow.formats import Format
+from atomflow.iterator import AtomIterator, read
 
 TEST_FOLDER = pathlib.Path("tests/test_iterator")
 
@@ -64,4 +65,45 @@ def test_filter_chain(example_atoms):
     true_text = f"ATOM      2  N   GLU B   2       2.000   2.000   2.000  1.00  0.00           N  \n"\
                 f"ATOM      3  O   HIS B   3       3.000   3.000   3.000  1.00  0.00           O  "
 
-    assert true_text == file_text
\ No newline at end of file
+    assert true_text == file_text
+
+@pytest.mark.parametrize("suffix", ["pdb", "cif"])
+def test_filter_pushed_to_reader(example_atoms, suffix):
+
+    """Filters straight after read() are checked by the reader as well, giving the same atoms as without,
+    and leaving the iterator they were chained from, and other branches from it, as they were."""
+
+    filename = TEST_FOLDER / f"test.{suffix}"
+    fmt = Format.get_format(f".{suffix}")
+    fmt.to_file(example_atoms, filename)
+
+    try:
+        everything = fmt.read_file(filename)
+        unpushed = AtomIterator.from_list(everything).filter("chain", any_of=["B"]).filter("resname", none_of=["HIS"])
+        expected = unpushed.to_list()
+        assert [a.name for a in expected] == ["N"]
+
+        for engine in ("atom", "vectorized"):
+            # The reader leaves out atoms, so fewer come from the file
+            a_iter = read(filename, engine=engine).instrument()
+            filtered = a_iter.filter("chain", any_of=["B"]).filter("resname", none_of=["HIS"])
+            assert filtered.to_list() == expected
+            assert [stage["atoms_out"] for stage in filtered.profile()] == [1, 1, 1, 1]
+
+            # Branches not read from don't change what the others give
+            a_iter = read(filename, engine=engine)
+            a_iter.filter("chain", any_of=["A"])
+            chain_b = a_iter.filter("chain", any_of=["B"])
+            assert chain_b.to_list() == [a for a in everything if a.chain == "B"]
+            a_iter = read(filename, engine=engine)
+            a_iter.filter("chain", any_of=["A"])
+            assert a_iter.to_list() == list(everything)
+
+            # Not pushed once reading has started
+            a_iter = read(filename, engine=engine).instrument()
+            next(a_iter)
+            remaining = a_iter.filter("chain", any_of=["A"])
+            assert remaining.to_list() == []
+            assert remaining.profile()[0]["atoms_out"] == 3
+    finally:
+        os.remove(filename)
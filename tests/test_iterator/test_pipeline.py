@@ -0,0 +1,84 @@
+import os
+import pathlib
+import pickle
+
+import pytest
+
+from atomflow.formats import PDBFormat
+from atomflow.iterator import Pipeline, read, read_many
+from tests.test_iterator.conftest import PDB_LINES
+
+TEST_FOLDER = pathlib.Path("./tests/test_iterator")
+
+
+@pytest.fixture
+def pdb_files(make_pdb):
+
+    return [make_pdb("test_1.pdb"), make_pdb("test_2.pdb", PDB_LINES[1:])]
+
+
+def test_pipeline_matches_iterator(pdb_files):
+
+    """A pipeline gives the same groups as the same chain of stages on an iterator, with either engine."""
+
+    pipeline = Pipeline().group_by("chain").filter("resname", none_of=["HOH"]).sort("name")
+    expected = list(read(pdb_files[0]).group_by("chain").filter("resname", none_of=["HOH"]).sort("name"))
+
+    assert list(pipeline.run(pdb_files[0])) == expected
+    assert list(pipeline.run(pdb_files[0], engine="vectorized")) == expected
+    assert list(pipeline.run(PDBFormat.read_file(pdb_files[0]))) == expected
+
+    # Reused without change, and unchanged by pickling
+    copy = pickle.loads(pickle.dumps(pipeline))
+    assert repr(copy) == repr(pipeline)
+    assert list(copy.run(read(pdb_files[0]))) == expected
+
+
+def test_pipeline_write_over_files(pdb_files):
+
+    """A pipeline ending in write() can be run over many files, naming outputs after each."""
+
+    pipeline = Pipeline().filter("resname", any_of=["MET", "GLU"]).collect().write(TEST_FOLDER / "{source}_out.pdb")
+    outputs = [str(TEST_FOLDER / "test_1_out.pdb"), str(TEST_FOLDER / "test_2_out.pdb")]
+
+    try:
+        results, errors = read_many(pdb_files, pipeline, workers=2)
+        assert errors == []
+        assert [result for _, result in results] == [([outputs[0]], []), ([outputs[1]], [])]
+        assert [len(PDBFormat.read_file(name)) for name in outputs] == [3, 2]
+    finally:
+        for name in outputs:
+            if os.path.exists(name):
+                os.remove(name)
+
+
+def test_pipeline_failures():
+
+    """Bad stages are caught as the pipeline is built, rather than when it's run."""
+
+    with pytest.raises(ValueError):
+        Pipeline().filter("name")
+    with pytest.raises(ValueError):
+        Pipeline().write("out.pdb").sort("name")
+    with pytest.raises(ValueError):
+        Pipeline().write("{source}.pdb").run([])
+
+
+def test_pipeline_reads_only_aspects_used(pdb_files):
+
+    """A pipeline ending in write() only reads the aspects its stages and the output format look at."""
+
+    pipeline = Pipeline().filter("resname", none_of=["HOH"]).collect().write(TEST_FOLDER / "{source}.fasta")
+    output = TEST_FOLDER / "test_1.fasta"
+
+    assert pipeline.aspects() == {"chain", "resname", "resindex"}
+    assert Pipeline().filter("chain", any_of=["A"]).aspects() is None
+    assert Pipeline().collect().write("out.afb").aspects() is None
+
+    try:
+        for options in ({}, {"aspects": None}, {"engine": "vectorized"}):
+            assert pipeline.run(pdb_files[0], **options) == ([str(output)], [])
+            with open(output) as file:
+                assert file.read() == ">test_1_A\nM\n>test_1_B\nE\n"
+    finally:
+        os.remove(output)
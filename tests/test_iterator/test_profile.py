@@ -0,0 +1,67 @@
+import os
+import pathlib
+
+import pytest
+
+from atomflow.iterator import read
+from atomflow.iterator.iterator import FilterIterator, GroupIterator
+
+TEST_FOLDER = pathlib.Path("./tests/test_iterator")
+
+
+@pytest.mark.parametrize("engine", ["atom", "vectorized"])
+def test_profile_counts(pdb_file, engine):
+
+    """Each stage reports the atoms and groups it took in and handed out, and the hook hears of each as it ends."""
+
+    reports = []
+    a_iter = (read(pdb_file, engine=engine).instrument(reports.append)
+              .group_by("chain").filter("resname", none_of=["HOH"]).sort("name"))
+    assert len(a_iter.to_list()) == 2
+
+    profile = a_iter.profile()
+    counts = [(s["atoms_in"], s["atoms_out"], s["groups_in"], s["groups_out"]) for s in profile[2:]]
+    assert counts == [(4, 4, 4, 2), (4, 2, 2, 1), (2, 2, 1, 1)]
+    # Grouping atom by atom holds back the atoms of the next group to find where each group ends
+    assert [s["peak_buffer"] for s in profile[2:]] == ([4, 2, 2] if engine == "atom" else [2, 2, 2])
+    assert all(s["seconds"] >= 0 for s in profile)
+    assert [s["stage"] for s in reports] == [s["stage"] for s in profile]
+
+
+def test_profile_write(pdb_file):
+
+    """Writing is reported as a stage of its own, with time spent collecting kept to the collect stage."""
+
+    out = TEST_FOLDER / "test_out.pdb"
+    a_iter = read(pdb_file).instrument().filter("resname", any_of=["MET"]).collect()
+
+    try:
+        a_iter.write(out)
+    finally:
+        os.remove(out)
+
+    profile = a_iter.profile()
+    assert [s["stage"] for s in profile] == ["source", "GroupIterator", "FilterIterator", "AtomIterator", "write"]
+    assert (profile[-1]["atoms_out"], profile[-1]["groups_out"]) == (2, 1)
+    assert all(s["seconds"] >= 0 for s in profile)
+
+
+def test_profile_leaves_stages_as_they_are(pdb_file):
+
+    """Instrumenting a chain doesn't change the classes of its stages, and instrumenting it again does nothing."""
+
+    a_iter = read(pdb_file).instrument()
+    assert a_iter.instrument() is a_iter
+    grouped = a_iter.group_by("chain").filter("resname", none_of=["HOH"])
+    assert grouped.instrument() is grouped
+    assert len(grouped.to_list()) == 2
+
+    assert [s["stage"] for s in grouped.profile()] == ["source", "GroupIterator", "GroupIterator", "FilterIterator"]
+    assert GroupIterator.__subclasses__() == [] and FilterIterator.__subclasses__() == []
+    assert type(read(pdb_file).group_by("chain")) is GroupIterator
+
+
+def test_profile_not_instrumented(pdb_file):
+
+    with pytest.raises(ValueError):
+        read(pdb_file).group_by("chain").profile()
@@ -3,7 +3,8 @@ import pathlib
 
 from atomflow.components import *
 from atomflow.atom import Atom
-from atomflow.iterator import read
+from atomflow.formats import CIFFormat, PDBFormat
+from atomflow.iterator import read, read_many
 
 TEST_FOLDER = pathlib.Path("./tests/test_iterator")
 
@@ -59,4 +60,83 @@ def test_read_pdb():
                  ResIndexComponent(3), CoordXComponent(3.0), CoordYComponent(3.0), CoordZComponent(3.0),
                  OccupancyComponent(1), TemperatureFactorComponent(0), NameComponent("O"), SectionComponent("ATOM"))
 
-    assert list(a_iter) == [(atom_m,), (atom_e,), (atom_h,)]
\ No newline at end of file
+    assert list(a_iter) == [(atom_m,), (atom_e,), (atom_h,)]
+
+def test_read_chains():
+
+    """Formats without an index of their files can still be read by chain and model, with atoms that have
+    no model taken to be in model 1."""
+
+    test_filename = TEST_FOLDER / "test.fasta"
+
+    with open(test_filename, "w") as file:
+        file.write(">test\nMV\n")
+
+    try:
+        chain_a = read(test_filename, chains=["A"]).to_list()
+        chain_b = read(test_filename, chains=["B"]).to_list()
+        model_1 = read(test_filename, models=[1]).to_list()
+        model_2 = read(test_filename, models=[2]).to_list()
+    finally:
+        os.remove(test_filename)
+
+    assert chain_a == [Atom(ResidueComponent("MET"), ResIndexComponent(1), ChainComponent("A")),
+                       Atom(ResidueComponent("VAL"), ResIndexComponent(2), ChainComponent("A"))]
+    assert chain_b == []
+    assert model_1 == chain_a and model_2 == []
+
+
+def test_read_aspects():
+
+    """Readers given the aspects that will be used can skip decoding the others."""
+
+    pdb_filename = TEST_FOLDER / "test.pdb"
+    cif_filename = TEST_FOLDER / "test.cif"
+
+    with open(pdb_filename, "w") as file:
+        file.write("ATOM      1  C   MET A   1       1.000   1.000   1.000  1.00  0.00           C  \n"
+                   "ATOM      2  N   GLU B   2       2.000   2.000   2.000  1.00  0.00           N  ")
+
+    try:
+        CIFFormat.to_file(PDBFormat.read_file(pdb_filename), cif_filename)
+        for filename in (pdb_filename, cif_filename):
+            for engine in ("atom", "vectorized"):
+                atoms = read(filename, engine=engine, aspects=["resname", "chain"]).to_list()
+                assert [(a.resname, a.chain) for a in atoms] == [("MET", "A"), ("GLU", "B")]
+                assert not any(a.implements("x") or a.implements("index") for a in atoms)
+                selected = read(filename, engine=engine, chains=["B"], aspects=["resname"]).to_list()
+                assert [a.resname for a in selected] == ["GLU"]
+    finally:
+        os.remove(pdb_filename)
+        os.remove(cif_filename)
+        # Reading a PDB file by chain saves an index of it
+        os.remove(str(pdb_filename) + ".idx")
+
+
+def chain_ids(atoms) -> list[str]:
+    return [group[0].chain for group in atoms.group_by("chain")]
+
+
+def test_read_many():
+
+    """read_many runs a pipeline over each file in worker processes, in order or as they finish, collecting errors."""
+
+    names = [TEST_FOLDER / f"test_{i}.fasta" for i in range(5)]
+    for i, name in enumerate(names):
+        with open(name, "w") as file:
+            file.write("".join(f">seq{j}\nMVD\n" for j in range(i + 1)))
+    missing = TEST_FOLDER / "missing.fasta"
+
+    try:
+        results, errors = read_many([*names, missing], chain_ids, workers=2, chunksize=2)
+        unordered, _ = read_many(names, chain_ids, workers=2, chunksize=1, ordered=False)
+        tables, _ = read_many(names[:1], workers=1)
+    finally:
+        for name in names:
+            os.remove(name)
+
+    assert [path for path, _ in results] == list(map(str, names))
+    assert [chains for _, chains in results] == [list("ABCDE"[:i + 1]) for i in range(5)]
+    assert sorted(unordered) == results
+    assert isinstance(errors[0], FileNotFoundError) and str(missing) in errors[0].__notes__[0]
+    assert len(tables[0][1]) == 3
@@ -0,0 +1,69 @@
+import gc
+import os
+import pathlib
+import warnings
+
+import pytest
+
+from atomflow.formats import Format, PDBFormat
+from atomflow.iterator import Pipeline, read
+
+TEST_FOLDER = pathlib.Path("./tests/test_iterator")
+
+
+@pytest.mark.parametrize("engine", ["atom", "vectorized"])
+def test_take_first_groups(pdb_file, engine):
+
+    """Only the first n groups are given, and the file is closed as soon as they have been."""
+
+    a_iter = read(pdb_file, engine=engine)
+    taken = a_iter.group_by("chain").take(2)
+    assert [[a.index for a in group] for group in taken] == [[1, 2], [3, 4]]
+    assert a_iter._reader._batches.file.closed
+
+    assert [a.index for a in read(pdb_file, engine=engine).head(3).to_list()] == [1, 2, 3]
+    assert [a.index for a in read(pdb_file, engine=engine).take(10).to_list()] == [1, 2, 3, 4]
+    assert list(read(pdb_file, engine=engine).take(0)) == []
+
+    with pytest.raises(ValueError):
+        read(pdb_file, engine=engine).take(-1)
+
+
+@pytest.mark.parametrize("suffix", [".pdb", ".cif", ".fasta"])
+def test_take_none_closes_file(pdb_file, suffix):
+
+    """Taking no groups closes the file straight away, without it being read at all."""
+
+    filename = pdb_file.with_name("test_take" + suffix)
+    atoms = [atom for atom in PDBFormat.read_file(pdb_file) if atom.resname != "HOH"]
+    Format.get_format(suffix).to_file(atoms, filename)
+
+    try:
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            for engine in ("atom", "vectorized"):
+                assert list(read(filename, engine=engine).take(0)) == []
+            gc.collect()
+    finally:
+        os.remove(filename)
+
+    assert not [w for w in caught if issubclass(w.category, ResourceWarning)]
+
+
+def test_take_in_pipeline(pdb_file):
+
+    """Pipelines can take the first groups too, e.g. to write only the first chain of each file."""
+
+    pipeline = Pipeline().group_by("chain").take(1).write(TEST_FOLDER / "{source}.fasta")
+    output = TEST_FOLDER / "test.fasta"
+
+    assert pipeline.aspects() == {"chain", "resname", "resindex"}
+    try:
+        assert pipeline.run(pdb_file) == ([str(output)], [])
+        with open(output) as file:
+            assert file.read() == ">test_A\nM\n"
+    finally:
+        os.remove(output)
+
+    with pytest.raises(ValueError):
+        Pipeline().take(1.5)
@@ -1,3 +1,6 @@
+import bz2
+import gzip
+import lzma
 import os
 import pathlib
 
@@ -5,7 +8,7 @@ import pytest
 
 from atomflow.components import *
 from atomflow.atom import Atom
-from atomflow.iterator import AtomIterator
+from atomflow.iterator import AtomIterator, read
 
 TEST_FOLDER = pathlib.Path("./tests/test_iterator")
 
@@ -147,4 +150,24 @@ def test_outpath_formating(example_atoms):
     for filename in filenames:
         os.remove(filename)
 
-    assert filenames == [str(TEST_FOLDER / "test_chainA_res1.pdb"), str(TEST_FOLDER / "test_chainB_res2.pdb")]
\ No newline at end of file
+    assert filenames == [str(TEST_FOLDER / "test_chainA_res1.pdb"), str(TEST_FOLDER / "test_chainB_res2.pdb")]
+
+@pytest.mark.parametrize("suffix, module", [(".gz", gzip), (".bz2", bz2), (".xz", lzma)])
+def test_write_compressed(example_atoms, suffix, module):
+
+    """Files with a compression suffix are written compressed, in the format of the suffix before it,
+    and read back through the same compression."""
+
+    filenames, _ = AtomIterator\
+        .from_list(example_atoms)\
+        .group_by("chain")\
+        .write(TEST_FOLDER / f"test.cif{suffix}")
+
+    try:
+        assert filenames == [str(TEST_FOLDER / f"test.cif{suffix}"), str(TEST_FOLDER / f"test_1.cif{suffix}")]
+        with module.open(filenames[1], "rt") as file:
+            assert file.read().startswith("data_test_1\n#\nloop_\n")
+        assert [atom.index for atom in read(filenames[1]).to_list()] == [2, 3]
+    finally:
+        for filename in filenames:
+            os.remove(filename)
@@ -0,0 +1,75 @@
+import os
+import pathlib
+import tracemalloc
+
+import pytest
+
+from atomflow.atom import Atom
+from atomflow.components import *
+from atomflow.formats import PDBFormat
+from atomflow.iterator import AtomIterator, read
+from atomflow.memory import MemoryTrace
+
+TEST_FOLDER = pathlib.Path("tests")
+
+
+@pytest.fixture
+def example_atoms() -> list[Atom]:
+
+    return [Atom(IndexComponent(i), NameComponent("CA"), ResidueComponent("GLY"), ChainComponent("AB"[i % 2]),
+                 ResIndexComponent(i), CoordXComponent(i), CoordYComponent(0), CoordZComponent(0),
+                 ElementComponent("C"))
+            for i in range(1, 2001)]
+
+
+def test_format_calls_traced(example_atoms):
+
+    """Read and write calls of formats are each recorded under their name while a trace is active."""
+
+    filename = TEST_FOLDER / "test.pdb"
+
+    try:
+        with MemoryTrace() as trace:
+            PDBFormat.to_file(example_atoms, filename)
+            atoms = PDBFormat.read_file(filename)
+            assert len(read(filename).to_list()) == 2000
+        PDBFormat.read_file(filename)
+    finally:
+        os.remove(filename)
+
+    calls = {r["name"]: r["calls"] for r in trace.report()}
+    assert calls["PDBFormat.to_file"] == calls["PDBFormat.read_file"] == 1
+    assert calls["PDBFormat.read_iter"] > 1  # Once to open the file, then once per batch
+    assert all(r["peak_bytes"] >= 0 for r in trace.report())
+    assert trace.peak_bytes - trace.start_bytes >= atoms.nbytes
+
+    summary = trace.summary(limit=3)
+    assert "PDBFormat.read_file" in summary and "Most memory held" in summary
+    assert len(trace.top(3)) == 3
+    assert not tracemalloc.is_tracing()
+
+
+def test_stage_memory(example_atoms):
+
+    """Stages of a chain instrumented with memory=True are charged with the memory they hold on to."""
+
+    with MemoryTrace() as trace:
+        a_iter = AtomIterator.from_list(example_atoms).instrument(memory=True).group_by("chain").collect()
+        assert len(a_iter.to_list()) == 2000
+
+    profile = a_iter.profile()
+    names = [r["name"] for r in trace.report()]
+    assert names == ["stage 0: source", "stage 1: GroupIterator", "stage 2: GroupIterator", "stage 3: AtomIterator"]
+    # Collecting holds a reference to every atom at once
+    assert profile[-1]["peak_bytes"] >= 8 * 2000
+    assert [r["peak_bytes"] for r in trace.report()] == [s["peak_bytes"] for s in profile]
+
+
+def test_trace_failures(example_atoms):
+
+    with pytest.raises(ValueError):
+        AtomIterator.from_list(example_atoms).instrument(memory=True)
+    with MemoryTrace():
+        with pytest.raises(ValueError):
+            with MemoryTrace():
+                pass
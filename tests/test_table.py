@@ -0,0 +1,80 @@
+import pytest
+
+from atomflow.atom import Atom
+from atomflow.components import *
+from atomflow.table import AtomTable, TableAtom
+
+
+@pytest.fixture
+def example_atoms() -> list[Atom]:
+
+    atom1 = Atom(IndexComponent(1), ElementComponent("C"), AAResidueComponent("MET"), ChainComponent("A"),
+                 CoordXComponent(1.0), NameComponent("C"))
+
+    atom2 = Atom(IndexComponent(2), ElementComponent("N"), ResidueComponent("HOH"), ChainComponent("B"),
+                 CoordXComponent(2.0))
+
+    return [atom1, atom2]
+
+
+def test_table_from_atoms(example_atoms):
+
+    """Tables built from atoms hold the same data, including for components which implement multiple aspects."""
+
+    table = AtomTable.from_atoms(example_atoms)
+
+    assert table == example_atoms
+    assert table[0].res_olc == "M"
+    assert table[0].polymer == "protein"
+    assert not table[1].implements("name")
+    assert f"{table[0]:l}" == f"{example_atoms[0]:l}"
+
+
+def test_table_columns(example_atoms):
+
+    """Numeric aspects are held in typed arrays, and string aspects are dictionary-encoded."""
+
+    table = AtomTable.from_atoms(example_atoms)
+
+    assert table.columns["x"].data.typecode == "d"
+    assert table.columns["index"].data.typecode == "q"
+    assert table.columns["chain"].values == [None, "A", "B"]
+
+
+def test_overlapping_fields():
+
+    """Where several fields map to the same aspect, the last non-missing value is used."""
+
+    data = {"label_asym_id": ["A", "B"], "auth_asym_id": ["C", "?"]}
+    cmp_map = {"label_asym_id": ChainComponent, "auth_asym_id": ChainComponent}
+
+    table = AtomTable.from_columns(data, cmp_map, missing={"?"})
+
+    assert [atom.chain for atom in table] == ["C", "B"]
+
+
+def test_concat_and_take(example_atoms):
+
+    """Tables can be joined, with columns missing from either table left empty, and rows can be selected."""
+
+    first = AtomTable.from_atoms(example_atoms[:1])
+    second = AtomTable.from_atoms(example_atoms[1:])
+
+    joined = AtomTable.concat([first, second])
+
+    assert joined == example_atoms
+    assert joined.take([1, 0]) == example_atoms[::-1]
+    assert joined[1:] == example_atoms[1:]
+
+
+def test_modified_view(example_atoms):
+
+    """Modifying a view doesn't alter the table it came from."""
+
+    table = AtomTable.from_atoms(example_atoms)
+    atom = table[1]
+    atom.add(NameComponent("O"))
+
+    assert isinstance(atom, TableAtom)
+    assert atom.name == "O"
+    assert not table[1].implements("name")